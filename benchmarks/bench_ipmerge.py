@@ -0,0 +1,87 @@
+"""Micro-benchmark for ipmerge merge engines.
+
+Compares lines/sec of ``merge_ip_ranges`` (adding every network to a netaddr
+``IPSet``, the reference implementation) against ``merge_ip_ranges_numpy``
+(merging integer intervals in NumPy arrays) on a synthetic blocklist of
+random IPv4 hosts and networks with some IPv6 networks, and checks that both
+produce the same CIDRs. The reference slows down quickly with the number of
+lines; ``--numpy-only`` times the NumPy engine alone on real blocklist sizes.
+
+Usage:
+    python benchmarks/bench_ipmerge.py [--count N] [--ipv6-ratio RATIO]
+        [--numpy-only]
+"""
+
+import argparse
+import ipaddress
+import random
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from chaos_box.cmd import ipmerge
+
+IPV4_PREFIXES = (32, 32, 32, 32, 31, 30, 29, 28, 24, 24, 22, 20, 16)
+IPV6_PREFIXES = (128, 128, 64, 64, 56, 48, 48, 32)
+
+
+def make_blocklist(path: Path, count: int, ipv6_ratio: float) -> None:
+    """Write ``count`` random CIDRs, clustered so that many of them merge."""
+    rng = random.Random(0)
+    with path.open("w") as f:
+        for _ in range(count):
+            if rng.random() < ipv6_ratio:
+                address = ipaddress.IPv6Address(0x2001 << 112 | rng.getrandbits(64))
+                prefixlen = rng.choice(IPV6_PREFIXES)
+            else:
+                address = ipaddress.IPv4Address(rng.getrandbits(28) << 4)
+                prefixlen = rng.choice(IPV4_PREFIXES)
+            f.write(f"{address}/{prefixlen}\n")
+
+
+def bench(label: str, count: int, run: Callable[[], list]) -> tuple[float, list]:
+    """Time ``run`` over ``count`` lines and print lines/sec."""
+    started = time.perf_counter()
+    cidrs = run()
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed
+    print(
+        f"{label:>8}: {count} lines in {elapsed:.2f}s, {rate:.0f} lines/sec, "
+        f"{len(cidrs)} CIDRs"
+    )
+    return rate, cidrs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=5_000)
+    parser.add_argument("--ipv6-ratio", type=float, default=0.1)
+    parser.add_argument("--numpy-only", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "blocklist.txt"
+        make_blocklist(path, args.count, args.ipv6_ratio)
+        files = [str(path)]
+
+        def netaddr_engine() -> list:
+            ipv4_set, ipv6_set = ipmerge.merge_ip_ranges(files)
+            return list(ipv4_set.iter_cidrs()) + list(ipv6_set.iter_cidrs())
+
+        def numpy_engine() -> list:
+            ipv4_cidrs, ipv6_cidrs = ipmerge.merge_ip_ranges_numpy(files)
+            return ipv4_cidrs + ipv6_cidrs
+
+        if args.numpy_only:
+            bench("numpy", args.count, numpy_engine)
+            return
+        before, expected = bench("netaddr", args.count, netaddr_engine)
+        after, cidrs = bench("numpy", args.count, numpy_engine)
+        print(f"speedup: {after / before:.2f}x")
+        if cidrs != expected:
+            raise SystemExit("engines disagree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Micro-benchmark for qrcode-split image generation.
+
+Compares images/sec of ``generate_qr_code`` with the per-worker state
+rebuilt for every chunk (font load, encoder construction and footer
+measurement, as before ``init_worker``) against the cached state.
+
+Then compares the output step alone: saving the rendered codes as 24-bit
+RGB PNGs (as before the 1-bit pipeline) against 1-bit PNGs at several
+compression settings and PBM, reporting images/sec and average file size.
+
+Usage:
+    python benchmarks/bench_qrcode_split.py [--count N] [--chunk-size BYTES]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from chaos_box.cmd import qrcode_split
+
+
+def bench(label: str, count: int, run: Callable[[int], None]) -> float:
+    """Time ``run`` for ``count`` images and print images/sec."""
+    started = time.perf_counter()
+    for index in range(1, count + 1):
+        run(index)
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed
+    print(f"{label:>8}: {count} images in {elapsed:.2f}s, {rate:.1f} images/sec")
+    return rate
+
+
+def bench_output(count: int, chunk_size: int, output_dir: Path) -> None:
+    """Time saving pre-rendered QR codes in each output format."""
+    qrcode_split.init_worker()
+    images = [
+        qrcode_split.render_qr_code(
+            os.urandom(chunk_size), i, count, "binary", "none", 0
+        )
+        for i in range(1, count + 1)
+    ]
+
+    variants: list[tuple[str, dict]] = [
+        ("rgb png", {}),
+        ("1-bit png", {"compress_level": 6}),
+        ("1-bit png -1", {"compress_level": 1}),
+        ("1-bit png -9 -O", {"compress_level": 9, "optimize": True}),
+        ("1-bit pbm", {"image_format": "pbm"}),
+    ]
+    baseline = None
+    for label, options in variants:
+        qrcode_split.init_worker(**options)
+        paths = [output_dir / f"out_{i}" for i in range(count)]
+        started = time.perf_counter()
+        for img, path in zip(images, paths):
+            if label == "rgb png":
+                img.convert("RGB").save(path, "PNG")
+            else:
+                qrcode_split.save_image(img, path)
+        elapsed = time.perf_counter() - started
+        size = sum(path.stat().st_size for path in paths) / count
+        baseline = baseline or size
+        print(
+            f"{label:>16}: {count / elapsed:7.1f} images/sec, "
+            f"{size / 1024:7.1f} KiB/image ({size / baseline:.2f}x of rgb png)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=1900)
+    args = parser.parse_args()
+
+    chunks = [os.urandom(args.chunk_size) for _ in range(args.count)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_dir = Path(tmp_dir)
+
+        def cold(index: int) -> None:
+            qrcode_split._worker_state.clear()
+            qrcode_split.generate_qr_code(
+                chunks[index - 1], index, args.count, output_dir, "cold"
+            )
+
+        def warm(index: int) -> None:
+            qrcode_split.generate_qr_code(
+                chunks[index - 1], index, args.count, output_dir, "warm"
+            )
+
+        qrcode_split.init_worker()
+        warm(1)  # Warm up imports and caches
+        before = bench("before", args.count, cold)
+        qrcode_split.init_worker()
+        after = bench("after", args.count, warm)
+        print(f"speedup: {after / before:.2f}x")
+
+        bench_output(args.count, args.chunk_size, output_dir)
+
+
+if __name__ == "__main__":
+    main()
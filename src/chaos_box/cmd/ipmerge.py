@@ -4,10 +4,16 @@
 
 import argparse
 import fileinput
+import socket
+from collections.abc import Iterable, Iterator
 
 import argcomplete
+import numpy as np
 from netaddr import IPNetwork, IPSet
 
+ENGINES = ("numpy", "netaddr")
+IP_BITS = {4: 32, 6: 128}
+
 
 def digit_str_zfill(digit_str: str, group: int) -> str:
     """Add leading zeros to groups of digits.
@@ -96,6 +102,187 @@ def merge_ip_ranges(ip_range_files: list[str]) -> tuple[IPSet, IPSet]:
     return ipv4_set, ipv6_set
 
 
+def parse_ip_range(ip_range: str) -> tuple[int, int, int]:
+    """Parse an address or CIDR into integers.
+
+    Plain dotted quad and colon-hex notation is parsed with ``inet_pton``;
+    anything else (netmask suffixes, partial addresses, ...) goes through
+    ``IPNetwork`` so both engines accept the same input.
+
+    Args:
+        ip_range: Address or CIDR, host bits may be set
+
+    Returns:
+        Tuple of (version, address, prefixlen)
+    """
+    addr, sep, prefix = ip_range.partition("/")
+    version = 6 if ":" in addr else 4
+    family = socket.AF_INET6 if version == 6 else socket.AF_INET
+    try:
+        value = int.from_bytes(socket.inet_pton(family, addr))
+        prefixlen = int(prefix) if sep else IP_BITS[version]
+        if 0 <= prefixlen <= IP_BITS[version]:
+            return version, value, prefixlen
+    except (OSError, ValueError):
+        pass
+    ip_network = IPNetwork(ip_range)
+    return ip_network.version, ip_network.value, ip_network.prefixlen
+
+
+def bit_length(values: np.ndarray) -> np.ndarray:
+    """Return the bit length of every element, like ``int.bit_length``.
+
+    Args:
+        values: uint64 array of values below 2**53, or object array of ints
+
+    Returns:
+        Array of bit lengths with the dtype of ``values``
+    """
+    if values.dtype == object:
+        return np.frompyfunc(int.bit_length, 1, 1)(values)
+    # Exact, as every value below 2**53 converts to float64 without rounding
+    return np.frexp(values.astype(np.float64))[1].astype(values.dtype)
+
+
+def network_intervals(
+    values: np.ndarray, host_bits: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Convert networks to inclusive (start, end) address intervals.
+
+    Args:
+        values: Network addresses, host bits may be set
+        host_bits: Number of host bits of every network, same dtype as values
+
+    Returns:
+        Tuple of (starts, ends) arrays
+    """
+    hostmasks = (np.ones_like(values) << host_bits) - 1
+    starts = values & ~hostmasks
+    return starts, starts | hostmasks
+
+
+def merge_intervals(
+    starts: np.ndarray, ends: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Merge overlapping and adjacent intervals.
+
+    Args:
+        starts: Interval starts
+        ends: Inclusive interval ends
+
+    Returns:
+        Tuple of (starts, ends) of the disjoint, sorted merged intervals
+    """
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    # Highest end seen so far; an interval starting past it + 1 opens a new run
+    run_ends = np.maximum.accumulate(ends[order])
+    breaks = np.flatnonzero(starts[1:] > run_ends[:-1] + 1) + 1
+    firsts = np.concatenate(([0], breaks))
+    lasts = np.concatenate((breaks - 1, [len(starts) - 1]))
+    return starts[firsts], run_ends[lasts]
+
+
+def interval_cidrs(
+    starts: np.ndarray, ends: np.ndarray, bits: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Split intervals into the fewest CIDR blocks.
+
+    Every round takes the largest block that is aligned at the start of each
+    interval and fits in it, so it takes at most ``bits`` rounds.
+
+    Args:
+        starts: Interval starts
+        ends: Inclusive interval ends
+        bits: Address width, 32 or 128
+
+    Returns:
+        Tuple of (addresses, prefixlens) sorted by address
+    """
+    addresses, prefixes = [starts[:0]], [starts[:0]]
+    while len(starts):
+        # Trailing zeros of the start, capped by the size of the interval
+        lowest_bits = starts & (~starts + 1)
+        aligned = np.where(starts == 0, bits, bit_length(lowest_bits) - 1)
+        host_bits = np.minimum(aligned, bit_length(ends - starts + 1) - 1)
+        addresses.append(starts)
+        prefixes.append(bits - host_bits)
+        starts = starts + (np.ones_like(starts) << host_bits)
+        remaining = starts <= ends
+        starts, ends = starts[remaining], ends[remaining]
+
+    addresses_array = np.concatenate(addresses)
+    order = np.argsort(addresses_array, kind="stable")
+    return addresses_array[order], np.concatenate(prefixes)[order]
+
+
+def merge_networks(
+    networks: Iterable[tuple[int, int]], version: int
+) -> Iterator[IPNetwork]:
+    """Merge networks of one IP version into the fewest CIDRs.
+
+    IPv4 addresses are held in a uint32 array and widened to uint64 for the
+    arithmetic, so a /0 block still fits; IPv6 addresses use object arrays
+    of Python ints.
+
+    Args:
+        networks: Pairs of (address, prefixlen)
+        version: IP version, 4 or 6
+
+    Yields:
+        Merged networks in address order
+    """
+    bits = IP_BITS[version]
+    pairs = list(networks)
+    if version == 4:
+        values = np.fromiter((v for v, _ in pairs), np.uint32, len(pairs))
+        values = values.astype(np.uint64)
+        dtype: type | np.dtype = np.uint64
+    else:
+        values = np.fromiter((v for v, _ in pairs), object, len(pairs))
+        dtype = object
+    host_bits = np.fromiter((bits - p for _, p in pairs), dtype, len(pairs))
+    del pairs
+
+    starts, ends = merge_intervals(*network_intervals(values, host_bits))
+    addresses, prefixes = interval_cidrs(starts, ends, bits)
+    for address, prefixlen in zip(addresses.tolist(), prefixes.tolist()):
+        yield IPNetwork((address, prefixlen), version=version)
+
+
+def merge_ip_ranges_numpy(
+    ip_range_files: list[str],
+) -> tuple[list[IPNetwork], list[IPNetwork]]:
+    """Merge IP ranges from input files as integer intervals.
+
+    Produces the same CIDRs as ``merge_ip_ranges``, without building an
+    ``IPSet`` one network at a time.
+
+    Args:
+        ip_range_files: List of files containing IP ranges
+
+    Returns:
+        Tuple of (IPv4 CIDRs, IPv6 CIDRs) in address order
+    """
+    networks: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+    try:
+        for ip_range in fileinput.input(files=ip_range_files):
+            ip_range = ip_range.strip()
+            if not ip_range:
+                continue
+            version, value, prefixlen = parse_ip_range(ip_range)
+            networks[version].append((value, prefixlen))
+    except KeyboardInterrupt:
+        print()
+
+    return (
+        list(merge_networks(networks.pop(4), 4)),
+        list(merge_networks(networks.pop(6), 6)),
+    )
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="merge IP ranges from files or standard input."
@@ -128,6 +315,13 @@ def parse_args() -> argparse.Namespace:
         default=False,
         help="output addresses prefixed with zero.",
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ENGINES,
+        default="numpy",
+        help="merge engine, netaddr is the slower reference (default: %(default)s)",
+    )
     parser.add_argument(
         "files",
         nargs="*",
@@ -143,15 +337,19 @@ def main() -> None:
     """Parse arguments and print merged/deduplicated IP ranges."""
     args = parse_args()
 
-    ipv4_set, ipv6_set = merge_ip_ranges(args.files)
+    if args.engine == "netaddr":
+        ipv4_set, ipv6_set = merge_ip_ranges(args.files)
+        ipv4_cidrs, ipv6_cidrs = ipv4_set.iter_cidrs(), ipv6_set.iter_cidrs()
+    else:
+        ipv4_cidrs, ipv6_cidrs = merge_ip_ranges_numpy(args.files)
     if args.ipv4:
-        merged_ranges = ipv4_set
+        merged_ranges = ipv4_cidrs
     elif args.ipv6:
-        merged_ranges = ipv6_set
+        merged_ranges = ipv6_cidrs
     else:
-        merged_ranges = ipv4_set.union(ipv6_set)
+        merged_ranges = ipv4_cidrs + ipv6_cidrs
 
-    for cidr in merged_ranges.iter_cidrs():
+    for cidr in merged_ranges:
         if args.binary:
             print(ip_network_to_binary(cidr))
         elif args.zfill:
@@ -0,0 +1,379 @@
+"""QR code frame format shared by qrcode-split and qrcode-merge.
+
+This module defines how chunks are framed, encoded into QR code payloads
+and described by the manifest, the GF(256) arithmetic of the parity
+frames, the image file names, and reading QR codes back from images.
+"""
+
+import base64
+import json
+import struct
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+from chaos_utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+# Images are 1-bit; PBM stores them raw, PNG deflates them
+IMAGE_FORMATS = ("png", "pbm")
+
+# Prefix of binary payloads. 0xFF never occurs in UTF-8 or Shift JIS text,
+# so decoders that guess the charset of byte mode data always fall back to
+# ISO-8859-1, which is reversible, instead of mangling the payload
+BINARY_MARKER = b"\xff"
+
+# Frame header: magic, format version, codec index in CODECS, file id,
+# chunk index, total chunks and the CRC32 of the header fields and data.
+# Payloads without the magic are chunks written before frames had headers
+FRAME_MAGIC = b"QF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct(">2sBBIIII")
+MANIFEST_NAME = "manifest.json"
+CODECS = ("none", "zlib", "lzma", "bz2")
+
+# Parity frames follow the data frames. Their data starts with the number of
+# groups, the group and row of the parity chunk and the size of the stream
+PARITY_HEADER = struct.Struct(">IIHQ")
+# Data and parity chunks of one Reed-Solomon group over GF(256)
+MAX_GROUP_SIZE = 255
+GF_POLYNOMIAL = 0x11D
+
+
+class Frame(NamedTuple):
+    """A chunk of the (possibly compressed) input and its metadata.
+
+    Legacy payloads without a header have no file id, index or total.
+    """
+
+    data: bytes
+    codec: str = "none"
+    file_id: int | None = None
+    index: int | None = None
+    total: int | None = None
+
+
+def pack_frame(frame: Frame) -> bytes:
+    """Serialize a frame with its header.
+
+    Args:
+        frame: Frame to serialize, with all fields set
+
+    Returns:
+        Header followed by the chunk data
+    """
+    fields = (
+        FRAME_MAGIC,
+        FRAME_VERSION,
+        CODECS.index(frame.codec),
+        frame.file_id,
+        frame.index,
+        frame.total,
+    )
+    crc = zlib.crc32(frame.data, zlib.crc32(FRAME_HEADER.pack(*fields, 0)))
+    return FRAME_HEADER.pack(*fields, crc) + frame.data
+
+
+def unpack_frame(raw: bytes) -> Frame:
+    """Parse and verify a frame serialized by :func:`pack_frame`.
+
+    Legacy payloads are raw file data and may start with the magic by
+    chance, so a payload whose header does not verify is returned as legacy
+    data too. A damaged framed chunk then carries no index and is rejected
+    by the manifest CRC32 when merging.
+
+    Args:
+        raw: Decoded QR code payload
+
+    Returns:
+        The parsed frame; legacy payloads without a valid header are
+        returned as uncompressed data
+    """
+    if not raw.startswith(FRAME_MAGIC) or len(raw) < FRAME_HEADER.size:
+        return Frame(raw)
+    *fields, crc = FRAME_HEADER.unpack_from(raw)
+    _, version, codec, file_id, index, total = fields
+    data = raw[FRAME_HEADER.size :]
+    if (
+        version != FRAME_VERSION
+        or codec >= len(CODECS)
+        or zlib.crc32(data, zlib.crc32(FRAME_HEADER.pack(*fields, 0))) != crc
+    ):
+        return Frame(raw)
+    return Frame(data, CODECS[codec], file_id, index, total)
+
+
+def encode_payload(chunk: bytes, payload: str) -> bytes | str:
+    """Encode a chunk as QR code data.
+
+    Args:
+        chunk: Binary data to encode
+        payload: Payload encoding, one of PAYLOAD_MODES
+
+    Returns:
+        Bytes for byte mode, or base64 text
+    """
+    if payload == "binary":
+        return BINARY_MARKER + chunk
+    return base64.b64encode(chunk).decode("utf-8")
+
+
+def decode_payload(data: bytes) -> bytes:
+    """Decode QR code data produced by :func:`encode_payload`.
+
+    Binary payloads are detected by their marker. Decoders either return
+    byte mode data as is or convert it from ISO-8859-1 to UTF-8; both forms
+    are accepted. Anything else is treated as base64 text.
+
+    Args:
+        data: Data as returned by the QR code decoder
+
+    Returns:
+        The original chunk
+
+    Raises:
+        ValueError: If the data is neither a binary nor a base64 payload
+    """
+    if data.startswith(BINARY_MARKER):
+        return data[len(BINARY_MARKER) :]
+    if data.startswith(BINARY_MARKER.decode("latin-1").encode("utf-8")):
+        return data.decode("utf-8").encode("latin-1")[len(BINARY_MARKER) :]
+    return base64.b64decode(data, validate=True)
+
+
+def write_manifest(output_dir: Path, manifest: dict) -> None:
+    """Write the manifest of a split file.
+
+    Args:
+        output_dir: Directory containing the QR code images
+        manifest: Manifest to write
+    """
+    with open(output_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+
+def load_manifest(directory: Path) -> dict | None:
+    """Load the manifest written by :func:`write_manifest`.
+
+    Args:
+        directory: Directory containing the QR code images
+
+    Returns:
+        The manifest, or None if there is none or it is unreadable
+    """
+    try:
+        with open(directory / MANIFEST_NAME, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as err:
+        logger.warning("Ignore unreadable manifest in %s: %s", directory, err)
+        return None
+
+
+def detect_qr_code(img: np.ndarray) -> bytes | None:
+    """Decode the QR code in a grayscale image array with OpenCV.
+
+    Args:
+        img: Grayscale image
+
+    Returns:
+        Raw decoded data, or None if no QR code was found
+    """
+    # The two detectors locate dense version 40 codes differently, and each
+    # misses some images the other decodes
+    for detector in (cv2.QRCodeDetector(), cv2.QRCodeDetectorAruco()):
+        data, _, _ = detector.detectAndDecodeBytes(img)
+        if data:
+            return data
+    return None
+
+
+def read_qr_code(img_path: Path) -> bytes | None:
+    """Decode the QR code in an image with OpenCV.
+
+    Args:
+        img_path: Path to the QR code image
+
+    Returns:
+        Raw decoded data, or None if the image is unreadable or no QR code
+        was found
+    """
+    img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    return detect_qr_code(img)
+
+
+def detect_qr_codes(img: np.ndarray) -> list[bytes]:
+    """Decode all QR codes in a grayscale image array with OpenCV.
+
+    Args:
+        img: Grayscale image
+
+    Returns:
+        Raw decoded data of every QR code found
+    """
+    found: dict[bytes, None] = {}
+    # The ArUco based detector finds dense codes on sheets far more reliably
+    for detector in (cv2.QRCodeDetectorAruco(), cv2.QRCodeDetector()):
+        ok, decoded, _, _ = detector.detectAndDecodeBytesMulti(img)
+        if ok:
+            found.update(dict.fromkeys(data for data in decoded if data))
+    return list(found)
+
+
+def read_qr_codes(img_path: Path) -> list[bytes]:
+    """Decode all QR codes in an image, such as a sheet, with OpenCV.
+
+    Args:
+        img_path: Path to the image
+
+    Returns:
+        Raw decoded data of every QR code found
+    """
+    img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return []
+    return detect_qr_codes(img)
+
+
+def _gf_tables() -> tuple[np.ndarray, np.ndarray]:
+    """Build the exponent and logarithm tables of GF(256).
+
+    Returns:
+        Tuple of (exp, log); exp is doubled so sums of two logs index it
+    """
+    exp = np.zeros(2 * MAX_GROUP_SIZE, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int64)
+    x = 1
+    for i in range(MAX_GROUP_SIZE):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= GF_POLYNOMIAL
+    exp[MAX_GROUP_SIZE:] = exp[:MAX_GROUP_SIZE]
+    return exp, log
+
+
+GF_EXP, GF_LOG = _gf_tables()
+
+
+def gf_inverse(a: int) -> int:
+    """Return the multiplicative inverse of a non-zero element of GF(256)."""
+    return int(GF_EXP[MAX_GROUP_SIZE - GF_LOG[a]])
+
+
+def gf_matmul(coefs: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Multiply a coefficient matrix by a matrix of data rows in GF(256).
+
+    Args:
+        coefs: Matrix of shape (m, k)
+        rows: Matrix of shape (k, n)
+
+    Returns:
+        Matrix of shape (m, n)
+    """
+    log_rows = GF_LOG[rows]
+    zero_rows = rows == 0
+    out = np.zeros((len(coefs), rows.shape[1]), dtype=np.uint8)
+    for i, coef_row in enumerate(coefs):
+        products = GF_EXP[log_rows + GF_LOG[coef_row][:, None]]
+        products[zero_rows | (coef_row == 0)[:, None]] = 0
+        out[i] = np.bitwise_xor.reduce(products, axis=0)
+    return out
+
+
+def gf_invert(matrix: np.ndarray) -> np.ndarray:
+    """Invert a square matrix in GF(256) by Gauss-Jordan elimination.
+
+    Args:
+        matrix: Invertible matrix of shape (m, m)
+
+    Returns:
+        The inverse matrix
+    """
+    m = len(matrix)
+    a = np.concatenate([matrix, np.eye(m, dtype=np.uint8)], axis=1)
+    for col in range(m):
+        pivot = col + int(np.flatnonzero(a[col:, col])[0])
+        a[[col, pivot]] = a[[pivot, col]]
+        scale = np.array([[gf_inverse(a[col, col])]], dtype=np.uint8)
+        a[col] = gf_matmul(scale, a[col : col + 1])[0]
+        factors = a[:, col : col + 1].copy()
+        factors[col] = 0
+        a ^= gf_matmul(factors, a[col : col + 1])
+    return a[:, m:]
+
+
+def cauchy_matrix(rows: int, cols: int) -> np.ndarray:
+    """Build the parity coefficients of a Reed-Solomon group.
+
+    Every square submatrix of a Cauchy matrix is invertible, so any lost
+    data chunks can be rebuilt from as many parity chunks.
+
+    Args:
+        rows: Number of parity chunks
+        cols: Number of data chunks, rows + cols must not exceed 255
+
+    Returns:
+        Matrix of shape (rows, cols) with entries 1 / ((255 - r) ^ c)
+    """
+    return np.array(
+        [
+            [gf_inverse((MAX_GROUP_SIZE - r) ^ c) for c in range(cols)]
+            for r in range(rows)
+        ],
+        dtype=np.uint8,
+    ).reshape(rows, cols)
+
+
+def qr_code_path(
+    output_dir: Path,
+    prefix: str,
+    index: int,
+    total_frames: int,
+    image_format: str = "png",
+) -> Path:
+    """Build the path of the QR code image of a chunk.
+
+    Args:
+        output_dir: Directory containing the QR code images
+        prefix: Prefix for the output filename
+        index: Index number of the chunk
+        total_frames: Total number of data and parity chunks, which sets the
+            index width
+        image_format: Image format, one of IMAGE_FORMATS
+
+    Returns:
+        Path to the QR code image
+    """
+    width = len(str(total_frames))
+    return output_dir / f"{prefix}_{index:0{width}d}.{image_format}"
+
+
+def sheet_path(
+    output_dir: Path,
+    prefix: str,
+    sheet: int,
+    total_sheets: int,
+    image_format: str = "png",
+) -> Path:
+    """Build the path of a sheet image.
+
+    Args:
+        output_dir: Directory containing the sheet images
+        prefix: Prefix for the output filename
+        sheet: Sheet number
+        total_sheets: Total number of sheets, which sets the number width
+        image_format: Image format, one of IMAGE_FORMATS
+
+    Returns:
+        Path to the sheet image
+    """
+    width = len(str(total_sheets))
+    return output_dir / f"{prefix}_sheet_{sheet:0{width}d}.{image_format}"
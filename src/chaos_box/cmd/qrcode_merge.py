@@ -2,45 +2,1031 @@
 
 This module provides functionality to decode a series of QR code images
 and merge their contents back into the original file, supporting parallel processing.
+Chunks are written to disk as they are decoded, so memory use does not grow
+with the file.
 """
 
 # PYTHON_ARGCOMPLETE_OK
 
 import argparse
-import base64
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import bz2
+import hashlib
+import json
+import lzma
+import math
+import os
+import sys
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
+from typing import NamedTuple
 
 import argcomplete
+import cv2
+import numpy as np
 from chaos_utils.logging import setup_logger
-from PIL import Image
-from pyzbar.pyzbar import decode
+
+from chaos_box.cmd.qrcode_common import (
+    IMAGE_FORMATS,
+    PARITY_HEADER,
+    Frame,
+    cauchy_matrix,
+    decode_payload,
+    detect_qr_code,
+    detect_qr_codes,
+    gf_invert,
+    gf_matmul,
+    load_manifest,
+    qr_code_path,
+    sheet_path,
+    unpack_frame,
+)
+
+try:
+    # pyzbar needs the zbar shared library, apt install libzbar0
+    from pyzbar.pyzbar import decode as zbar_decode
+except ImportError:
+    zbar_decode = None
 
 logger = setup_logger(__name__)
 
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+# Layout version of the OUTPUT.state file of incomplete merges
+STATE_VERSION = 1
+# Longest side images are scaled down to for the first, fastest attempt
+DECODE_MAX_SIDE = 2000
+# Quiet zone kept around a detected QR code when cropping, relative to its size
+ROI_MARGIN = 0.1
+# Image formats read with cv2.imread, scans and photos as well as the
+# IMAGE_FORMATS written by qrcode-split
+READ_FORMATS = (
+    *IMAGE_FORMATS,
+    "bmp",
+    "dib",
+    "jpg",
+    "jpeg",
+    "jpe",
+    "jp2",
+    "webp",
+    "tif",
+    "tiff",
+    "pgm",
+    "ppm",
+    "pnm",
+    "pxm",
+    "sr",
+    "ras",
+    "exr",
+    "hdr",
+    "pic",
+)
+# Video and animation formats read frame by frame with OpenCV
+VIDEO_FORMATS = ("gif", "mp4", "mkv", "mov", "avi", "webm")
+# Decoding stages in the order they are tried, see decode_qr_code
+DECODE_STAGES = ("zbar", "opencv", "roi")
+
+
+def make_decompressor(
+    codec: str,
+) -> "zlib._Decompress | lzma.LZMADecompressor | bz2.BZ2Decompressor":
+    """Create an incremental decompressor.
+
+    Args:
+        codec: Compression codec, one of CODECS except "none"
+
+    Returns:
+        Decompressor object with a decompress() method and an eof attribute
+    """
+    if codec == "zlib":
+        return zlib.decompressobj()
+    if codec == "lzma":
+        return lzma.LZMADecompressor()
+    return bz2.BZ2Decompressor()
+
+
+def iter_decompressed(chunks: Iterable[bytes], codec: str) -> Iterator[bytes]:
+    """Decompress the stream formed by consecutive chunks.
+
+    Args:
+        chunks: Chunk data in index order
+        codec: Compression codec the chunks were written with
+
+    Yields:
+        Decompressed data
+
+    Raises:
+        ValueError: If the compressed stream is truncated
+    """
+    if codec == "none":
+        yield from chunks
+        return
+    decompressor = make_decompressor(codec)
+    for chunk in chunks:
+        yield decompressor.decompress(chunk)
+    if not decompressor.eof:
+        raise ValueError(f"Truncated {codec} stream, some chunks may be missing")
+
+
+def is_parity(index: int, frame: Frame) -> bool:
+    """Tell whether a frame holds parity rather than file data."""
+    return frame.total is not None and index > frame.total
+
+
+def recover_frames(frames: dict[int, Frame], missing: list[int]) -> list[int]:
+    """Rebuild missing data chunks from the parity frames.
+
+    Args:
+        frames: Frames by index, updated in place with the rebuilt chunks
+        missing: Missing data chunk indices
+
+    Returns:
+        Indices that could not be rebuilt
+    """
+    parity: dict[int, dict[int, bytes]] = defaultdict(dict)
+    template = None
+    for index, frame in frames.items():
+        if is_parity(index, frame):
+            groups, group, row, size = PARITY_HEADER.unpack_from(frame.data)
+            parity[group][row] = frame.data[PARITY_HEADER.size :]
+            template = frame
+    if not missing or template is None:
+        return missing
+
+    total = template.total
+    chunk_size = len(template.data) - PARITY_HEADER.size
+    lost_by_group = defaultdict(list)
+    for index in missing:
+        lost_by_group[(index - 1) % groups].append(index)
+
+    unrecovered = []
+    for group, lost in lost_by_group.items():
+        rows = sorted(parity[group])[: len(lost)]
+        if len(rows) < len(lost):
+            unrecovered.extend(lost)
+            continue
+
+        members = list(range(group + 1, total + 1, groups))
+        lost_pos = [members.index(i) for i in lost]
+        known_pos = [j for j, i in enumerate(members) if i not in lost]
+        coefs = cauchy_matrix(rows[-1] + 1, len(members))[rows]
+
+        rhs = np.frombuffer(b"".join(parity[group][r] for r in rows), dtype=np.uint8)
+        rhs = rhs.reshape(len(rows), chunk_size)
+        if known_pos:
+            known = b"".join(
+                frames[members[j]].data.ljust(chunk_size, b"\0") for j in known_pos
+            )
+            known_rows = np.frombuffer(known, dtype=np.uint8)
+            rhs = rhs ^ gf_matmul(
+                coefs[:, known_pos], known_rows.reshape(len(known_pos), chunk_size)
+            )
+        solved = gf_matmul(gf_invert(coefs[:, lost_pos]), rhs)
+
+        for index, chunk in zip(lost, solved):
+            length = min(chunk_size, size - (index - 1) * chunk_size)
+            frames[index] = template._replace(
+                data=chunk[:length].tobytes(), index=index
+            )
+        logger.info("Rebuilt chunks %s from parity group %d", lost, group)
+    return sorted(unrecovered)
+
+
+def frame_digest(data: bytes) -> str:
+    """Hash the data of a frame to recognise it later.
+
+    Args:
+        data: Frame data
+
+    Returns:
+        Hex digest
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ChunkWriter:
+    """Write decoded frames into a stream file at their chunk offsets.
+
+    Data chunks are written at (index - 1) * chunk_size as soon as they are
+    decoded, in any order, so memory use does not grow with the file and
+    the chunks written so far survive an interruption. Parity records are
+    written to a temporary file the same way and only read back to rebuild
+    missing chunks.
+
+    Frames are checked against the manifest if there is one, otherwise
+    against the file id of the first frame with a header, and rejected and
+    duplicate frames are counted for the merge report. Without a manifest,
+    frames wait in memory until the chunk size is known, which takes at
+    most two frames even for legacy frames without a header.
+
+    With a parity file, the written frames can be described by
+    :meth:`snapshot` and taken over by a later writer with :meth:`restore`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        manifest: dict | None = None,
+        parity_path: Path | None = None,
+        resume: bool = False,
+    ) -> None:
+        """Create the stream file, truncating it unless resuming.
+
+        Args:
+            path: Path to write the chunk stream to
+            manifest: Manifest written by qrcode-split, if available
+            parity_path: Path to write the parity records to, None for a
+                temporary file
+            resume: Open existing stream and parity files to restore the
+                frames of an earlier run
+        """
+        self.path = path
+        self.fp = open(path, "r+b" if resume and path.exists() else "w+b")
+        if parity_path is None:
+            self.parity_fp = tempfile.TemporaryFile()
+        else:
+            mode = "r+b" if resume and parity_path.exists() else "w+b"
+            self.parity_fp = open(parity_path, mode)
+        self.file_id = int(manifest["file_id"], 16) if manifest else None
+        self.crcs = manifest["crc32"] if manifest else None
+        # Zero until known from the manifest or the frames
+        self.chunk_size = manifest["chunk_size"] if manifest else 0
+        self.total = manifest["total"] if manifest else 0
+        # Size of the chunk stream, known from the manifest of an uncompressed
+        # file or from the parity headers
+        self.size = manifest["size"] if manifest and manifest["codec"] == "none" else 0
+        self.codecs: set[str] = set()
+        self.decoded: set[int] = set()
+        self.written: set[int] = set()
+        self.digests: dict[int, str] = {}
+        self.parity: dict[int, Frame] = {}
+        self.pending: list[tuple[int, Frame]] = []
+        self.duplicates: dict[int, int] = {}
+        self.rejected: list[int] = []
+        self.recovered: list[int] = []
+
+    @property
+    def complete(self) -> bool:
+        """Whether every data chunk has been written."""
+        return bool(self.total) and len(self.written) == self.total
+
+    def add(self, index: int, frame: Frame) -> bool:
+        """Write a frame unless it is foreign, corrupt or a duplicate.
+
+        Args:
+            index: Chunk index of the frame
+            frame: Decoded frame
+
+        Returns:
+            True if the frame was accepted
+        """
+        if frame.file_id is not None:
+            if self.file_id is None:
+                self.file_id = frame.file_id
+            elif frame.file_id != self.file_id:
+                logger.warning(
+                    "Skip chunk %d of another file %08x", index, frame.file_id
+                )
+                self.rejected.append(index)
+                return False
+        if self.crcs is not None and (
+            not 0 < index <= len(self.crcs)
+            or f"{zlib.crc32(frame.data):08x}" != self.crcs[index - 1]
+        ):
+            logger.warning("Skip chunk %d not matching the manifest", index)
+            self.rejected.append(index)
+            return False
+        if index in self.decoded:
+            self.duplicates[index] = self.duplicates.get(index, 0) + 1
+            return False
+
+        self.decoded.add(index)
+        self.codecs.add(frame.codec)
+        self.total = self.total or frame.total or 0
+        if is_parity(index, frame):
+            if not self.chunk_size:
+                self.chunk_size = len(frame.data) - PARITY_HEADER.size
+            self.size = self.size or PARITY_HEADER.unpack_from(frame.data)[3]
+            # Keep the frame without its data, which goes to the parity file
+            self.parity[index] = frame._replace(data=b"")
+            self.parity_fp.seek(self._parity_offset(index))
+            self.parity_fp.write(frame.data)
+            self.digests[index] = frame_digest(frame.data)
+        elif self.chunk_size:
+            self._write(index, frame.data)
+        else:
+            self.pending.append((index, frame))
+            # Only the last chunk of a file is shorter than the others, so a
+            # chunk before the total or before another chunk is a full one
+            highest = max(frame.total or 0, *(i for i, _ in self.pending))
+            for pending_index, pending_frame in self.pending:
+                if pending_index < highest:
+                    self.chunk_size = len(pending_frame.data)
+                    break
+        if self.chunk_size and self.pending:
+            for pending_index, pending_frame in self.pending:
+                self._write(pending_index, pending_frame.data)
+            self.pending = []
+        return True
+
+    def _parity_offset(self, index: int) -> int:
+        return (index - self.total - 1) * (PARITY_HEADER.size + self.chunk_size)
+
+    def _write(self, index: int, data: bytes) -> None:
+        self.fp.seek((index - 1) * self.chunk_size)
+        self.fp.write(data)
+        self.written.add(index)
+        self.digests[index] = frame_digest(data)
+
+    def _read(self, index: int) -> bytes:
+        self.fp.seek((index - 1) * self.chunk_size)
+        return self.fp.read(self.chunk_size)
+
+    def finish(self) -> list[int]:
+        """Write the waiting frames and rebuild missing chunks from parity.
+
+        Returns:
+            Indices of the data chunks still missing
+        """
+        if self.pending:
+            # A single frame, which may be the whole file or its last chunk
+            self.chunk_size = max(len(frame.data) for _, frame in self.pending)
+            for index, frame in self.pending:
+                self._write(index, frame.data)
+            self.pending = []
+        total = self.total or max(self.written, default=0)
+        missing = [i for i in range(1, total + 1) if i not in self.written]
+        if not (missing and self.parity):
+            return missing
+
+        # Read back only the parity records and the chunks of the groups
+        # the missing chunks belong to
+        frames = {}
+        for index, frame in self.parity.items():
+            self.parity_fp.seek(self._parity_offset(index))
+            data = self.parity_fp.read(PARITY_HEADER.size + self.chunk_size)
+            frames[index] = frame._replace(data=data)
+        groups = PARITY_HEADER.unpack_from(next(iter(frames.values())).data)[0]
+        lost_groups = {(i - 1) % groups for i in missing}
+        for index in self.written:
+            if (index - 1) % groups in lost_groups:
+                frames[index] = Frame(self._read(index), total=total)
+
+        unrecovered = recover_frames(frames, missing)
+        self.recovered = [i for i in missing if i not in unrecovered]
+        for index in self.recovered:
+            self._write(index, frames[index].data)
+        return unrecovered
+
+    def holes(self, missing: Iterable[int]) -> list[tuple[int, int]]:
+        """Locate missing chunks in the stream, merging adjacent ones.
+
+        Args:
+            missing: Missing data chunk indices in increasing order
+
+        Returns:
+            List of (offset, length) of the missing byte ranges
+        """
+        holes: list[tuple[int, int]] = []
+        for index in missing:
+            offset = (index - 1) * self.chunk_size
+            length = self.chunk_size
+            if self.size:
+                length = min(length, self.size - offset)
+            if holes and sum(holes[-1]) == offset:
+                holes[-1] = (holes[-1][0], holes[-1][1] + length)
+            else:
+                holes.append((offset, length))
+        return holes
+
+    def pad(self) -> None:
+        """Extend the stream to its full size, leaving holes at missing chunks.
+
+        Holes read as zeros and take no disk space where the file system
+        supports sparse files.
+        """
+        self.fp.truncate(self.size or self.total * self.chunk_size)
+
+    def snapshot(self) -> dict:
+        """Describe the written frames for :meth:`restore`.
+
+        Returns:
+            JSON serialisable description of the stream and the digests of
+            the data chunks and parity records written so far
+        """
+        return {
+            "file_id": self.file_id,
+            "chunk_size": self.chunk_size,
+            "total": self.total,
+            "size": self.size,
+            "codecs": sorted(self.codecs),
+            "data": {str(i): self.digests[i] for i in sorted(self.written)},
+            "parity": {
+                str(i): [frame.codec, frame.file_id, frame.total, self.digests[i]]
+                for i, frame in sorted(self.parity.items())
+            },
+        }
+
+    def restore(self, snapshot: dict) -> list[int]:
+        """Take over the frames an earlier writer wrote to the same files.
+
+        The writer must be opened with resume. Each frame is read back and
+        checked against its digest, so damaged or missing data is dropped.
+
+        Args:
+            snapshot: Description returned by :meth:`snapshot`
+
+        Returns:
+            Indices of the dropped frames
+        """
+        self.file_id = self.file_id or snapshot["file_id"]
+        self.chunk_size = self.chunk_size or snapshot["chunk_size"]
+        self.total = self.total or snapshot["total"]
+        self.size = self.size or snapshot["size"]
+        self.codecs.update(snapshot["codecs"])
+
+        dropped = []
+        for key, digest in snapshot["data"].items():
+            index = int(key)
+            if frame_digest(self._read(index)) == digest:
+                self.decoded.add(index)
+                self.written.add(index)
+                self.digests[index] = digest
+            else:
+                dropped.append(index)
+        for key, (codec, file_id, total, digest) in snapshot["parity"].items():
+            index = int(key)
+            self.parity_fp.seek(self._parity_offset(index))
+            data = self.parity_fp.read(PARITY_HEADER.size + self.chunk_size)
+            if frame_digest(data) == digest:
+                self.decoded.add(index)
+                self.parity[index] = Frame(b"", codec, file_id, index, total)
+                self.digests[index] = digest
+            else:
+                dropped.append(index)
+        return dropped
+
+    def copy_sparse(self, dst: Path) -> None:
+        """Copy the written chunks to a file with holes at the missing ones.
+
+        Args:
+            dst: Path of the copy
+        """
+        with open(dst, "wb") as f:
+            for index in sorted(self.written):
+                f.seek((index - 1) * self.chunk_size)
+                f.write(self._read(index))
+            f.truncate(self.size or self.total * self.chunk_size)
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """Read the data chunks back in index order.
+
+        Yields:
+            Chunk data
+        """
+        self.fp.flush()
+        self.fp.seek(0)
+        while self.chunk_size and (chunk := self.fp.read(self.chunk_size)):
+            yield chunk
+
+    def close(self) -> None:
+        """Close the stream and parity files."""
+        self.fp.close()
+        self.parity_fp.close()
+
+    def __enter__(self) -> "ChunkWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class StageStats(NamedTuple):
+    """Time spent and QR codes found by one stage on one image."""
+
+    stage: str
+    seconds: float
+    codes: int
+
+
+def downscale(img: np.ndarray, max_side: int = DECODE_MAX_SIDE) -> np.ndarray:
+    """Scale an image down so that its longest side is at most max_side.
+
+    Args:
+        img: Grayscale image
+        max_side: Maximum length of the longest side in pixels
+
+    Returns:
+        The scaled image, or the image itself if it is small enough
+    """
+    scale = max_side / max(img.shape)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def binarise(img: np.ndarray) -> np.ndarray:
+    """Threshold a grayscale image to black and white with Otsu's method.
+
+    Args:
+        img: Grayscale image
+
+    Returns:
+        Binary image with values 0 and 255
+    """
+    _, binary = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def crop_regions(img: np.ndarray) -> Iterator[np.ndarray]:
+    """Crop the regions where QR codes are detected, with a quiet zone.
+
+    Detection runs on a downscaled copy, which is much faster than on a
+    full resolution photo, and the crops are taken from the original.
+
+    Args:
+        img: Grayscale image
+
+    Yields:
+        Crops of the original image around each detected QR code
+    """
+    small = downscale(img)
+    ok, points = cv2.QRCodeDetectorAruco().detectMulti(small)
+    if not ok:
+        return
+    scale = img.shape[1] / small.shape[1]
+    height, width = img.shape
+    for quad in points * scale:
+        (left, top), (right, bottom) = quad.min(axis=0), quad.max(axis=0)
+        margin = ROI_MARGIN * max(right - left, bottom - top)
+        yield img[
+            max(int(top - margin), 0) : min(int(bottom + margin), height),
+            max(int(left - margin), 0) : min(int(right + margin), width),
+        ]
+
 
-def decode_qr_code(file_path: Path) -> tuple[int, str] | None:
-    """Decode a QR code image file and extract its data.
+def zbar_codes(img: np.ndarray) -> list[bytes]:
+    """Decode all QR codes in a grayscale image array with zbar.
+
+    Args:
+        img: Grayscale image
+
+    Returns:
+        Raw decoded data of every QR code found, empty if pyzbar is not
+        available
+    """
+    if zbar_decode is None:
+        return []
+    return [obj.data for obj in zbar_decode(img)]
+
+
+def decode_stage(stage: str, img: np.ndarray, expected: int) -> list[bytes]:
+    """Run one decoding stage on an image.
+
+    Args:
+        stage: One of DECODE_STAGES
+        img: Grayscale image at full resolution
+        expected: Number of QR codes expected in the image
+
+    Returns:
+        Raw decoded data of the QR codes found
+    """
+    if stage == "zbar":
+        return zbar_codes(downscale(img))
+    if stage == "opencv":
+        if expected > 1:
+            return detect_qr_codes(img)
+        data = detect_qr_code(img)
+        return [] if data is None else [data]
+    decoded = []
+    for crop in crop_regions(img):
+        binary = binarise(crop)
+        data = zbar_codes(binary) or [detect_qr_code(binary)]
+        decoded.extend(data for data in data if data)
+    return decoded
+
+
+def decode_image(
+    img: np.ndarray, expected: int = 1, default_index: int | None = None
+) -> tuple[list[tuple[int, Frame]], list[StageStats]]:
+    """Decode every QR code in a grayscale image and extract their frames.
+
+    The image is handed to the stages in DECODE_STAGES in turn: zbar on a
+    downscaled copy, OpenCV at full resolution, then zbar and OpenCV on
+    binarised crops around each detected code, which are tried before
+    OpenCV for large photos of a single code. Later stages only run while
+    fewer than the expected QR codes have been found, so clean images cost
+    one attempt and only difficult photos and scans pay for the others.
+
+    Both base64 and binary payloads are supported, see
+    :func:`chaos_box.cmd.qrcode_common.decode_payload`.
+
+    Args:
+        img: Grayscale image
+        expected: Number of QR codes expected in the image
+        default_index: Index of legacy payloads, which carry none
+
+    Returns:
+        Tuple of a list of (index, frame) tuples, empty if nothing could be
+        decoded, and the statistics of the stages that were run
+    """
+    stages = DECODE_STAGES
+    if expected == 1 and max(img.shape) > DECODE_MAX_SIDE:
+        # In a large photo of one QR code, decoding a crop around the code is
+        # several times faster than searching the full resolution image
+        stages = ("zbar", "roi", "opencv")
+
+    stats = []
+    results: dict[int, Frame] = {}
+    for stage in stages:
+        if len(results) >= expected:
+            break
+        if stage == "zbar" and zbar_decode is None:
+            continue
+        start = time.perf_counter()
+        found = 0
+        for data in decode_stage(stage, img, expected):
+            try:
+                frame = unpack_frame(decode_payload(data))
+            except Exception as err:
+                logger.info("Error decoding a QR code: %s", err)
+                continue
+            index = frame.index or default_index
+            if index is None:
+                logger.info("Skip a legacy QR code without an index")
+            elif index not in results:
+                results[index] = frame
+                found += 1
+        stats.append(StageStats(stage, time.perf_counter() - start, found))
+    return list(results.items()), stats
+
+
+def decode_qr_code(
+    file_path: Path, expected: int = 1
+) -> tuple[list[tuple[int, Frame]], list[StageStats]]:
+    """Decode every QR code in an image file and extract their frames.
+
+    Images hold a single QR code, or many when they are sheets. The image is
+    loaded as grayscale and decoded with :func:`decode_image`. The index is
+    taken from the frame header, or from the filename for legacy payloads.
 
     Args:
         file_path: Path to the QR code image file
+        expected: Number of QR codes expected in the image
 
     Returns:
-        Tuple of (index, decoded_data) if successful, None otherwise
+        Tuple of a list of (index, frame) tuples, empty if nothing could be
+        decoded, and the statistics of the stages that were run
     """
+    start = time.perf_counter()
+    img = cv2.imread(str(file_path), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        logger.info("Error decoding %s: unreadable image", file_path)
+        return [], []
+    load = StageStats("load", time.perf_counter() - start, 0)
+
+    results, stats = decode_image(img, expected, int(file_path.stem.split("_")[-1]))
+    return results, [load, *stats]
+
+
+def iter_video_frames(video_path: Path) -> Iterator[np.ndarray]:
+    """Read the distinct frames of a video or GIF animation.
+
+    Each QR code is usually shown for several frames of a recording. A frame
+    is skipped without being decoded only when it is identical to the frame
+    before it, as in GIF animations and lossless videos. Frames that merely
+    look alike are always decoded: a blended transition frame, or a small
+    code in a large frame, can look like a different code once scaled down,
+    and skipping it would lose a chunk. Decoding stops as soon as every
+    chunk is found, see :func:`decode_into`.
+
+    Args:
+        video_path: Path to the video or GIF file
+
+    Yields:
+        Grayscale frames that differ from the previous one
+    """
+    capture = cv2.VideoCapture(str(video_path))
+    previous = None
+    frames = distinct = 0
     try:
-        img = Image.open(file_path)
-        decoded_objects = decode(img)
-        if decoded_objects:
-            data = decoded_objects[0].data.decode("utf-8")
-            index = int(file_path.stem.split("_")[-1])
-            return (index, data)
+        while True:
+            ok, img = capture.read()
+            if not ok:
+                break
+            frames += 1
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            if previous is not None and np.array_equal(img, previous):
+                continue
+            previous = img
+            distinct += 1
+            yield img
+    finally:
+        capture.release()
+        logger.info("Read %d frames of %s, %d distinct", frames, video_path, distinct)
+
+
+def report_stats(stats: dict[str, list[float]]) -> None:
+    """Log the time spent and the success rate of each decoding stage.
+
+    Args:
+        stats: Per stage [images tried, images with new codes, codes found,
+            seconds], as collected by :func:`decode_into`
+    """
+    images = max((tried for tried, _, _, _ in stats.values()), default=0)
+    for stage, (tried, hits, codes, seconds) in stats.items():
+        if stage == "load":
+            logger.info("load: %d images, %.1f ms/image", tried, 1000 * seconds / tried)
+            continue
+        logger.info(
+            "%s: %d images tried, %d decoded (%.1f%% of all), %d codes, %.1f ms/image",
+            stage,
+            tried,
+            hits,
+            100 * hits / images,
+            codes,
+            1000 * seconds / tried,
+        )
+
+
+def decode_into(
+    writer: ChunkWriter,
+    images: Iterable[Path | np.ndarray],
+    workers: int | None = None,
+    expected: int = 1,
+    total: int | None = None,
+) -> tuple[dict[str, list[float]], dict[Path, list[tuple[int, str]]]]:
+    """Decode QR code images in parallel and write their frames as they come.
+
+    Only a bounded number of images is in flight, so memory use depends on
+    the number of workers rather than the number of images. Decoding stops
+    as soon as every data chunk has been written.
+
+    Args:
+        writer: Writer to hand the decoded frames to
+        images: QR code image files, or grayscale images such as video
+            frames, read lazily
+        workers: Number of parallel workers, None for the number of CPU cores
+        expected: Number of QR codes expected per image
+        total: Number of images for the progress line, if known
+
+    Returns:
+        Tuple of per stage [images tried, images with new codes, codes found,
+        seconds], and the (index, payload digest) of the frames decoded from
+        each image file, empty where no QR code was decoded
+    """
+    max_pending = 4 * (workers or os.cpu_count() or 1)
+    images = iter(images)
+    decoded = 0
+    stats: dict[str, list[float]] = {}
+    sources: dict[Path, list[tuple[int, str]]] = {}
+    last_report = time.monotonic()
+    pending: dict[Future, Path | None] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while not writer.complete:
+            for img in islice(images, max_pending - len(pending)):
+                if isinstance(img, Path):
+                    pending[executor.submit(decode_qr_code, img, expected)] = img
+                else:
+                    pending[executor.submit(decode_image, img, expected)] = None
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source = pending.pop(future)
+                results, image_stats = future.result()
+                if source is not None:
+                    if not results:
+                        logger.warning("No QR code decoded in %s", source)
+                    sources[source] = [
+                        (index, frame_digest(frame.data)) for index, frame in results
+                    ]
+                for index, frame in results:
+                    writer.add(index, frame)
+                for stage, seconds, codes in image_stats:
+                    totals = stats.setdefault(stage, [0, 0, 0, 0.0])
+                    totals[0] += 1
+                    totals[1] += codes > 0
+                    totals[2] += codes
+                    totals[3] += seconds
+            decoded += len(done)
+
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                logger.info(
+                    "Decoded %d/%s images, %d chunks written",
+                    decoded,
+                    total or "?",
+                    len(writer.written),
+                )
+        if writer.complete:
+            logger.info("All %d chunks decoded after %d images", writer.total, decoded)
+            for future in pending:
+                future.cancel()
+    return stats, sources
+
+
+def rescan_images(manifest: dict, missing: Iterable[int]) -> list[str]:
+    """Name the images to scan again to find missing chunks.
+
+    Args:
+        manifest: Manifest written by qrcode-split
+        missing: Missing data chunk indices
+
+    Returns:
+        Filenames of the QR code images or sheets holding the missing chunks,
+        as written by qrcode-split
+    """
+    prefix = Path(manifest["name"]).stem
+    total_frames = len(manifest["crc32"])
+    image_format = manifest.get("image_format", "png")
+    sheet = manifest.get("sheet")
+    if not sheet:
+        return [
+            qr_code_path(Path(), prefix, i, total_frames, image_format).name
+            for i in missing
+        ]
+    per_sheet = sheet["grid"][0] * sheet["grid"][1]
+    total_sheets = math.ceil(total_frames / per_sheet)
+    sheets = sorted({(i - 1) // per_sheet + 1 for i in missing})
+    return [
+        sheet_path(Path(), prefix, n, total_sheets, image_format).name for n in sheets
+    ]
+
+
+def merge_chunks(
+    writer: ChunkWriter,
+    output: Path,
+    manifest: dict | None,
+    sparse: bool = False,
+    keep_stream: bool = False,
+) -> dict:
+    """Check the decoded chunks for completeness and write the merged file.
+
+    Missing chunks are rebuilt from parity where possible. If some remain
+    missing, the file is only written with sparse, as holes at the offsets
+    of the missing chunks, and otherwise the decoded chunks are kept in the
+    stream file of the writer. A complete file is checked against the
+    manifest SHA-256 while it is written.
+
+    Args:
+        writer: Writer the decoded frames were handed to, closed on return
+        output: Path to save the merged file to
+        manifest: Manifest written by qrcode-split, if available
+        sparse: Write the file with holes if chunks are missing
+        keep_stream: Copy rather than move the stream file to a sparse file,
+            so a later run can resume from it
+
+    Returns:
+        Report of the decoded, duplicate, rejected, rebuilt and missing
+        chunks, the byte ranges of the missing chunks in the chunk stream,
+        which is the file itself unless compressed, the images to scan again
+        and the SHA-256 check
+    """
+    missing = writer.finish()
+    report: dict = {
+        "output": None,
+        "complete": False,
+        "name": manifest["name"] if manifest else None,
+        "total": writer.total,
+        "chunk_size": writer.chunk_size,
+        "codecs": sorted(writer.codecs),
+        "decoded": len(writer.decoded - writer.parity.keys()),
+        "parity": len(writer.parity),
+        "duplicates": writer.duplicates,
+        "rejected": writer.rejected,
+        "recovered": writer.recovered,
+        "missing": missing,
+        "holes": writer.holes(missing),
+        "rescan": rescan_images(manifest, missing) if manifest else [],
+        "sha256": None,
+    }
+    if writer.duplicates:
+        logger.info(
+            "Skipped %d duplicate copies of %d chunks",
+            sum(writer.duplicates.values()),
+            len(writer.duplicates),
+        )
+    if len(writer.codecs) > 1:
+        logger.error("QR codes use different compression codecs: %s", writer.codecs)
+        return report
+    codec = next(iter(writer.codecs))
+
+    if missing:
+        logger.error("Missing %d chunks: %s", len(missing), missing)
+        if report["rescan"]:
+            logger.error("Scan again: %s", ", ".join(report["rescan"]))
+        if not sparse:
+            logger.error("Decoded chunks are kept in %s", writer.path)
+            return report
+        if codec != "none":
+            logger.error(
+                "Cannot write a sparse file from %s compressed chunks, decoded "
+                "chunks are kept in %s",
+                codec,
+                writer.path,
+            )
+            return report
+        if keep_stream:
+            writer.copy_sparse(output)
         else:
-            return None
-    except Exception as err:
-        logger.info("Error decoding %s: %s", file_path, err)
+            writer.pad()
+            writer.close()
+            writer.path.replace(output)
+        report["output"] = str(output)
+        logger.warning(
+            "Sparse file saved to %s with %d bytes missing in %d holes",
+            output,
+            sum(length for _, length in report["holes"]),
+            len(report["holes"]),
+        )
+        return report
+
+    # Hash while writing so the result is verified without reading it again
+    sha256 = hashlib.sha256()
+    if codec == "none":
+        # The chunk stream is the file itself, it only needs hashing
+        for data in writer.iter_chunks():
+            sha256.update(data)
+        writer.close()
+        writer.path.replace(output)
+    else:
+        try:
+            with open(output, "wb") as f:
+                for data in iter_decompressed(writer.iter_chunks(), codec):
+                    sha256.update(data)
+                    f.write(data)
+        except Exception as err:
+            logger.error("Decompressing %s data failed: %s", codec, err)
+            return report
+        writer.close()
+        writer.path.unlink()
+    report["output"] = str(output)
+
+    expected = manifest["sha256"] if manifest else None
+    report["sha256"] = {"expected": expected, "actual": sha256.hexdigest()}
+    if expected and sha256.hexdigest() != expected:
+        logger.error(
+            "SHA-256 mismatch for %s: expected %s, got %s",
+            output,
+            expected,
+            sha256.hexdigest(),
+        )
+        return report
+
+    report["complete"] = True
+    logger.info("Merged file saved to %s", output)
+    return report
+
+
+def load_state(state_path: Path, manifest: dict | None = None) -> dict | None:
+    """Load the state saved by an earlier, incomplete merge.
+
+    Args:
+        state_path: Path to the state file
+        manifest: Manifest of the file being merged, if available
+
+    Returns:
+        The state, or None if there is none or it is unusable
+    """
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as err:
+        logger.warning("Ignore unreadable merge state %s: %s", state_path, err)
         return None
 
+    if state.get("version") != STATE_VERSION:
+        logger.warning("Ignore merge state %s of another version", state_path)
+        return None
+    file_id = state["writer"]["file_id"]
+    if manifest and file_id is not None and file_id != int(manifest["file_id"], 16):
+        logger.warning("Ignore merge state %s of another file", state_path)
+        return None
+    return state
+
+
+def save_state(state_path: Path, writer: ChunkWriter, images: dict[str, dict]) -> None:
+    """Save the state of an incomplete merge for the next run.
+
+    Args:
+        state_path: Path to the state file
+        writer: Writer holding the decoded frames
+        images: Size, mtime and decoded (index, payload digest) pairs of every
+            image decoded so far, by absolute path
+    """
+    state = {"version": STATE_VERSION, "writer": writer.snapshot(), "images": images}
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    logger.info("Merge state saved to %s", state_path)
+
 
 def parse_args() -> argparse.Namespace:
     """Parse command line arguments.
@@ -49,10 +1035,13 @@ def parse_args() -> argparse.Namespace:
         Parsed command line arguments
     """
     parser = argparse.ArgumentParser(
-        description="Merge a directory of QR code images back into the original file."
+        description="Merge a directory of QR code images, or a video of QR codes, "
+        "back into the original file."
     )
     parser.add_argument(
-        "directory", help="Path to the directory containing the QR code images."
+        "input",
+        help="Path to the directory containing the QR code images, or to a "
+        f"video or GIF animation ({', '.join(VIDEO_FORMATS)}) showing them.",
     )
     parser.add_argument(
         "-o", "--output", required=True, help="Path to save the merged file."
@@ -64,6 +1053,32 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Number of parallel workers (default: number of CPU cores)",
     )
+    parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="If chunks are missing, still write the file with holes at their "
+        "offsets (uncompressed files only), instead of keeping only the "
+        "decoded chunks in OUTPUT.part.",
+    )
+    parser.add_argument(
+        "--report",
+        metavar="FILE",
+        default=None,
+        help="Write a JSON report of the missing, duplicate, rejected and "
+        "rebuilt chunks, the holes, the images to scan again and the SHA-256 "
+        "check to FILE.",
+    )
+    state_group = parser.add_mutually_exclusive_group()
+    state_group.add_argument(
+        "--no-state",
+        action="store_true",
+        help="Do not read or write the merge state, decode every image",
+    )
+    state_group.add_argument(
+        "--rebuild-state",
+        action="store_true",
+        help="Discard the merge state of earlier runs and decode every image",
+    )
     argcomplete.autocomplete(parser)
 
     return parser.parse_args()
@@ -73,57 +1088,126 @@ def main() -> None:
     """Main function to merge QR code images back into a single file."""
     args = parse_args()
 
-    directory = Path(args.directory)
-    if not (directory.exists() and directory.is_dir()):
-        logger.error("The specified directory does not exist: %s", directory)
-        return
+    input_path = Path(args.input)
+    is_video = input_path.is_file() and input_path.suffix[1:].lower() in VIDEO_FORMATS
+    if is_video:
+        directory = input_path.parent
+        qr_files = [input_path]
+    elif input_path.is_dir():
+        directory = input_path
+        qr_files = []
+        for f in directory.iterdir():
+            if f.suffix[1:].lower() not in READ_FORMATS:
+                continue
+            try:
+                int(f.stem.split("_")[-1])
+                qr_files.append(f)
+            except Exception:
+                logger.warning("Skip file with unexpected name: %s", f)
+                continue
 
-    qr_files = []
-    for f in directory.glob("*.png"):
-        try:
-            int(f.stem.split("_")[-1])
-            qr_files.append(f)
-        except Exception:
-            logger.warning("Skip file with unexpected name: %s", f)
-            continue
+        if not qr_files:
+            logger.error("No valid QR code images found in %s", directory)
+            sys.exit(1)
 
-    if not qr_files:
-        logger.error("No valid QR code images found in %s", directory)
-        return
+        qr_files.sort(key=lambda f: int(f.stem.split("_")[-1]))
+    else:
+        logger.error("Not a directory or a video file: %s", input_path)
+        sys.exit(1)
 
-    qr_files.sort(key=lambda f: int(f.stem.split("_")[-1]))
+    if zbar_decode is None:
+        logger.warning("pyzbar is not available, decoding with OpenCV only")
 
-    decoded_chunks = []
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
-        futures = {executor.submit(decode_qr_code, f): f for f in qr_files}
-        for future in as_completed(futures):
-            result = future.result()
-            if result is not None:
-                decoded_chunks.append(result)
+    manifest = load_manifest(directory)
+    sheet = manifest and manifest.get("sheet")
+    expected = sheet["grid"][0] * sheet["grid"][1] if sheet else 1
+    output = Path(args.output)
+    part_path = output.with_name(output.name + ".part")
+    parity_path = state_path = state = None
+    if not args.no_state:
+        parity_path = output.with_name(output.name + ".parity")
+        state_path = output.with_name(output.name + ".state")
+        if not args.rebuild_state:
+            state = load_state(state_path, manifest)
 
-    if not decoded_chunks:
-        logger.error("No QR code could be decoded successfully.")
-        return
+    with ChunkWriter(
+        part_path, manifest, parity_path, resume=state is not None
+    ) as writer:
+        known: dict[str, dict] = {}
+        if state is not None:
+            dropped = set(writer.restore(state["writer"]))
+            if dropped:
+                logger.warning(
+                    "Dropped %d damaged chunks of %s", len(dropped), part_path
+                )
+            # Images whose chunks were dropped are decoded again
+            known = {
+                path: entry
+                for path, entry in state["images"].items()
+                if not dropped.intersection(index for index, _ in entry["frames"])
+            }
 
-    decoded_chunks.sort(key=lambda x: x[0])  # Sort by index
+        # Stat before decoding, so an image changed meanwhile is decoded again
+        stats_by_path = {f: f.stat() for f in qr_files}
+        new_files = [
+            f
+            for f in qr_files
+            if (entry := known.get(str(f.resolve()))) is None
+            or entry["size"] != stats_by_path[f].st_size
+            or entry["mtime_ns"] != stats_by_path[f].st_mtime_ns
+        ]
+        if state is not None:
+            logger.info(
+                "Resumed %d chunks, %d of %d images already decoded",
+                len(writer.decoded),
+                len(qr_files) - len(new_files),
+                len(qr_files),
+            )
 
-    data_chunks = []
-    for idx, chunk in decoded_chunks:
-        try:
-            data_chunks.append(base64.b64decode(chunk))
-        except Exception as err:
-            logger.error("Base64 decode failed for chunk %s: %s", idx, err)
-            continue
+        if is_video:
+            images: Iterable[Path | np.ndarray] = (
+                img for f in new_files for img in iter_video_frames(f)
+            )
+            total = None
+        else:
+            images, total = new_files, len(new_files)
+        stats, sources = decode_into(writer, images, args.workers, expected, total)
+        report_stats(stats)
+        if is_video and new_files:
+            # Frames carry no path, credit the video with every chunk so far
+            sources[input_path] = sorted(writer.digests.items())
+        for f, frames in sources.items():
+            known[str(f.resolve())] = {
+                "size": stats_by_path[f].st_size,
+                "mtime_ns": stats_by_path[f].st_mtime_ns,
+                "frames": frames,
+            }
 
-    if not data_chunks:
-        logger.error("No valid data chunks to write.")
-        return
+        if not writer.decoded:
+            logger.error("No QR code could be decoded successfully.")
+            sys.exit(1)
+        report = merge_chunks(
+            writer, output, manifest, args.sparse, keep_stream=state_path is not None
+        )
 
-    with open(args.output, "wb") as f:
-        for chunk in data_chunks:
-            f.write(chunk)
+    if state_path is not None and parity_path is not None:
+        if part_path.exists():
+            save_state(state_path, writer, known)
+        else:
+            state_path.unlink(missing_ok=True)
+            parity_path.unlink(missing_ok=True)
 
-    logger.info("Merged file saved to %s", args.output)
+    report["input"] = str(input_path)
+    report["undecodable"] = [
+        path for path, entry in known.items() if not entry["frames"]
+    ]
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        logger.info("Merge report saved to %s", args.report)
+    # Missing chunks, a failed decompression or a SHA-256 mismatch
+    if not report["complete"]:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -7,20 +7,405 @@ supporting parallel processing and resumable operations.
 # PYTHON_ARGCOMPLETE_OK
 
 import argparse
-import base64
+import bz2
+import hashlib
+import lzma
 import math
+import os
 import sys
-from collections.abc import Iterator
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import tempfile
+import zlib
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import repeat
 from pathlib import Path
+from typing import NamedTuple
 
 import argcomplete
+import cv2
+import numpy as np
 import qrcode
 from chaos_utils.logging import setup_logger
-from PIL import ImageDraw, ImageFont
+from PIL import GifImagePlugin, Image, ImageDraw, ImageFont
+from qrcode.util import BIT_LIMIT_TABLE, MODE_8BIT_BYTE, length_in_bits
+
+from chaos_box.cmd.qrcode_common import (
+    BINARY_MARKER,
+    CODECS,
+    FRAME_HEADER,
+    IMAGE_FORMATS,
+    MAX_GROUP_SIZE,
+    PARITY_HEADER,
+    Frame,
+    cauchy_matrix,
+    decode_payload,
+    encode_payload,
+    gf_matmul,
+    load_manifest,
+    pack_frame,
+    qr_code_path,
+    read_qr_code,
+    read_qr_codes,
+    sheet_path,
+    unpack_frame,
+    write_manifest,
+)
 
 logger = setup_logger(__name__)
 
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+FONT_SIZE = 20
+FOOTER_MARGIN = 10
+QR_BORDER = 4
+DEFAULT_BOX_SIZE = 10
+# Version 40 codes at 5px per module are 925px, which fit a 1080p screen
+ANIMATION_BOX_SIZE = 5
+DEFAULT_COMPRESS_LEVEL = 6
+
+PAGE_SIZES_MM = {"a4": (210.0, 297.0), "letter": (215.9, 279.4)}
+SHEET_MARGIN_MM = 10.0
+DEFAULT_DPI = 300
+DEFAULT_FPS = 5.0
+
+PAYLOAD_MODES = ("base64", "binary")
+ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+# Chunk size used by base64 payloads before it was calculated automatically,
+# kept as the base64 default so --resume stays compatible with old outputs
+LEGACY_CHUNK_SIZE = 1900
+
+COMPRESS_BLOCK_SIZE = 1024 * 1024
+
+
+# Per-worker state set up once by init_worker() instead of for every chunk
+_worker_state: dict = {}
+
+
+def load_font(size: int = FONT_SIZE) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
+    """Load the footer font, falling back to the PIL default font.
+
+    Args:
+        size: Font size in pixels
+
+    Returns:
+        Font used to draw the footer text
+    """
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except Exception:
+        return ImageFont.load_default(size)
+
+
+def measure_text_height(font: ImageFont.FreeTypeFont | ImageFont.ImageFont) -> int:
+    """Measure the height of footer texts.
+
+    Args:
+        font: Font used to draw the footer text
+
+    Returns:
+        Height in pixels
+    """
+    # Footer texts only contain digits and "/", which share this height
+    textbbox = font.getbbox("0123456789/")
+    return textbbox[3] - textbbox[1]
+
+
+def sheet_font_size(dpi: int) -> int:
+    """Return the footer font size on sheets, about 7pt at any DPI."""
+    return max(FONT_SIZE, dpi // 10)
+
+
+class SheetLayout(NamedTuple):
+    """Placement of the QR codes on a sheet, in pixels."""
+
+    page_size: tuple[int, int]
+    cols: int
+    rows: int
+    code_size: int
+    origin: tuple[int, int]
+    pitch: tuple[int, int]
+    margin: int
+
+    @property
+    def per_sheet(self) -> int:
+        """Number of QR codes on a full sheet."""
+        return self.cols * self.rows
+
+
+def sheet_layout(
+    paper: str,
+    dpi: int,
+    box_size: int,
+    version: int,
+    text_height: int,
+    grid: tuple[int, int] | None = None,
+) -> SheetLayout:
+    """Tile QR codes on a page, each with its index label below it.
+
+    Args:
+        paper: Paper size, one of PAGE_SIZES_MM
+        dpi: Resolution of the page image
+        box_size: Size of a QR code module in pixels
+        version: QR code version (1-40)
+        text_height: Height of the label and footer texts in pixels
+        grid: Number of (columns, rows), or None for as many as fit
+
+    Returns:
+        Layout of the codes, spreading spare space evenly between them
+
+    Raises:
+        ValueError: If the grid does not fit on the page
+    """
+    px_per_mm = dpi / 25.4
+    width, height = (round(size * px_per_mm) for size in PAGE_SIZES_MM[paper])
+    margin = round(SHEET_MARGIN_MM * px_per_mm)
+    code_size = (version * 4 + 17 + 2 * QR_BORDER) * box_size
+    cell_height = code_size + 2 * text_height
+    # Leave room for the sheet footer below the codes
+    usable = (width - 2 * margin, height - 2 * margin - 2 * text_height)
+    max_grid = (usable[0] // code_size, usable[1] // cell_height)
+    cols, rows = grid or max_grid
+    if not (0 < cols <= max_grid[0] and 0 < rows <= max_grid[1]):
+        raise ValueError(
+            f"{cols}x{rows} QR codes of {code_size}px do not fit on {paper} "
+            f"paper at {dpi} dpi, at most {max_grid[0]}x{max_grid[1]} do"
+        )
+    gap_x = (usable[0] - cols * code_size) // (cols + 1)
+    gap_y = (usable[1] - rows * cell_height) // (rows + 1)
+    return SheetLayout(
+        (width, height),
+        cols,
+        rows,
+        code_size,
+        (margin + gap_x, margin + gap_y),
+        (code_size + gap_x, cell_height + gap_y),
+        margin,
+    )
+
+
+def payload_capacity(version: int, error_correction: str, payload: str) -> int:
+    """Calculate the largest chunk that fits in one QR code.
+
+    Args:
+        version: QR code version (1-40)
+        error_correction: Error correction level, one of L, M, Q or H
+        payload: Payload encoding, one of PAYLOAD_MODES
+
+    Returns:
+        Maximum chunk size in bytes
+    """
+    # Byte mode data is preceded by a 4-bit mode indicator and a length field
+    bits = BIT_LIMIT_TABLE[ERROR_CORRECTION_LEVELS[error_correction]][version]
+    bits -= 4 + length_in_bits(MODE_8BIT_BYTE, version)
+    capacity = bits // 8
+    if payload == "binary":
+        capacity -= len(BINARY_MARKER)
+    else:
+        # Every 3 input bytes become 4 base64 characters
+        capacity = capacity // 4 * 3
+    return capacity - FRAME_HEADER.size
+
+
+def file_sha256(file_path: Path) -> str:
+    """Calculate the SHA-256 of a file.
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        Hex digest
+    """
+    with open(file_path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def chunk_crcs(file_path: Path, chunk_size: int) -> list[str]:
+    """Calculate the CRC32 of every chunk of a file.
+
+    Args:
+        file_path: Path to the file
+        chunk_size: Size of each chunk in bytes
+
+    Returns:
+        Hex CRC32 of each chunk, in index order
+    """
+    return [
+        f"{zlib.crc32(chunk):08x}"
+        for chunk, _ in iter_file_into_chunks(file_path, chunk_size)
+    ]
+
+
+def verify_qr_code(img_path: Path, file_id: int, indices: Iterable[int]) -> bool:
+    """Check that an image holds intact frames of the given file and indices.
+
+    Args:
+        img_path: Path to the QR code image or sheet
+        file_id: Expected file id
+        indices: Expected chunk indices
+
+    Returns:
+        True if a frame of the given file with a matching CRC32 is found for
+        every index
+    """
+    expected = set(indices)
+    if len(expected) == 1:
+        data = read_qr_code(img_path)
+        decoded = [] if data is None else [data]
+    else:
+        decoded = read_qr_codes(img_path)
+    found = set()
+    for data in decoded:
+        try:
+            frame = unpack_frame(decode_payload(data))
+        except Exception:
+            continue
+        if frame.file_id == file_id:
+            found.add(frame.index)
+    return expected <= found
+
+
+def make_compressor(
+    codec: str,
+) -> "zlib._Compress | lzma.LZMACompressor | bz2.BZ2Compressor":
+    """Create an incremental compressor.
+
+    Args:
+        codec: Compression codec, one of CODECS except "none"
+
+    Returns:
+        Compressor object with compress() and flush() methods
+    """
+    if codec == "zlib":
+        return zlib.compressobj(9)
+    if codec == "lzma":
+        # Preset 9 needs about 674 MiB for its dictionary, the default preset
+        # 6 about 94 MiB for almost the same ratio
+        return lzma.LZMACompressor()
+    return bz2.BZ2Compressor(9)
+
+
+def compress_file(src: Path, dst: Path, codec: str) -> None:
+    """Compress a file block by block.
+
+    Args:
+        src: Path to the input file
+        dst: Path to write the compressed stream to
+        codec: Compression codec, one of CODECS except "none"
+    """
+    compressor = make_compressor(codec)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while block := fin.read(COMPRESS_BLOCK_SIZE):
+            fout.write(compressor.compress(block))
+        fout.write(compressor.flush())
+
+
+def parity_layout(total_chunks: int, percent: int) -> tuple[int, list[int]]:
+    """Plan the parity groups of a file.
+
+    Data chunks are interleaved across the groups, chunk i belonging to
+    group (i - 1) % groups, so losing a run of consecutive chunks, such as
+    a whole printed page, costs each group as few chunks as possible.
+
+    Args:
+        total_chunks: Number of data chunks
+        percent: Parity overhead in percent of the data chunks
+
+    Returns:
+        Tuple of (number of groups, number of parity chunks per group)
+    """
+    if not (total_chunks and percent):
+        return 0, []
+    group_size = MAX_GROUP_SIZE * 100 // (100 + percent)
+    while group_size + math.ceil(group_size * percent / 100) > MAX_GROUP_SIZE:
+        group_size -= 1
+    groups = math.ceil(total_chunks / group_size)
+    counts = [
+        math.ceil(len(range(g, total_chunks, groups)) * percent / 100)
+        for g in range(groups)
+    ]
+    return groups, counts
+
+
+def write_parity(source: Path, dst: Path, chunk_size: int, percent: int) -> int:
+    """Calculate the parity chunks of a file.
+
+    Each group is read with seeks, so memory use is bounded by the group
+    size rather than the file size.
+
+    Args:
+        source: Path to the file to split
+        dst: Path to write the parity frame data to, one record of
+            PARITY_HEADER.size + chunk_size bytes per parity chunk
+        chunk_size: Size of each data chunk in bytes
+        percent: Parity overhead in percent of the data chunks
+
+    Returns:
+        Number of parity chunks
+    """
+    size = source.stat().st_size
+    total_chunks = math.ceil(size / chunk_size)
+    groups, counts = parity_layout(total_chunks, percent)
+    with open(source, "rb") as fin, open(dst, "wb") as fout:
+        for group, count in enumerate(counts):
+            members = []
+            for i in range(group, total_chunks, groups):
+                fin.seek(i * chunk_size)
+                members.append(fin.read(chunk_size).ljust(chunk_size, b"\0"))
+            data = np.frombuffer(b"".join(members), dtype=np.uint8)
+            parity = gf_matmul(
+                cauchy_matrix(count, len(members)),
+                data.reshape(len(members), chunk_size),
+            )
+            for row, chunk in enumerate(parity):
+                fout.write(PARITY_HEADER.pack(groups, group, row, size))
+                fout.write(chunk.tobytes())
+    return sum(counts)
+
+
+def init_worker(
+    version: int = 40,
+    error_correction: str = "L",
+    box_size: int = DEFAULT_BOX_SIZE,
+    font_size: int | None = None,
+    image_format: str = "png",
+    compress_level: int = DEFAULT_COMPRESS_LEVEL,
+    optimize: bool = False,
+) -> None:
+    """Initialize the per-worker state used by :func:`generate_qr_code`.
+
+    Loads the footer font, measures the footer text height and creates a
+    reusable QR code encoder, so this is done once per worker process
+    rather than once per chunk. Used as the pool initializer.
+
+    Args:
+        version: QR code version (1-40)
+        error_correction: Error correction level, one of L, M, Q or H
+        box_size: Size of a QR code module in pixels
+        font_size: Footer font size in pixels, by default scaled with the
+            box size so the footer fits in the quiet zone
+        image_format: Output image format, one of IMAGE_FORMATS
+        compress_level: PNG zlib compression level (0-9)
+        optimize: Whether to let PNG search for the smallest encoding
+    """
+    font = load_font(font_size or FONT_SIZE * box_size // DEFAULT_BOX_SIZE)
+    _worker_state["font"] = font
+    _worker_state["footer_margin"] = FOOTER_MARGIN * box_size // DEFAULT_BOX_SIZE
+    _worker_state["text_height"] = measure_text_height(font)
+    _worker_state["qr"] = qrcode.QRCode(
+        version=version,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        box_size=box_size,
+        border=QR_BORDER,
+    )
+    _worker_state["image_format"] = image_format
+    _worker_state["compress_level"] = compress_level
+    _worker_state["optimize"] = optimize
+
 
 def iter_file_into_chunks(
     file_path: Path, chunk_size: int
@@ -44,62 +429,346 @@ def iter_file_into_chunks(
             index += 1
 
 
-def generate_qr_code(
-    chunk: bytes, index: int, total_chunks: int, output_dir: Path, prefix: str
-) -> None:
-    """Generate a QR code image for a chunk of data.
+def save_image(img: Image.Image, img_path: Path, dpi: int | None = None) -> None:
+    """Save a 1-bit image with the worker's output settings.
+
+    Args:
+        img: Image to save
+        img_path: Path to save the image to
+        dpi: Resolution to record in PNG images, if any
+    """
+    if _worker_state["image_format"] == "pbm":
+        # Pillow writes 1-bit images as binary PBM (P4)
+        img.save(img_path, "PPM")
+        return
+    options = {}
+    if dpi:
+        options["dpi"] = (dpi, dpi)
+    img.save(
+        img_path,
+        "PNG",
+        compress_level=_worker_state["compress_level"],
+        optimize=_worker_state["optimize"],
+        **options,
+    )
+
+
+def render_qr_code(
+    chunk: bytes,
+    index: int,
+    total_chunks: int,
+    payload: str,
+    codec: str,
+    file_id: int,
+) -> Image.Image:
+    """Render the QR code of a chunk with the worker's encoder.
 
     Args:
         chunk: Binary data to encode
         index: Index number of this chunk
-        total_chunks: Total number of chunks
-        output_dir: Directory to save the QR code image
-        prefix: Prefix for the output filename
+        total_chunks: Total number of data chunks
+        payload: Payload encoding, one of PAYLOAD_MODES
+        codec: Compression codec the chunk was written with, one of CODECS
+        file_id: Id of the split file recorded in the frame header
+
+    Returns:
+        1-bit image of the QR code including its quiet zone
     """
-    qr = qrcode.QRCode(
-        version=40,  # Version 40 is the largest, can store up to 2953 bytes in binary mode
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(base64.b64encode(chunk).decode("utf-8"))
+    qr = _worker_state["qr"]
+    qr.clear()
+    frame = Frame(chunk, codec, file_id, index, total_chunks)
+    data = encode_payload(pack_frame(frame), payload)
+    # Mode optimization would split binary data into numeric and alphanumeric
+    # segments, which decoders concatenate as text
+    qr.add_data(data, optimize=0 if payload == "binary" else 20)
     qr.make(fit=True)
+    return qr.make_image(fill="black", back_color="white").get_image()
+
+
+def draw_qr_code(
+    chunk: bytes,
+    index: int,
+    total_chunks: int,
+    payload: str = "base64",
+    codec: str = "none",
+    file_id: int = 0,
+    total_frames: int | None = None,
+) -> Image.Image:
+    """Render the QR code of a chunk with its index footer.
+
+    Args:
+        chunk: Binary data to encode
+        index: Index number of this chunk
+        total_chunks: Total number of data chunks
+        payload: Payload encoding, one of PAYLOAD_MODES
+        codec: Compression codec the chunk was written with, one of CODECS
+        file_id: Id of the split file recorded in the frame header
+        total_frames: Total number of data and parity chunks, defaults to
+            total_chunks
+
+    Returns:
+        1-bit image of the QR code
+    """
+    total_frames = total_frames or total_chunks
+    if not _worker_state:
+        init_worker()
+    font = _worker_state["font"]
 
-    img = qr.make_image(fill="black", back_color="white").convert("RGB")
+    img = render_qr_code(chunk, index, total_chunks, payload, codec, file_id)
 
     # Add footer with index/total_count_of_files
     draw = ImageDraw.Draw(img)
-    font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
-    try:
-        font = ImageFont.truetype(font_path, 20)
-    except Exception:
-        font = ImageFont.load_default()
-    text = f"{index}/{total_chunks}"
-    textbbox = draw.textbbox((0, 0), text, font=font)
-    textwidth = textbbox[2] - textbbox[0]
-    textheight = textbbox[3] - textbbox[1]
+    text = f"{index}/{total_frames}"
     width, height = img.size
-    text_x = (width - textwidth) / 2
-    text_y = height - textheight - 10  # Adjust the Y position
+    text_x = (width - font.getlength(text)) / 2
+    text_y = height - _worker_state["text_height"] - _worker_state["footer_margin"]
 
     draw.text((text_x, text_y), text, font=font, fill="black")
+    return img
 
-    img_path = output_dir / f"{prefix}_{index:0{len(str(total_chunks))}d}.png"
-    img.save(img_path)
+
+def generate_qr_code(
+    chunk: bytes,
+    index: int,
+    total_chunks: int,
+    output_dir: Path,
+    prefix: str,
+    payload: str = "base64",
+    codec: str = "none",
+    file_id: int = 0,
+    total_frames: int | None = None,
+) -> None:
+    """Generate a QR code image for a chunk of data.
+
+    Args:
+        chunk: Binary data to encode
+        index: Index number of this chunk
+        total_chunks: Total number of data chunks
+        output_dir: Directory to save the QR code image
+        prefix: Prefix for the output filename
+        payload: Payload encoding, one of PAYLOAD_MODES
+        codec: Compression codec the chunk was written with, one of CODECS
+        file_id: Id of the split file recorded in the frame header
+        total_frames: Total number of data and parity chunks, defaults to
+            total_chunks
+    """
+    total_frames = total_frames or total_chunks
+    img = draw_qr_code(
+        chunk, index, total_chunks, payload, codec, file_id, total_frames
+    )
+    img_path = qr_code_path(
+        output_dir, prefix, index, total_frames, _worker_state["image_format"]
+    )
+    save_image(img, img_path)
     logger.info("Saved QR code %s to %s", index, img_path)
 
 
-def get_existing_indices(output_dir: Path, prefix: str) -> list[int]:
+def generate_sheet(
+    chunks: list[tuple[bytes, int]],
+    sheet: int,
+    total_sheets: int,
+    layout: SheetLayout,
+    dpi: int,
+    output_dir: Path,
+    prefix: str,
+    total_chunks: int,
+    total_frames: int,
+    payload: str = "base64",
+    codec: str = "none",
+    file_id: int = 0,
+) -> None:
+    """Generate a sheet image tiling the QR codes of several chunks.
+
+    Args:
+        chunks: Tuples of (chunk_data, chunk_index) to place on the sheet
+        sheet: Sheet number
+        total_sheets: Total number of sheets
+        layout: Placement of the codes, see :func:`sheet_layout`
+        dpi: Resolution recorded in the sheet image
+        output_dir: Directory to save the sheet image
+        prefix: Prefix for the output filename
+        total_chunks: Total number of data chunks
+        total_frames: Total number of data and parity chunks
+        payload: Payload encoding, one of PAYLOAD_MODES
+        codec: Compression codec the chunks were written with, one of CODECS
+        file_id: Id of the split file recorded in the frame headers
+    """
+    if not _worker_state:
+        init_worker()
+    font = _worker_state["font"]
+    text_height = _worker_state["text_height"]
+
+    page = Image.new("1", layout.page_size, 1)
+    draw = ImageDraw.Draw(page)
+    for position, (chunk, index) in enumerate(chunks):
+        img = render_qr_code(chunk, index, total_chunks, payload, codec, file_id)
+        x = layout.origin[0] + position % layout.cols * layout.pitch[0]
+        y = layout.origin[1] + position // layout.cols * layout.pitch[1]
+        page.paste(img, (x, y))
+
+        text = f"{index}/{total_frames}"
+        text_x = x + (layout.code_size - font.getlength(text)) / 2
+        draw.text((text_x, y + layout.code_size), text, font=font, fill=0)
+
+    # Add footer with the sheet number and the range of codes on it
+    first, last = chunks[0][1], chunks[-1][1]
+    text = (
+        f"{prefix}  sheet {sheet}/{total_sheets}  "
+        f"codes {first}-{last} of {total_frames}"
+    )
+    width, height = layout.page_size
+    text_x = (width - font.getlength(text)) / 2
+    text_y = height - layout.margin - text_height
+    draw.text((text_x, text_y), text, font=font, fill=0)
+
+    img_path = sheet_path(
+        output_dir, prefix, sheet, total_sheets, _worker_state["image_format"]
+    )
+    save_image(page, img_path, dpi)
+    logger.info(
+        "Saved sheet %s with QR codes %s-%s to %s", sheet, first, last, img_path
+    )
+
+
+def write_pdf(sheet_paths: Iterable[Path], pdf_path: Path, dpi: int) -> None:
+    """Combine sheet images into a multi-page PDF, one sheet at a time.
+
+    Args:
+        sheet_paths: Paths to the sheet images in page order
+        pdf_path: Path to write the PDF to
+        dpi: Resolution of the sheet images
+    """
+    for page, img_path in enumerate(sheet_paths):
+        with Image.open(img_path) as img:
+            # 1-bit pages are stored losslessly with CCITT G4 instead of JPEG
+            img.save(pdf_path, "PDF", resolution=dpi, append=page > 0)
+    logger.info("Saved PDF to %s", pdf_path)
+
+
+class GifWriter:
+    """Write an animated GIF frame by frame, without buffering the frames."""
+
+    def __init__(self, path: Path, fps: float) -> None:
+        """Open the GIF file.
+
+        Args:
+            path: Path to write the GIF to
+            fps: Frames per second
+        """
+        self.fp = open(path, "wb")
+        self.duration = round(1000 / fps)
+        self.frames = 0
+
+    def write(self, img: Image.Image) -> None:
+        """Append a frame.
+
+        Args:
+            img: 1-bit frame image, all frames must have the same size
+        """
+        if not self.frames:
+            header, _ = GifImagePlugin.getheader(
+                img, info={"loop": 0, "duration": self.duration}
+            )
+            self.fp.write(b"".join(header))
+        for data in GifImagePlugin.getdata(img, duration=self.duration):
+            self.fp.write(data)
+        self.frames += 1
+
+    def close(self) -> None:
+        """Write the GIF trailer and close the file."""
+        if self.frames:
+            self.fp.write(b";")
+        self.fp.close()
+
+    def __enter__(self) -> "GifWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class VideoWriter:
+    """Write an MP4 video frame by frame with OpenCV."""
+
+    def __init__(self, path: Path, fps: float) -> None:
+        """Prepare the video file, which is opened on the first frame.
+
+        Args:
+            path: Path to write the video to
+            fps: Frames per second
+        """
+        self.path = path
+        self.fps = fps
+        self.writer: cv2.VideoWriter | None = None
+        self.frames = 0
+
+    def write(self, img: Image.Image) -> None:
+        """Append a frame.
+
+        Args:
+            img: 1-bit frame image, all frames must have the same size
+
+        Raises:
+            OSError: If OpenCV cannot open the video for writing
+        """
+        if self.writer is None:
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            self.writer = cv2.VideoWriter(
+                str(self.path), fourcc, self.fps, img.size, isColor=False
+            )
+            if not self.writer.isOpened():
+                raise OSError(f"Cannot open {self.path} for writing")
+        self.writer.write(np.asarray(img.convert("L")))
+        self.frames += 1
+
+    def close(self) -> None:
+        """Finish the video."""
+        if self.writer is not None:
+            self.writer.release()
+
+    def __enter__(self) -> "VideoWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+ANIMATION_WRITERS = {"gif": GifWriter, "mp4": VideoWriter}
+
+
+def report_failures(futures: Iterable[Future]) -> int:
+    """Log the errors of finished QR code generation futures.
+
+    Args:
+        futures: Finished futures of :func:`generate_qr_code`
+
+    Returns:
+        Number of futures that failed
+    """
+    failed = 0
+    for future in futures:
+        try:
+            future.result()
+        except Exception as err:
+            logger.error("QR code generation failed: %s", err)
+            failed += 1
+    return failed
+
+
+def get_existing_indices(
+    output_dir: Path, prefix: str, image_format: str = "png"
+) -> list[int]:
     """Get list of existing QR code indices in the output directory.
 
     Args:
         output_dir: Directory containing QR code images
         prefix: Filename prefix to match
+        image_format: Image format, one of IMAGE_FORMATS
 
     Returns:
         Sorted list of existing chunk indices
     """
-    existing_files = output_dir.glob("*.png")
+    existing_files = output_dir.glob(f"*.{image_format}")
     indices = []
     for file in existing_files:
         if file.name.startswith(prefix + "_"):
@@ -111,6 +780,27 @@ def get_existing_indices(output_dir: Path, prefix: str) -> list[int]:
     return sorted(indices)
 
 
+def parse_grid(value: str) -> tuple[int, int]:
+    """Parse a sheet grid such as 3x4.
+
+    Args:
+        value: Columns and rows separated by "x"
+
+    Returns:
+        Tuple of (columns, rows)
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a valid grid
+    """
+    try:
+        cols, rows = (int(n) for n in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid grid: {value!r}") from None
+    if cols < 1 or rows < 1:
+        raise argparse.ArgumentTypeError(f"invalid grid: {value!r}")
+    return cols, rows
+
+
 def parse_args() -> argparse.Namespace:
     """Parse command line arguments.
 
@@ -131,8 +821,119 @@ def parse_args() -> argparse.Namespace:
         "-c",
         "--chunk-size",
         type=int,
-        default=1900,
-        help="Size of each chunk in bytes (default: 1900).",
+        default=None,
+        help="Size of each chunk in bytes (default: the capacity of one QR code, "
+        f"or {LEGACY_CHUNK_SIZE} for base64 payloads).",
+    )
+    parser.add_argument(
+        "-p",
+        "--payload",
+        choices=PAYLOAD_MODES,
+        default="base64",
+        help="Payload encoding: base64 text, or raw bytes in byte mode which "
+        "fit a third more data per QR code (default: base64).",
+    )
+    parser.add_argument(
+        "-z",
+        "--compress",
+        choices=CODECS,
+        default="none",
+        help="Compress the file before splitting it, qrcode-merge decompresses "
+        "it transparently (default: none).",
+    )
+    parser.add_argument(
+        "-P",
+        "--parity",
+        type=int,
+        choices=range(0, 101),
+        default=0,
+        metavar="PERCENT",
+        help="Add Reed-Solomon parity QR codes worth PERCENT%% of the data "
+        "QR codes (0-100), from which qrcode-merge rebuilds lost ones "
+        "(default: 0).",
+    )
+    parser.add_argument(
+        "--qr-version",
+        type=int,
+        choices=range(1, 41),
+        default=40,
+        metavar="{1..40}",
+        help="QR code version, larger versions hold more data (default: 40).",
+    )
+    parser.add_argument(
+        "-e",
+        "--error-correction",
+        choices=ERROR_CORRECTION_LEVELS,
+        default="L",
+        help="QR code error correction level (default: L).",
+    )
+    parser.add_argument(
+        "-S",
+        "--sheet",
+        choices=PAGE_SIZES_MM,
+        default=None,
+        help="Tile the QR codes on page images of this paper size instead of "
+        "writing one image per QR code.",
+    )
+    parser.add_argument(
+        "--grid",
+        type=parse_grid,
+        default=None,
+        metavar="COLSxROWS",
+        help="Number of QR codes per sheet (default: as many as fit).",
+    )
+    parser.add_argument(
+        "--dpi",
+        type=int,
+        default=DEFAULT_DPI,
+        help=f"Resolution of the sheets (default: {DEFAULT_DPI}).",
+    )
+    parser.add_argument(
+        "--box-size",
+        type=int,
+        default=None,
+        help=f"Size of a QR code module in pixels (default: {DEFAULT_BOX_SIZE}, "
+        f"{ANIMATION_BOX_SIZE} in animations, or DPI/75 on sheets).",
+    )
+    parser.add_argument(
+        "--pdf",
+        action="store_true",
+        help="Also combine the sheets into a multi-page PDF.",
+    )
+    parser.add_argument(
+        "-A",
+        "--animate",
+        choices=ANIMATION_WRITERS,
+        default=None,
+        help="Write the QR codes as the frames of one looping animation "
+        "instead of separate images.",
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=DEFAULT_FPS,
+        help=f"Frames per second of animations (default: {DEFAULT_FPS:g}).",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=IMAGE_FORMATS,
+        default="png",
+        help="Format of the 1-bit output images (default: png).",
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        choices=range(10),
+        default=DEFAULT_COMPRESS_LEVEL,
+        metavar="{0..9}",
+        help="PNG zlib compression level, lower is faster "
+        f"(default: {DEFAULT_COMPRESS_LEVEL}).",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Let PNG search for the smallest encoding, slower but smaller.",
     )
     parser.add_argument(
         "-C",
@@ -165,60 +966,484 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def main() -> None:
-    """Main function to split a file into QR code images."""
-    args = parse_args()
+def verify_existing(
+    executor: ProcessPoolExecutor, output_dir: Path, prefix: str, manifest: dict
+) -> set[int]:
+    """Find the existing QR code or sheet images that hold intact frames.
 
-    file_path = Path(args.file)
-    if not file_path.exists():
-        logger.error("Input file does not exist: %s", file_path)
-        return
+    Args:
+        executor: Pool to decode the images in
+        output_dir: Directory containing the QR code images
+        prefix: Prefix of the image filenames
+        manifest: Manifest of the file being split
+
+    Returns:
+        Numbers of the images that do not need to be generated again
+    """
+    total_frames = len(manifest["crc32"])
+    image_format = manifest["image_format"]
+    if manifest["sheet"]:
+        cols, rows = manifest["sheet"]["grid"]
+        per_sheet = cols * rows
+        total = math.ceil(total_frames / per_sheet)
+        numbers = get_existing_indices(output_dir, f"{prefix}_sheet", image_format)
+        numbers = [n for n in numbers if n <= total]
+        paths = [
+            sheet_path(output_dir, prefix, n, total, image_format) for n in numbers
+        ]
+        expected = [
+            range((n - 1) * per_sheet + 1, min(n * per_sheet, total_frames) + 1)
+            for n in numbers
+        ]
+        kind = "sheets"
+    else:
+        total = total_frames
+        numbers = get_existing_indices(output_dir, prefix, image_format)
+        numbers = [n for n in numbers if n <= total]
+        paths = [
+            qr_code_path(output_dir, prefix, n, total, image_format) for n in numbers
+        ]
+        expected = [[n] for n in numbers]
+        kind = "QR codes"
 
-    total_chunks = math.ceil(file_path.stat().st_size / args.chunk_size)
+    file_id = int(manifest["file_id"], 16)
+    results = executor.map(verify_qr_code, paths, repeat(file_id), expected)
+    valid = {number for number, ok in zip(numbers, results) if ok}
+    if len(valid) < len(numbers):
+        logger.warning(
+            "Regenerating %d damaged %s: %s",
+            len(numbers) - len(valid),
+            kind,
+            sorted(set(numbers) - valid),
+        )
+    logger.info("Found %d intact %s of %d.", len(valid), kind, total)
+    return valid
 
-    if args.calc:
-        logger.info("Total QR code files needed: %d", total_chunks)
-        return
 
-    logger.info("Splitting %s into %d QR codes.", file_path, total_chunks)
+def iter_batches(
+    items: Iterable[tuple[bytes, int]], size: int
+) -> Iterator[list[tuple[bytes, int]]]:
+    """Group chunks into lists of at most size items.
 
-    output_dir = Path(args.output_dir) / file_path.stem
+    Args:
+        items: Tuples of (chunk_data, chunk_index)
+        size: Maximum number of chunks per list
+
+    Yields:
+        Lists of consecutive chunks
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_frame_chunks(
+    source: Path, chunk_size: int, parity_path: Path | None = None
+) -> Iterator[tuple[bytes, int]]:
+    """Iterate over the data chunks followed by the parity chunks.
+
+    Args:
+        source: Path to the file to split, compressed if requested
+        chunk_size: Size of each data chunk in bytes
+        parity_path: Path to the parity records written by
+            :func:`write_parity`, if any
+
+    Yields:
+        Tuples of (chunk_data, chunk_index)
+    """
+    index = 0
+    for chunk, index in iter_file_into_chunks(source, chunk_size):
+        yield chunk, index
+    if parity_path is not None:
+        record_size = PARITY_HEADER.size + chunk_size
+        for record, i in iter_file_into_chunks(parity_path, record_size):
+            yield record, index + i
+
+
+def split_file(
+    source: Path,
+    prefix: str,
+    manifest: dict,
+    args: argparse.Namespace,
+    parity_path: Path | None = None,
+    layout: SheetLayout | None = None,
+) -> bool:
+    """Generate the QR code or sheet images for a file in parallel.
+
+    With --resume, only the images that are missing or do not hold intact
+    frames of this file are generated.
+
+    Args:
+        source: Path to the file to split, compressed if requested
+        prefix: Prefix for the output directory and filenames
+        manifest: Manifest of the file, see :func:`build_manifest`
+        args: Parsed command line arguments
+        parity_path: Path to the parity records written by
+            :func:`write_parity`, if any
+        layout: Sheet layout, or None to write one image per QR code
+
+    Returns:
+        True if every image was generated
+    """
+    output_dir = Path(args.output_dir) / prefix
     output_dir.mkdir(parents=True, exist_ok=True)
 
     if args.resume:
-        existing_indices = get_existing_indices(output_dir, file_path.stem)
+        previous = load_manifest(output_dir)
+        if previous is not None and previous != manifest:
+            logger.error(
+                "%s holds QR codes of a different file or settings, "
+                "run without --resume to overwrite them",
+                output_dir,
+            )
+            return False
+    write_manifest(output_dir, manifest)
+
+    total_chunks = manifest["total"]
+    total_frames = len(manifest["crc32"])
+    file_id = int(manifest["file_id"], 16)
+    chunks = iter_frame_chunks(source, manifest["chunk_size"], parity_path)
+    if layout is None:
+        units = ((index, [(chunk, index)]) for chunk, index in chunks)
+        font_size = None
     else:
-        existing_indices = []
+        total_sheets = math.ceil(total_frames / layout.per_sheet)
+        units = enumerate(iter_batches(chunks, layout.per_sheet), 1)
+        font_size = sheet_font_size(args.dpi)
 
-    last_index = existing_indices[-1] if existing_indices else 0
+    # Bound the chunks in flight so memory stays constant regardless of the
+    # input size, instead of pinning every chunk in the call queue up front
+    max_pending = 4 * (args.workers or os.cpu_count() or 1)
 
-    count = 0
-    futures = []
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
-        for chunk, index in iter_file_into_chunks(file_path, args.chunk_size):
-            if index <= last_index:
+    count = failed = 0
+    pending: set[Future] = set()
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=init_worker,
+        initargs=(
+            args.qr_version,
+            args.error_correction,
+            manifest["box_size"],
+            font_size,
+            manifest["image_format"],
+            args.compress_level,
+            args.optimize,
+        ),
+    ) as executor:
+        if args.resume:
+            valid = verify_existing(executor, output_dir, prefix, manifest)
+        else:
+            valid = set()
+
+        for number, batch in units:
+            if number in valid:
                 continue
 
             count += 1
             if count > args.limit:
                 break
 
-            futures.append(
-                executor.submit(
+            if layout is None:
+                future = executor.submit(
                     generate_qr_code,
+                    batch[0][0],
+                    number,
+                    total_chunks,
+                    output_dir,
+                    prefix,
+                    args.payload,
+                    args.compress,
+                    file_id,
+                    total_frames,
+                )
+            else:
+                future = executor.submit(
+                    generate_sheet,
+                    batch,
+                    number,
+                    total_sheets,
+                    layout,
+                    args.dpi,
+                    output_dir,
+                    prefix,
+                    total_chunks,
+                    total_frames,
+                    args.payload,
+                    args.compress,
+                    file_id,
+                )
+            pending.add(future)
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                failed += report_failures(done)
+
+        done, _ = wait(pending)
+        failed += report_failures(done)
+
+    if layout is not None and args.pdf:
+        paths = [
+            sheet_path(output_dir, prefix, n, total_sheets, manifest["image_format"])
+            for n in range(1, total_sheets + 1)
+        ]
+        if all(path.exists() for path in paths):
+            write_pdf(paths, output_dir / f"{prefix}.pdf", args.dpi)
+        else:
+            logger.warning("Not writing the PDF until all sheets are generated")
+
+    return not failed
+
+
+def animate_file(
+    source: Path,
+    prefix: str,
+    manifest: dict,
+    args: argparse.Namespace,
+    parity_path: Path | None = None,
+) -> None:
+    """Render the QR codes of a file as frames of one animation.
+
+    Frames are rendered in parallel but handed to the writer in index
+    order as they complete, so only a bounded window of them is in memory.
+
+    Args:
+        source: Path to the file to split, compressed if requested
+        prefix: Prefix for the output directory and filenames
+        manifest: Manifest of the file, see :func:`build_manifest`
+        args: Parsed command line arguments
+        parity_path: Path to the parity records written by
+            :func:`write_parity`, if any
+    """
+    output_dir = Path(args.output_dir) / prefix
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_manifest(output_dir, manifest)
+
+    total_chunks = manifest["total"]
+    total_frames = len(manifest["crc32"])
+    file_id = int(manifest["file_id"], 16)
+    max_pending = 4 * (args.workers or os.cpu_count() or 1)
+
+    anim_path = output_dir / f"{prefix}.{args.animate}"
+    pending: deque[Future] = deque()
+    with (
+        ANIMATION_WRITERS[args.animate](anim_path, args.fps) as writer,
+        ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=init_worker,
+            initargs=(args.qr_version, args.error_correction, manifest["box_size"]),
+        ) as executor,
+    ):
+        chunks = iter_frame_chunks(source, manifest["chunk_size"], parity_path)
+        for count, (chunk, index) in enumerate(chunks, 1):
+            if count > args.limit:
+                break
+            pending.append(
+                executor.submit(
+                    draw_qr_code,
                     chunk,
                     index,
                     total_chunks,
-                    output_dir,
-                    file_path.stem,
+                    args.payload,
+                    args.compress,
+                    file_id,
+                    total_frames,
                 )
             )
+            if len(pending) >= max_pending:
+                writer.write(pending.popleft().result())
+        while pending:
+            writer.write(pending.popleft().result())
 
-        for future in as_completed(futures):
-            try:
-                future.result()
-            except Exception as err:
-                logger.error("QR code generation failed: %s", err)
+    logger.info("Saved %d frames at %s fps to %s", writer.frames, args.fps, anim_path)
+
+
+def build_manifest(
+    file_path: Path,
+    source: Path,
+    chunk_size: int,
+    args: argparse.Namespace,
+    parity_path: Path | None = None,
+    box_size: int = DEFAULT_BOX_SIZE,
+    layout: SheetLayout | None = None,
+) -> dict:
+    """Describe a split file and the settings it is split with.
+
+    Args:
+        file_path: Path to the input file
+        source: Path to the file to split, compressed if requested
+        chunk_size: Size of each chunk in bytes
+        args: Parsed command line arguments
+        parity_path: Path to the parity records written by
+            :func:`write_parity`, if any
+        box_size: Size of a QR code module in pixels
+        layout: Sheet layout, or None for one image per QR code
+
+    Returns:
+        Manifest with the whole-file SHA-256 and the CRC32 of every data
+        and parity chunk
+    """
+    sha256 = file_sha256(file_path)
+    crc32 = chunk_crcs(source, chunk_size)
+    total = len(crc32)
+    if parity_path is not None:
+        crc32 += chunk_crcs(parity_path, PARITY_HEADER.size + chunk_size)
+    return {
+        "name": file_path.name,
+        "size": file_path.stat().st_size,
+        "sha256": sha256,
+        "file_id": sha256[:8],
+        "codec": args.compress,
+        "payload": args.payload,
+        "qr_version": args.qr_version,
+        "error_correction": args.error_correction,
+        "box_size": box_size,
+        "image_format": args.format,
+        "sheet": layout
+        and {"paper": args.sheet, "dpi": args.dpi, "grid": [layout.cols, layout.rows]},
+        "chunk_size": chunk_size,
+        "parity": args.parity,
+        "total": total,
+        "crc32": crc32,
+    }
+
+
+def main() -> None:
+    """Main function to split a file into QR code images."""
+    args = parse_args()
+
+    file_path = Path(args.file)
+    if not file_path.exists():
+        logger.error("Input file does not exist: %s", file_path)
+        return
+
+    capacity = payload_capacity(args.qr_version, args.error_correction, args.payload)
+    if args.parity:
+        # Parity chunks are as large as data chunks plus their own header
+        capacity -= PARITY_HEADER.size
+    if capacity < 1:
+        logger.error(
+            "Version %d-%s QR codes are too small for %s payloads",
+            args.qr_version,
+            args.error_correction,
+            args.payload,
+        )
+        return
+
+    chunk_size = args.chunk_size
+    if chunk_size is None:
+        chunk_size = capacity
+        if args.payload == "base64":
+            chunk_size = min(chunk_size, LEGACY_CHUNK_SIZE)
+    elif not 0 < chunk_size <= capacity:
+        logger.error(
+            "Chunk size must be between 1 and %d bytes for %s payloads in "
+            "version %d-%s QR codes",
+            capacity,
+            args.payload,
+            args.qr_version,
+            args.error_correction,
+        )
+        return
+
+    layout = None
+    if args.sheet:
+        box_size = args.box_size or max(1, args.dpi // 75)
+        font = load_font(sheet_font_size(args.dpi))
+        try:
+            layout = sheet_layout(
+                args.sheet,
+                args.dpi,
+                box_size,
+                args.qr_version,
+                measure_text_height(font),
+                args.grid,
+            )
+        except ValueError as err:
+            logger.error("%s", err)
+            return
+    elif args.pdf or args.grid:
+        logger.error("--pdf and --grid require --sheet")
+        return
+    elif args.animate:
+        box_size = args.box_size or ANIMATION_BOX_SIZE
+    else:
+        box_size = args.box_size or DEFAULT_BOX_SIZE
+
+    if args.animate and (args.sheet or args.resume):
+        logger.error("--animate cannot be combined with --sheet or --resume")
+        return
+    if args.fps <= 0:
+        logger.error("--fps must be positive")
+        return
+
+    with tempfile.TemporaryDirectory(prefix="qrcode-split-") as tmpdir:
+        source = file_path
+        if args.compress != "none":
+            source = Path(tmpdir) / f"{file_path.name}.{args.compress}"
+            compress_file(file_path, source, args.compress)
+            logger.info(
+                "Compressed %s with %s from %d to %d bytes.",
+                file_path,
+                args.compress,
+                file_path.stat().st_size,
+                source.stat().st_size,
+            )
+
+        total_chunks = math.ceil(source.stat().st_size / chunk_size)
+        total_parity = sum(parity_layout(total_chunks, args.parity)[1])
+
+        total_frames = total_chunks + total_parity
+
+        if args.calc:
+            # Scanning an animation shows one QR code per frame
+            seconds = total_frames / args.fps
+            logger.info(
+                "Streaming %d frames at %g fps takes %.1fs, %.0f bytes/sec of "
+                "%s with version %d-%s QR codes",
+                total_frames,
+                args.fps,
+                seconds,
+                file_path.stat().st_size / seconds if seconds else 0,
+                file_path.name,
+                args.qr_version,
+                args.error_correction,
+            )
+            if layout is None:
+                logger.info("Total QR code files needed: %d", total_frames)
+            else:
+                logger.info(
+                    "Total QR codes needed: %d on %d sheets of %dx%d",
+                    total_frames,
+                    math.ceil(total_frames / layout.per_sheet),
+                    layout.cols,
+                    layout.rows,
+                )
+            return
+
+        logger.info(
+            "Splitting %s into %d QR codes of %d bytes and %d parity QR codes.",
+            file_path,
+            total_chunks,
+            chunk_size,
+            total_parity,
+        )
+        parity_path = None
+        if total_parity:
+            parity_path = Path(tmpdir) / f"{file_path.name}.parity"
+            write_parity(source, parity_path, chunk_size, args.parity)
+        manifest = build_manifest(
+            file_path, source, chunk_size, args, parity_path, box_size, layout
+        )
+        if args.animate:
+            animate_file(source, file_path.stem, manifest, args, parity_path)
+        elif not split_file(
+            source, file_path.stem, manifest, args, parity_path, layout
+        ):
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -9,13 +9,41 @@ parallel processing.
 
 import argparse
 import hashlib
+import heapq
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
 import os
-from concurrent.futures import ProcessPoolExecutor
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import ExitStack, contextmanager
+from functools import partial
 from pathlib import Path
+from typing import TextIO
 
 import argcomplete
-from chaos_utils.gitignore import iter_files_with_respect_gitignore
+from chaos_utils.gitignore import (
+    iter_files_with_respect_gitignore,
+    should_path_ignore,
+)
 from chaos_utils.logging import setup_logger
+from pathspec import GitIgnoreSpec
 
 logger = setup_logger(__name__)
 
@@ -28,76 +56,1669 @@ SUPPORTED_DIGESTS = {
     "sha512": hashlib.sha512,
 }
 
+# Tree mode: files above a size threshold are split into fixed-size segments
+# that are hashed in parallel. The top-level digest is
+#
+#     H(H(segment_0) || H(segment_1) || ... || H(segment_n-1))
+#
+# where H is the selected algorithm and H(segment_i) are raw (binary) digests.
+# Manifest entries carry a "tree-<segment_size>:" prefix so they can never be
+# mistaken for (or verified as) a plain digest of the file.
+TREE_PREFIX = "tree-"
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
 
-def file_digest(file_path: Path, digest: str) -> tuple[str, Path] | None:
-    """Calculate the hash digest of a file.
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+ENGINES = ("processes", "threads")
+DEFAULT_ENGINE = "processes"
+
+# Number of small files hashed per executor task
+TASK_BATCH_SIZE = 16
+# Manifest entries kept in memory before a sorted run is spilled to disk
+DEFAULT_BATCH_SIZE = 100_000
+# Runs merged at once, bounding the number of open files
+MAX_MERGE_RUNS = 256
+# Directory batches the walker thread may queue ahead of hashing
+WALK_QUEUE_SIZE = 64
+
+MiB = 1024 * 1024
+
+# Bytes hashed from each end of a file by the duplicate finder prefilter
+DEFAULT_EDGE_SIZE = 64 * 1024
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+# Files modified this close to the start of a run are not cached, since a
+# later write within the same mtime granularity would go unnoticed.
+RACY_WINDOW_NS = 2_000_000_000
+
+
+def parse_size(text: str) -> int:
+    """Parse a size with an optional binary unit suffix, like ``64M``.
+
+    Args:
+        text: Size string, a number optionally followed by K, M, G or T
+
+    Returns:
+        Size in bytes
+    """
+    text = text.strip().upper().removesuffix("IB").removesuffix("B")
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+    try:
+        size = int(float(text.removesuffix(unit)) * SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}") from None
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"size must be positive: {text!r}")
+    return size
+
+
+def make_executor(engine: str = DEFAULT_ENGINE, workers: int | None = None) -> Executor:
+    """Create the executor used for hashing.
+
+    The thread engine avoids pickling a path in and a result out for every
+    file; hashlib releases the GIL while hashing large buffers, so threads
+    scale well once blocks are big enough.
+
+    Process workers are started from a fork server where available rather
+    than forked from this process: workers start lazily on the first
+    submit, by which time the walker and progress threads may be running
+    and holding locks that a forked child would inherit locked.
+
+    Args:
+        engine: Either "processes" or "threads"
+        workers: Number of parallel workers
+
+    Returns:
+        A ProcessPoolExecutor or ThreadPoolExecutor
+    """
+    if engine == "threads":
+        return ThreadPoolExecutor(max_workers=workers)
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+
+
+def cache_path_for(directory: Path) -> Path:
+    """Return the path of the hash cache sidecar for a directory.
+
+    Args:
+        directory: Directory being processed
+
+    Returns:
+        Path of the cache file, next to the ``<dir>.<digest>`` output
+    """
+    return directory.with_name(f"{directory.name}.shasum-cache")
+
+
+def _sqlite_int(value: int) -> int:
+    """Fold an unsigned 64-bit stat field into SQLite's signed INTEGER range."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class HashCache:
+    """Persistent digest cache keyed by (device, inode, size, mtime_ns, digest).
+
+    Entries are stored in a SQLite database. A lookup only hits when the
+    size and mtime of the file still match the cached entry; entries not
+    seen during a run are pruned when the run finishes.
+    """
+
+    def __init__(self, path: Path, rebuild: bool = False) -> None:
+        """Open (and create if needed) the cache database.
+
+        Args:
+            path: Path to the cache database file
+            rebuild: If True, discard all existing entries
+        """
+        self.path = path
+        self.run_id = time.time_ns()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        if rebuild:
+            self.conn.execute("DROP TABLE IF EXISTS hashes")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS hashes (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hexdigest TEXT NOT NULL,
+                run_id INTEGER NOT NULL,
+                PRIMARY KEY (dev, ino, digest)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def get(self, st: os.stat_result, digest: str) -> str | None:
+        """Look up the cached digest of a file.
+
+        Args:
+            st: Stat result of the file
+            digest: Name of the hash algorithm
+
+        Returns:
+            Cached hex digest, or None if missing or stale
+        """
+        key = (_sqlite_int(st.st_dev), _sqlite_int(st.st_ino), digest)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, hexdigest FROM hashes"
+            " WHERE dev = ? AND ino = ? AND digest = ?",
+            key,
+        ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE hashes SET run_id = ? WHERE dev = ? AND ino = ? AND digest = ?",
+            (self.run_id, *key),
+        )
+        return row[2]
+
+    def put(self, st: os.stat_result, digest: str, hexdigest: str) -> None:
+        """Store the digest of a file.
+
+        Args:
+            st: Stat result of the file, taken before hashing
+            digest: Name of the hash algorithm
+            hexdigest: Hex digest of the file content
+        """
+        if st.st_mtime_ns >= self.run_id - RACY_WINDOW_NS:
+            logger.debug("Not caching recently modified file (ino %d)", st.st_ino)
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                _sqlite_int(st.st_dev),
+                _sqlite_int(st.st_ino),
+                digest,
+                st.st_size,
+                st.st_mtime_ns,
+                hexdigest,
+                self.run_id,
+            ),
+        )
+
+    def prune(self, digest: str) -> int:
+        """Remove entries of a digest that were not seen during this run.
+
+        Tree mode entries of the same algorithm are pruned as well.
+
+        Args:
+            digest: Name of the hash algorithm
+
+        Returns:
+            Number of removed entries
+        """
+        cursor = self.conn.execute(
+            "DELETE FROM hashes WHERE (digest = ? OR digest LIKE ?) AND run_id != ?",
+            (digest, f"{digest}/%", self.run_id),
+        )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Commit pending changes and close the database."""
+        self.conn.commit()
+        self.conn.close()
+
+
+_worker_local = threading.local()
+
+
+def _read_buffer(block_size: int) -> memoryview:
+    """Return the preallocated read buffer of the current worker.
+
+    Args:
+        block_size: Size of the buffer in bytes
+
+    Returns:
+        Writable view of a buffer reused across files by this worker
+    """
+    buffer = getattr(_worker_local, "buffer", None)
+    if buffer is None or len(buffer) != block_size:
+        buffer = _worker_local.buffer = bytearray(block_size)
+    return memoryview(buffer)
+
+
+def _update_hashers(
+    f: io.RawIOBase,
+    hashers: list,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    length: int | None = None,
+) -> None:
+    """Feed a file to all hashers with ``readinto`` on the worker buffer.
+
+    Args:
+        f: Unbuffered binary file object
+        hashers: Hash objects to update
+        block_size: Read block size in bytes
+        length: Maximum number of bytes to read, None to read until EOF
+    """
+    view = _read_buffer(block_size)
+    while length is None or length > 0:
+        target = view if length is None or length >= block_size else view[:length]
+        n = f.readinto(target)
+        if not n:
+            break
+        chunk = view[:n]
+        for hasher in hashers:
+            hasher.update(chunk)
+        if length is not None:
+            length -= n
+
+
+def _update_hashers_mmap(
+    f, hashers: list, block_size: int = DEFAULT_BLOCK_SIZE
+) -> None:
+    """Feed a memory-mapped file to all hashers without copying.
+
+    Args:
+        f: Binary file object of a non-empty file
+        hashers: Hash objects to update
+        block_size: Update block size in bytes
+    """
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            for offset in range(0, len(view), block_size):
+                chunk = view[offset : offset + block_size]
+                for hasher in hashers:
+                    hasher.update(chunk)
+                chunk.release()
+        finally:
+            view.release()
+
+
+def _as_digests(digests: str | Sequence[str]) -> tuple[str, ...]:
+    """Normalise one hash algorithm name or a sequence of them to a tuple.
+
+    Args:
+        digests: Name of a hash algorithm, or names of several
+
+    Returns:
+        Tuple of hash algorithm names
+    """
+    if isinstance(digests, str):
+        return (digests,)
+    return tuple(digests)
+
+
+def file_digest(
+    file_path: Path,
+    digests: str | Sequence[str],
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    mmap_threshold: int | None = None,
+) -> tuple[tuple[str, ...], Path] | None:
+    """Calculate one or more hash digests of a file in a single read pass.
+
+    Every block read from the file is fed to all hashers, so requesting
+    several algorithms costs no extra I/O.
 
     Args:
         file_path: Path to the file to hash
-        digest: Name of the hash algorithm to use
+        digests: Names of the hash algorithms to use, or the name of one
+        block_size: Read block size in bytes
+        mmap_threshold: Files of at least this many bytes are memory-mapped
+            instead of read, None to never use mmap
 
     Returns:
-        Tuple of (hash_value, file_path) if successful, None on error
+        Tuple of (hash_values, file_path) if successful, None on error,
+        where hash_values follows the order of ``digests``
     """
+    digests = _as_digests(digests)
     try:
-        with open(file_path, "rb") as f:
-            hasher = SUPPORTED_DIGESTS[digest]()
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                hasher.update(chunk)
-            hexdigest = hasher.hexdigest()
-        return (hexdigest, file_path)
+        with open(file_path, "rb", buffering=0) as f:
+            hashers = [SUPPORTED_DIGESTS[digest]() for digest in digests]
+            size = os.fstat(f.fileno()).st_size
+            # Empty files cannot be memory-mapped
+            if mmap_threshold is not None and size and size >= mmap_threshold:
+                _update_hashers_mmap(f, hashers, block_size)
+            else:
+                _update_hashers(f, hashers, block_size)
+            hexdigests = tuple(hasher.hexdigest() for hasher in hashers)
+        return (hexdigests, file_path)
     except Exception as err:
         logger.error("Error processing %s: %s", file_path, err)
         return None  # Explicitly return None for later filtering
 
 
+def segment_digest(
+    file_path: Path,
+    offset: int,
+    length: int,
+    digests: Sequence[str],
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> tuple[bytes, ...]:
+    """Calculate the raw digests of one segment of a file.
+
+    Args:
+        file_path: Path to the file to hash
+        offset: Offset of the segment in bytes
+        length: Length of the segment in bytes
+        digests: Names of the hash algorithms to use
+        block_size: Read block size in bytes
+
+    Returns:
+        Raw digests of the segment in the order of ``digests``
+    """
+    with open(file_path, "rb", buffering=0) as f:
+        f.seek(offset)
+        hashers = [SUPPORTED_DIGESTS[digest]() for digest in digests]
+        _update_hashers(f, hashers, block_size, length)
+    return tuple(hasher.digest() for hasher in hashers)
+
+
+def submit_tree_digest(
+    executor: Executor,
+    file_path: Path,
+    size: int,
+    digests: Sequence[str],
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> list[Future]:
+    """Submit the segments of a file to an executor for tree mode hashing.
+
+    Args:
+        executor: Executor to hash the segments on
+        file_path: Path to the file to hash
+        size: Size of the file in bytes
+        digests: Names of the hash algorithms to use
+        segment_size: Size of each segment in bytes
+        block_size: Read block size in bytes
+
+    Returns:
+        Futures of :func:`segment_digest`, in segment order
+    """
+    return [
+        executor.submit(
+            segment_digest,
+            file_path,
+            offset,
+            min(segment_size, size - offset),
+            digests,
+            block_size,
+        )
+        for offset in range(0, max(size, 1), segment_size)
+    ]
+
+
+def combine_tree_digest(
+    futures: list[Future],
+    file_path: Path,
+    digests: Sequence[str],
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+) -> tuple[tuple[str, ...], Path] | None:
+    """Combine segment digests into tree mode manifest values.
+
+    Args:
+        futures: Futures returned by :func:`submit_tree_digest`
+        file_path: Path to the hashed file
+        digests: Names of the hash algorithms used
+        segment_size: Size of each segment in bytes
+
+    Returns:
+        Tuple of (hash_values, file_path) like :func:`file_digest`, where each
+        hash value is ``tree-<segment_size>:<hex>``, None on error
+    """
+    try:
+        leaves = [future.result() for future in futures]
+    except Exception as err:
+        logger.error("Error processing %s: %s", file_path, err)
+        return None
+
+    hexdigests = []
+    for i, digest in enumerate(digests):
+        hasher = SUPPORTED_DIGESTS[digest]()
+        for leaf in leaves:
+            hasher.update(leaf[i])
+        hexdigests.append(f"{TREE_PREFIX}{segment_size}:{hasher.hexdigest()}")
+    return (tuple(hexdigests), file_path)
+
+
+def cache_keys(
+    digests: Sequence[str], tree_segment_size: int | None
+) -> tuple[str, ...]:
+    """Return the hash cache keys of the digests of a file.
+
+    Args:
+        digests: Names of the hash algorithms
+        tree_segment_size: Segment size if the file is hashed in tree mode
+
+    Returns:
+        Cache keys in the order of ``digests``
+    """
+    if tree_segment_size is None:
+        return tuple(digests)
+    return tuple(f"{digest}/{TREE_PREFIX}{tree_segment_size}" for digest in digests)
+
+
+def lookup_cached(
+    cache: HashCache, st: os.stat_result, digests: Sequence[str]
+) -> tuple[str, ...] | None:
+    """Look up all requested digests of a file in the cache.
+
+    Args:
+        cache: Hash cache to query
+        st: Stat result of the file
+        digests: Names of the hash algorithms
+
+    Returns:
+        Cached hex digests in the order of ``digests``, or None if any of
+        them is missing or stale
+    """
+    hexdigests = []
+    for digest in digests:
+        hexdigest = cache.get(st, digest)
+        if hexdigest is None:
+            return None
+        hexdigests.append(hexdigest)
+    return tuple(hexdigests)
+
+
+def hash_files(
+    file_paths: list[Path],
+    digests: Sequence[str],
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    mmap_threshold: int | None = None,
+) -> tuple[str, list[tuple[tuple[tuple[str, ...], Path] | None, float]]]:
+    """Hash a batch of files in a single worker task.
+
+    Batching amortises the per-task submission overhead of the executor,
+    like the ``chunksize`` of ``Executor.map``.
+
+    Args:
+        file_paths: Paths of the files to hash
+        digests: Names of the hash algorithms to use
+        block_size: Read block size in bytes
+        mmap_threshold: Files of at least this many bytes are memory-mapped,
+            None to never use mmap
+
+    Returns:
+        Tuple of (worker, timed_results), where worker identifies the
+        process and thread that ran the task and timed_results holds a
+        (result of :func:`file_digest`, seconds) tuple per file, in the
+        order of ``file_paths``
+    """
+    worker = f"{os.getpid()}:{threading.get_ident()}"
+    timed_results = []
+    for file_path in file_paths:
+        started = time.perf_counter()
+        result = file_digest(file_path, digests, block_size, mmap_threshold)
+        timed_results.append((result, time.perf_counter() - started))
+    return (worker, timed_results)
+
+
+def scandir_walk(
+    directory: Path, respect_gitignore: bool = False
+) -> Iterator[list[tuple[Path, os.stat_result]]]:
+    """Walk a directory tree with ``os.scandir``, one batch per directory.
+
+    Follows the semantics of ``iter_files_with_respect_gitignore``: symlinks
+    to directories are not descended into, symlinks to files are reported
+    with the stat of their target, and with ``respect_gitignore`` every
+    ``.gitignore`` applies to its own directory and below. ``.gitignore``
+    files are loaded as their directories are reached rather than in a
+    separate pass over the tree.
+
+    Args:
+        directory: Root directory to walk
+        respect_gitignore: Whether to skip paths ignored by .gitignore files
+
+    Yields:
+        Lists of (file_path, stat_result) tuples, one per directory
+    """
+    specs: dict[Path, GitIgnoreSpec] = {}
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        if respect_gitignore:
+            gitignore = current / ".gitignore"
+            if gitignore.is_file():
+                with gitignore.open("r") as f:
+                    specs[current] = GitIgnoreSpec.from_lines(f)
+
+        files = []
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    path = Path(entry.path)
+                    if respect_gitignore and should_path_ignore(path, specs):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                pending.append(path)
+                            continue
+                        files.append((path, entry.stat()))
+                    except OSError as err:
+                        logger.error("Error processing %s: %s", path, err)
+        except OSError as err:
+            logger.error("Error walking %s: %s", current, err)
+        if files:
+            yield files
+
+
+def iter_walk_threaded(
+    directory: Path,
+    respect_gitignore: bool = False,
+    max_batches: int = WALK_QUEUE_SIZE,
+    monitor: "ProgressMonitor | None" = None,
+) -> Iterator[tuple[Path, os.stat_result]]:
+    """Walk a directory tree on a background thread.
+
+    The walker feeds per-directory batches through a bounded queue, so
+    hashing starts with the first directory and walk latency is hidden
+    behind hashing, while memory stays bounded by ``max_batches``.
+
+    Args:
+        directory: Root directory to walk
+        respect_gitignore: Whether to skip paths ignored by .gitignore files
+        max_batches: Maximum number of directory batches queued ahead
+        monitor: Progress monitor to record the walk duration
+
+    Yields:
+        Tuples of (file_path, stat_result)
+    """
+    batches: queue.Queue = queue.Queue(max_batches)
+    stop = threading.Event()
+    done = object()
+
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def walk() -> None:
+        started = time.monotonic()
+        try:
+            for batch in scandir_walk(directory, respect_gitignore):
+                if not put(batch):
+                    return
+        except Exception as err:
+            logger.error("Error walking %s: %s", directory, err)
+        finally:
+            if monitor is not None:
+                monitor.phases["walk"] = time.monotonic() - started
+            put(done)
+
+    walker = threading.Thread(target=walk, name="shasum-list-walker", daemon=True)
+    walker.start()
+    try:
+        while (batch := batches.get()) is not done:
+            yield from batch
+    finally:
+        stop.set()
+        walker.join()
+
+
+class ProgressMonitor:
+    """Collect hashing metrics and periodically report progress to stderr.
+
+    Counters are updated by the thread driving the pipeline; when an
+    interval is set, a daemon thread prints a status line every
+    ``interval`` seconds. A monitor without interval only collects the
+    metrics used by ``--stats-json``. The status thread runs before process
+    workers are started, which is safe because :func:`make_executor` never
+    forks them from this process.
+    """
+
+    def __init__(self, interval: float | None = None, slowest: int = 10) -> None:
+        """Initialize the monitor.
+
+        Args:
+            interval: Seconds between status lines, None to stay silent
+            slowest: Number of slowest files to keep for the final stats
+        """
+        self.interval = interval
+        self.slowest_count = slowest
+        self.started = time.monotonic()
+        self.files_seen = self.bytes_seen = 0
+        self.files_done = self.bytes_done = 0
+        self.files_cached = self.bytes_hashed = 0
+        self.walk_finished = False
+        self.phases: dict[str, float] = defaultdict(float)
+        self.worker_busy: dict[str, float] = defaultdict(float)
+        self.slowest: list[tuple[float, str, int]] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> "ProgressMonitor":
+        if self.interval:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.report()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Accumulate the time spent in a block under a phase name.
+
+        Args:
+            name: Phase name, e.g. "sort" or "write"
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.monotonic() - started
+
+    def iter_walk(
+        self, files: Iterable[tuple[Path, os.stat_result]]
+    ) -> Iterator[tuple[Path, os.stat_result]]:
+        """Pass walked files through, counting them.
+
+        Time the pipeline spends blocked on the walk is recorded as the
+        "walk_wait" phase, the walk itself is timed by the walker.
+
+        Args:
+            files: Tuples of (file_path, stat_result)
+
+        Yields:
+            The same tuples
+        """
+        iterator = iter(files)
+        while True:
+            with self.phase("walk_wait"):
+                item = next(iterator, None)
+            if item is None:
+                break
+            self.files_seen += 1
+            self.bytes_seen += item[1].st_size
+            yield item
+        self.walk_finished = True
+
+    def record(
+        self,
+        file_path: Path,
+        size: int,
+        elapsed: float,
+        worker: str | None = None,
+    ) -> None:
+        """Record a hashed file.
+
+        Args:
+            file_path: Path of the file
+            size: Size of the file in bytes
+            elapsed: Seconds spent hashing the file
+            worker: Identifier of the worker that hashed it, if known
+        """
+        self.files_done += 1
+        self.bytes_done += size
+        self.bytes_hashed += size
+        if worker is not None:
+            self.worker_busy[worker] += elapsed
+        entry = (elapsed, str(file_path), size)
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def record_cached(self, size: int) -> None:
+        """Record a file served from the hash cache.
+
+        Args:
+            size: Size of the file in bytes
+        """
+        self.files_done += 1
+        self.files_cached += 1
+        self.bytes_done += size
+
+    def status_line(self) -> str:
+        """Format the current progress as a single line.
+
+        Returns:
+            Files and bytes done, throughput, worker utilisation and ETA
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = self.bytes_hashed / elapsed
+        more = "" if self.walk_finished else "+"
+        parts = [
+            f"{self.files_done}/{self.files_seen}{more} files",
+            f"{self.bytes_done / MiB:.1f}/{self.bytes_seen / MiB:.1f}{more} MiB",
+            f"{rate / MiB:.1f} MiB/s",
+        ]
+        if self.worker_busy:
+            busy = [t / elapsed for t in self.worker_busy.values()]
+            parts.append(f"{len(busy)} workers {min(busy):.0%}-{max(busy):.0%} busy")
+        if self.walk_finished and rate > 0:
+            eta = (self.bytes_seen - self.bytes_done) / rate
+            parts.append(f"ETA {eta:.0f}s")
+        return ", ".join(parts)
+
+    def report(self) -> None:
+        """Print the current progress to stderr."""
+        print(self.status_line(), file=sys.stderr, flush=True)
+
+    def stats(self) -> dict:
+        """Return the collected metrics.
+
+        Returns:
+            JSON serialisable dict with totals, per-phase timings in seconds,
+            per-worker utilisation and the slowest files
+        """
+        elapsed = time.monotonic() - self.started
+        return {
+            "elapsed": elapsed,
+            "files": self.files_done,
+            "files_cached": self.files_cached,
+            "bytes": self.bytes_done,
+            "bytes_hashed": self.bytes_hashed,
+            "throughput_mib_s": self.bytes_hashed / MiB / elapsed if elapsed else 0,
+            "phases": dict(self.phases),
+            "workers": {
+                worker: busy / elapsed if elapsed else 0
+                for worker, busy in sorted(self.worker_busy.items())
+            },
+            "slowest_files": [
+                {"path": path, "size": size, "seconds": seconds}
+                for seconds, path, size in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+def iter_file_digests(
+    executor: Executor,
+    files: Iterable[tuple[Path, os.stat_result]],
+    digests: Sequence[str],
+    cache: HashCache | None = None,
+    tree_threshold: int | None = None,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    mmap_threshold: int | None = None,
+    max_pending: int = 16,
+    monitor: ProgressMonitor | None = None,
+) -> Iterator[tuple[tuple[str, ...], Path]]:
+    """Hash files on an executor with a bounded number of in-flight tasks.
+
+    Files are consumed lazily from ``files``, so walking, hashing and
+    writing can proceed together with memory bounded by ``max_pending``.
+
+    Args:
+        executor: Executor to hash the files on
+        files: Tuples of (file_path, stat_result)
+        digests: Names of the hash algorithms to use
+        cache: Hash cache to serve unchanged files from and to update
+        tree_threshold: Files larger than this many bytes are hashed in tree
+            mode, None disables tree mode
+        segment_size: Segment size in bytes for tree mode
+        block_size: Read block size in bytes
+        mmap_threshold: Files of at least this many bytes are memory-mapped,
+            None to never use mmap
+        max_pending: Maximum number of in-flight batches of small files
+        monitor: Progress monitor to record walked, cached and hashed files
+
+    Yields:
+        Tuples of (hash_values, file_path) in completion order
+    """
+    monitor = monitor or ProgressMonitor()
+    started = time.monotonic()
+    tree_keys = cache_keys(digests, segment_size)
+    pending: dict[Future, list[tuple[Path, os.stat_result]]] = {}
+    trees: list[tuple[Path, os.stat_result, list[Future], float]] = []
+    batch: list[tuple[Path, os.stat_result]] = []
+
+    def finish_batches(done: Iterable[Future]) -> Iterator[tuple]:
+        for future in done:
+            batch_files = pending.pop(future)
+            worker, timed_results = future.result()
+            for (file_path, st), (result, elapsed) in zip(batch_files, timed_results):
+                monitor.record(file_path, st.st_size, elapsed, worker)
+                if result is None:
+                    continue
+                if cache:
+                    for digest, hexdigest in zip(digests, result[0]):
+                        cache.put(st, digest, hexdigest)
+                yield result
+
+    def finish_trees(wait_all: bool) -> Iterator[tuple]:
+        for item in list(trees):
+            file_path, st, futures, submitted = item
+            if not wait_all and not all(future.done() for future in futures):
+                continue
+            trees.remove(item)
+            for future in futures:
+                future.exception()  # Wait without raising
+            monitor.record(file_path, st.st_size, time.monotonic() - submitted)
+            result = combine_tree_digest(futures, file_path, digests, segment_size)
+            if result is None:
+                continue
+            if cache:
+                for key, hexdigest in zip(tree_keys, result[0]):
+                    cache.put(st, key, hexdigest)
+            yield result
+
+    def submit_batch() -> None:
+        future = executor.submit(
+            hash_files,
+            [file_path for file_path, _ in batch],
+            digests,
+            block_size,
+            mmap_threshold,
+        )
+        pending[future] = batch
+
+    for file_path, st in monitor.iter_walk(files):
+        is_tree = tree_threshold is not None and st.st_size > tree_threshold
+        keys = tree_keys if is_tree else tuple(digests)
+        hexdigests = lookup_cached(cache, st, keys) if cache else None
+        if hexdigests is not None:
+            monitor.record_cached(st.st_size)
+            yield (hexdigests, file_path)
+            continue
+
+        if is_tree:
+            futures = submit_tree_digest(
+                executor, file_path, st.st_size, digests, segment_size, block_size
+            )
+            trees.append((file_path, st, futures, time.monotonic()))
+            continue
+
+        batch.append((file_path, st))
+        if len(batch) < TASK_BATCH_SIZE:
+            continue
+        submit_batch()
+        batch = []
+        if len(pending) >= max_pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finish_batches(done)
+            yield from finish_trees(wait_all=False)
+
+    if batch:
+        submit_batch()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        yield from finish_batches(done)
+    yield from finish_trees(wait_all=True)
+    monitor.phases["hash"] = time.monotonic() - started
+
+
+def _write_run(
+    entries: Iterable[tuple[str, tuple[str, ...]]], run_dir: Path, run_id: int
+) -> Path:
+    """Write a sorted run of manifest entries to a temporary file.
+
+    Args:
+        entries: Sorted tuples of (relpath, hash_values)
+        run_dir: Directory for temporary runs
+        run_id: Sequence number of the run
+
+    Returns:
+        Path of the run file
+    """
+    run_path = run_dir / f"run-{run_id:06d}"
+    with open(run_path, "w", encoding="utf-8") as f:
+        for relpath, hash_values in entries:
+            f.write("\0".join((relpath, *hash_values)) + "\n")
+    return run_path
+
+
+def _iter_run(run_path: Path) -> Iterator[tuple[str, tuple[str, ...]]]:
+    """Read back a run written by :func:`_write_run`.
+
+    Args:
+        run_path: Path of the run file
+
+    Yields:
+        Tuples of (relpath, hash_values)
+    """
+    with open(run_path, encoding="utf-8") as f:
+        for line in f:
+            relpath, *hash_values = line.rstrip("\n").split("\0")
+            yield (relpath, tuple(hash_values))
+
+
+def _merge_runs(runs: list[Path]) -> Iterator[tuple[str, tuple[str, ...]]]:
+    """Merge sorted runs into a single sorted stream."""
+    return heapq.merge(*(_iter_run(run) for run in runs))
+
+
+class MerkleBuilder:
+    """Fold a path-sorted stream of manifest entries into directory hashes.
+
+    The hash of a directory is the digest of its own listing, one
+    ``<hash>  <name>`` line per immediate child in manifest order, where
+    subdirectory names end with ``/`` and use their own aggregate hash.
+    The root directory is written as ``./``. Since all entries below a
+    directory are contiguous in a path-sorted manifest, only the chain of
+    currently open directories is kept in memory. Empty directories are
+    not represented.
+    """
+
+    def __init__(self, digest: str, output: TextIO) -> None:
+        """Initialize the builder.
+
+        Args:
+            digest: Name of the hash algorithm for directory hashes
+            output: Text stream the Merkle manifest is written to
+        """
+        self.digest = digest
+        self.output = output
+        self.stack = [("", SUPPORTED_DIGESTS[digest]())]
+
+    def add(self, relpath: str, hash_value: str) -> None:
+        """Add a file entry; entries must arrive sorted by path.
+
+        Args:
+            relpath: Path of the file relative to the root directory
+            hash_value: Manifest hash value of the file
+        """
+        parent, _, name = relpath.rpartition("/")
+        while self.stack[-1][0] and not (
+            parent == self.stack[-1][0] or parent.startswith(self.stack[-1][0] + "/")
+        ):
+            self._close()
+
+        top = self.stack[-1][0]
+        for part in parent[len(top) :].strip("/").split("/"):
+            if part:
+                top = f"{top}/{part}" if top else part
+                self.stack.append((top, SUPPORTED_DIGESTS[self.digest]()))
+
+        self.output.write(f"{hash_value}  {relpath}\n")
+        self.stack[-1][1].update(f"{hash_value}  {name}\n".encode())
+
+    def _close(self) -> None:
+        path, hasher = self.stack.pop()
+        hash_value = hasher.hexdigest()
+        self.output.write(f"{hash_value}  {path}/\n")
+        name = path.rpartition("/")[2]
+        self.stack[-1][1].update(f"{hash_value}  {name}/\n".encode())
+
+    def finish(self) -> str:
+        """Close all open directories and write the root entry.
+
+        Returns:
+            Hash of the root directory
+        """
+        while len(self.stack) > 1:
+            self._close()
+        hash_value = self.stack[0][1].hexdigest()
+        self.output.write(f"{hash_value}  ./\n")
+        return hash_value
+
+
+def merkle_path_for(directory: Path, digest: str) -> Path:
+    """Return the path of the Merkle manifest of a directory.
+
+    Args:
+        directory: Directory being processed
+        digest: Name of the hash algorithm
+
+    Returns:
+        Path of the ``<dir>.<digest>.merkle`` file
+    """
+    return directory.with_name(f"{directory.name}.{digest}.merkle")
+
+
+def write_sorted_manifests(
+    directory: Path,
+    digests: Sequence[str],
+    results: Iterable[tuple[tuple[str, ...], Path]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    merkle: bool = False,
+    monitor: ProgressMonitor | None = None,
+    output_dir: Path | None = None,
+) -> int:
+    """Write results sorted by path, one manifest per digest.
+
+    Results are buffered up to ``batch_size`` entries; larger inputs are
+    spilled as sorted runs to a temporary directory in ``output_dir``, or
+    next to ``directory`` without one, and combined with an external merge sort, so memory stays flat regardless
+    of the number of files.
+
+    Args:
+        directory: Directory the results belong to
+        digests: Names of the hash algorithms, in the order of hash values
+        results: Tuples of (hash_values, file_path) in any order
+        batch_size: Maximum number of entries kept in memory
+        merkle: Whether to also write a ``<dir>.<digest>.merkle`` manifest
+            with per-directory aggregate hashes, see :class:`MerkleBuilder`
+        monitor: Progress monitor to record the sort and write phases
+        output_dir: Directory to write the manifests to instead of next to
+            ``directory``
+
+    Returns:
+        Number of entries written; if zero no manifest is written, only
+        the Merkle manifests with the root entry of the empty tree
+    """
+    monitor = monitor or ProgressMonitor()
+    count = 0
+    run_ids = itertools.count()
+    with tempfile.TemporaryDirectory(
+        prefix=f".{directory.name}.shasum-", dir=output_dir or directory.parent
+    ) as tmp_dir:
+        run_dir = Path(tmp_dir)
+        runs: list[Path] = []
+        buffer: list[tuple[str, tuple[str, ...]]] = []
+        for hash_values, file_path in results:
+            buffer.append((str(file_path.relative_to(directory)), hash_values))
+            count += 1
+            if len(buffer) < batch_size:
+                continue
+            with monitor.phase("sort"):
+                buffer.sort()
+                runs.append(_write_run(buffer, run_dir, next(run_ids)))
+                buffer = []
+                if len(runs) >= MAX_MERGE_RUNS:
+                    # Cascade so the final merge never holds too many open files
+                    merged = _write_run(_merge_runs(runs), run_dir, next(run_ids))
+                    for run in runs:
+                        run.unlink()
+                    runs = [merged]
+
+        if count == 0 and not merkle:
+            return 0
+
+        with monitor.phase("sort"):
+            buffer.sort()
+            if runs and buffer:
+                runs.append(_write_run(buffer, run_dir, next(run_ids)))
+        if runs:
+            entries: Iterable[tuple[str, tuple[str, ...]]] = _merge_runs(runs)
+        else:
+            entries = buffer
+
+        base = output_dir / directory.name if output_dir else directory
+        manifest_files = [
+            base.with_name(f"{base.name}.{digest}") for digest in digests if count
+        ]
+        merkle_files = [merkle_path_for(base, digest) for digest in digests if merkle]
+        output_files = manifest_files + merkle_files
+        with monitor.phase("write"), ExitStack() as stack:
+            outputs = [
+                stack.enter_context(open(output_file, "w", encoding="utf-8"))
+                for output_file in manifest_files
+            ]
+            builders = [
+                MerkleBuilder(
+                    digest,
+                    stack.enter_context(open(merkle_file, "w", encoding="utf-8")),
+                )
+                for digest, merkle_file in zip(digests, merkle_files)
+            ]
+            for relpath, hash_values in entries:
+                for f, hash_value in zip(outputs, hash_values):
+                    f.write(f"{hash_value}  {relpath}\n")
+                for builder, hash_value in zip(builders, hash_values):
+                    builder.add(relpath, hash_value)
+            for builder in builders:
+                builder.finish()
+
+    for output_file in output_files:
+        logger.info("Results written to: %s", output_file)
+    return count
+
+
 def process_directory(
     directory: Path,
-    digest: str = DEFAULT_DIGEST,
+    digests: str | Sequence[str] = (DEFAULT_DIGEST,),
     respect_gitignore: bool = False,
     workers: int | None = None,
-) -> None:
+    use_cache: bool = True,
+    rebuild_cache: bool = False,
+    tree_threshold: int | None = None,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    engine: str = DEFAULT_ENGINE,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    mmap_threshold: int | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    merkle: bool = False,
+    progress_interval: float | None = None,
+    stats_json: Path | None = None,
+    output_dir: Path | None = None,
+    digest: str | None = None,
+) -> int:
     """Process all files in a directory to calculate their hashes.
 
+    Walking, hashing and writing are streamed, so peak memory depends on
+    ``batch_size`` and the number of workers rather than on the file count.
+
     Args:
         directory: Path to the directory to process
-        digest: Hash algorithm to use
+        digests: Hash algorithms to use, one manifest is written per
+            algorithm, or the name of one
         respect_gitignore: Whether to respect .gitignore files
-        workers: Number of parallel worker processes
-    """
-    files = list(iter_files_with_respect_gitignore(directory, respect_gitignore))
-    if not files:
-        logger.warning("No files found in directory: %s", directory)
-        return
+        workers: Number of parallel workers
+        use_cache: Whether to serve unchanged files from the hash cache
+        rebuild_cache: Whether to discard the hash cache before processing
+        tree_threshold: Files larger than this many bytes are hashed in tree
+            mode, segments in parallel; None disables tree mode
+        segment_size: Segment size in bytes for tree mode
+        engine: Hashing engine, "processes" or "threads"
+        block_size: Read block size in bytes
+        mmap_threshold: Files of at least this many bytes are memory-mapped,
+            None to never use mmap
+        batch_size: Maximum number of manifest entries kept in memory
+            before spilling a sorted run to disk
+        merkle: Whether to also write per-directory aggregate hashes to
+            ``<dir>.<digest>.merkle``
+        progress_interval: Seconds between progress lines on stderr, None
+            to disable progress output
+        stats_json: Path to write final metrics to as JSON: per-phase
+            timings (walk, walk_wait, hash, sort, write), worker utilisation
+            and the slowest files
+        output_dir: Directory to write the manifests to instead of next to
+            ``directory``; the hash cache stays next to ``directory``
+        digest: Single hash algorithm, kept for callers of the former
+            signature; overrides ``digests``
+
+    Returns:
+        Number of files hashed
 
-    logger.info("Processing %d files with %s...", len(files), digest)
+    Raises:
+        OSError: If the tree cannot be walked or the manifests not written
+    """
+    digests = _as_digests(digest if digest is not None else digests)
+    logger.info("Processing %s with %s...", directory, ", ".join(digests))
+    cache = HashCache(cache_path_for(directory), rebuild_cache) if use_cache else None
     try:
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            results = executor.map(
-                file_digest,
+        with (
+            make_executor(engine, workers) as executor,
+            ProgressMonitor(progress_interval) as monitor,
+        ):
+            files = iter_walk_threaded(directory, respect_gitignore, monitor=monitor)
+            results = iter_file_digests(
+                executor,
                 files,
-                [digest] * len(files),
-                chunksize=10,
+                digests,
+                cache,
+                tree_threshold,
+                segment_size,
+                block_size,
+                mmap_threshold,
+                max_pending=4 * (workers or os.cpu_count() or 1),
+                monitor=monitor,
+            )
+            count = write_sorted_manifests(
+                directory, digests, results, batch_size, merkle, monitor, output_dir
             )
 
-        filtered_results = [r for r in results if r is not None]
-        # Sort results by file path
-        sorted_results = sorted(filtered_results, key=lambda x: str(x[1]))
+        if stats_json is not None:
+            stats = monitor.stats()
+            stats["cache"] = (
+                {"hits": cache.hits, "misses": cache.misses} if cache else None
+            )
+            with open(stats_json, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2, ensure_ascii=False)
+            logger.info("Stats written to: %s", stats_json)
 
-        # Write to output file
-        output_file = directory.with_name(f"{directory.name}.{digest}")
-        with open(output_file, "w", encoding="utf-8") as f:
-            for hash_value, file_path in sorted_results:
-                relpath = file_path.relative_to(directory)
-                f.write(f"{hash_value}  {relpath}\n")
+        if count == 0:
+            logger.warning("No files found in directory: %s", directory)
+            return 0
+        logger.info("Hashed %d files", count)
 
-        logger.info("Results written to: %s", output_file)
+        if cache:
+            pruned = sum(cache.prune(digest) for digest in digests)
+            logger.info(
+                "Cache: %d hits, %d misses, %d stale entries pruned",
+                cache.hits,
+                cache.misses,
+                pruned,
+            )
+        return count
+
+    finally:
+        if cache:
+            cache.close()
+
+
+def parse_manifest(manifest: Path) -> Iterator[tuple[str, str]]:
+    """Parse a manifest written by :func:`process_directory`.
 
+    Lines use the ``sha256sum`` format, ``<hash>  <relpath>``; the binary
+    marker ``<hash> *<relpath>`` is accepted as well.
+
+    Args:
+        manifest: Path to the manifest file
+
+    Yields:
+        Tuples of (hash_value, relpath)
+    """
+    with open(manifest, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            hash_value, _, rest = line.partition(" ")
+            if not hash_value or len(rest) < 2 or rest[0] not in " *":
+                logger.warning("Skip malformed line %d in %s", lineno, manifest)
+                continue
+            yield (hash_value.lower(), rest[1:])
+
+
+def check_manifest(
+    manifest: Path,
+    directory: Path,
+    digest: str = DEFAULT_DIGEST,
+    respect_gitignore: bool = False,
+    workers: int | None = None,
+    engine: str = DEFAULT_ENGINE,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    mmap_threshold: int | None = None,
+) -> bool:
+    """Verify the files of a directory against an existing manifest.
+
+    Results are printed as they complete, in manifest order, as
+    ``<relpath>: OK|FAILED|MISSING``; tree mode entries are reported after
+    the plain entries, once all their segments are hashed, and a tree mode
+    entry with a malformed segment size fails without being hashed. Files
+    on disk that are not listed in the manifest are reported afterwards but
+    do not fail the check.
+
+    Args:
+        manifest: Path to the manifest file
+        directory: Directory the manifest paths are relative to
+        digest: Hash algorithm the manifest was written with
+        respect_gitignore: Whether to respect .gitignore files for extra files
+        workers: Number of parallel workers
+        engine: Hashing engine, "processes" or "threads"
+        block_size: Read block size in bytes
+        mmap_threshold: Files of at least this many bytes are memory-mapped,
+            None to never use mmap
+
+    Returns:
+        True if every listed file exists and matches its hash
+    """
+    entries = list(parse_manifest(manifest))
+    logger.info("Checking %d files with %s...", len(entries), digest)
+
+    plain_entries, tree_entries = [], []
+    for expected, relpath in entries:
+        if expected.startswith(TREE_PREFIX):
+            tree_entries.append((expected, relpath))
+        else:
+            plain_entries.append((expected, relpath))
+
+    counts = {"OK": 0, "FAILED": 0, "MISSING": 0}
+
+    def report(
+        expected: str, relpath: str, result: tuple | None, malformed: bool = False
+    ) -> None:
+        if malformed:
+            status = "FAILED"
+        elif result is not None:
+            status = "OK" if result[0][0] == expected else "FAILED"
+        elif (directory / relpath).exists():
+            status = "FAILED"
+        else:
+            status = "MISSING"
+        counts[status] += 1
+        print(f"{relpath}: {status}", flush=True)
+
+    with make_executor(engine, workers) as executor:
+        tree_futures = []
+        for expected, relpath in tree_entries:
+            file_path = directory / relpath
+            try:
+                segment_size = int(expected.removeprefix(TREE_PREFIX).partition(":")[0])
+                if segment_size <= 0:
+                    raise ValueError(segment_size)
+            except ValueError:
+                logger.warning("Malformed tree mode hash for %s", relpath)
+                # A segment size of 0 marks the entry as malformed
+                tree_futures.append((0, None))
+                continue
+            try:
+                size = file_path.stat().st_size
+            except OSError:
+                futures = None
+            else:
+                futures = submit_tree_digest(
+                    executor, file_path, size, (digest,), segment_size, block_size
+                )
+            tree_futures.append((segment_size, futures))
+
+        results = executor.map(
+            partial(
+                file_digest,
+                digests=(digest,),
+                block_size=block_size,
+                mmap_threshold=mmap_threshold,
+            ),
+            [directory / relpath for _, relpath in plain_entries],
+            chunksize=10,
+        )
+        for (expected, relpath), result in zip(plain_entries, results):
+            report(expected, relpath, result)
+
+        for (expected, relpath), (segment_size, futures) in zip(
+            tree_entries, tree_futures
+        ):
+            result = None
+            if futures is not None:
+                result = combine_tree_digest(
+                    futures, directory / relpath, (digest,), segment_size
+                )
+            report(expected, relpath, result, malformed=segment_size == 0)
+
+    listed = {relpath for _, relpath in entries}
+    extra = 0
+    for file_path in iter_files_with_respect_gitignore(directory, respect_gitignore):
+        relpath = str(file_path.relative_to(directory))
+        if relpath not in listed:
+            extra += 1
+            print(f"{relpath}: NOT IN MANIFEST", flush=True)
+
+    logger.info(
+        "%d OK, %d FAILED, %d MISSING, %d not in manifest",
+        counts["OK"],
+        counts["FAILED"],
+        counts["MISSING"],
+        extra,
+    )
+    return counts["FAILED"] == 0 and counts["MISSING"] == 0
+
+
+def load_merkle(
+    merkle_file: Path,
+) -> tuple[dict[str, str], dict[str, list[str]]]:
+    """Load a Merkle manifest written with ``--merkle``.
+
+    Args:
+        merkle_file: Path to the ``<dir>.<digest>.merkle`` file
+
+    Returns:
+        Tuple of (hashes, children), where hashes maps entry paths (with a
+        trailing ``/`` for directories, ``./`` for the root) to their hash
+        and children maps a directory path (``""`` for the root) to its
+        immediate entries
+    """
+    hashes: dict[str, str] = {}
+    children: dict[str, list[str]] = defaultdict(list)
+    for hash_value, relpath in parse_manifest(merkle_file):
+        hashes[relpath] = hash_value
+        if relpath == "./":
+            continue
+        parent = relpath.rstrip("/").rpartition("/")[0]
+        children[f"{parent}/" if parent else ""].append(relpath)
+    return hashes, children
+
+
+def compare_merkle(left_file: Path, right_file: Path) -> Iterator[tuple[str, str]]:
+    """Compare two Merkle manifests top-down.
+
+    Only directories whose aggregate hashes differ are descended into, so
+    the comparison work is proportional to the amount of change. A
+    directory present on one side only is reported as a whole.
+
+    Args:
+        left_file: Merkle manifest of the reference tree
+        right_file: Merkle manifest of the tree to compare
+
+    Yields:
+        Tuples of (relpath, status) with status ADDED, REMOVED or CHANGED,
+        relative to the reference tree
+    """
+    left, left_children = load_merkle(left_file)
+    right, right_children = load_merkle(right_file)
+    if left.get("./") == right.get("./"):
+        return
+
+    pending = [""]
+    while pending:
+        directory = pending.pop()
+        names = set(left_children.get(directory, ())) | set(
+            right_children.get(directory, ())
+        )
+        for relpath in sorted(names):
+            left_hash, right_hash = left.get(relpath), right.get(relpath)
+            if left_hash == right_hash:
+                continue
+            if left_hash is None:
+                yield (relpath, "ADDED")
+            elif right_hash is None:
+                yield (relpath, "REMOVED")
+            elif relpath.endswith("/"):
+                pending.append(relpath)
+            else:
+                yield (relpath, "CHANGED")
+
+
+def compare_trees(
+    left: Path,
+    right: Path,
+    digest: str = DEFAULT_DIGEST,
+    respect_gitignore: bool = False,
+    workers: int | None = None,
+    **options,
+) -> int:
+    """Compare two trees or Merkle manifests and print the differences.
+
+    A directory is hashed with ``merkle=True`` into a temporary directory
+    first, so only Merkle manifests produced by this run are compared and
+    no manifest next to the tree is written or read; the hash cache next to
+    the tree is used as usual.
+
+    Args:
+        left: Reference directory or ``.merkle`` manifest
+        right: Directory or ``.merkle`` manifest to compare
+        digest: Hash algorithm for directories
+        respect_gitignore: Whether to respect .gitignore files
+        workers: Number of parallel workers
+        **options: Further keyword arguments for :func:`process_directory`
+
+    Returns:
+        Number of differences printed
+
+    Raises:
+        ValueError: If a side is neither a directory nor a file
+    """
+    with tempfile.TemporaryDirectory(prefix="shasum-compare-") as tmp_dir:
+        merkle_files = []
+        for label, side in (("left", left), ("right", right)):
+            if side.is_dir():
+                output_dir = Path(tmp_dir) / label
+                output_dir.mkdir()
+                process_directory(
+                    side,
+                    [digest],
+                    respect_gitignore,
+                    workers,
+                    merkle=True,
+                    output_dir=output_dir,
+                    **options,
+                )
+                side = merkle_path_for(output_dir / side.name, digest)
+            elif not side.is_file():
+                raise ValueError("No Merkle manifest: %s" % side)
+            merkle_files.append(side)
+
+        differences = 0
+        for relpath, status in compare_merkle(*merkle_files):
+            differences += 1
+            print(f"{relpath}: {status}", flush=True)
+    return differences
+
+
+def edge_digest(
+    file_path: Path,
+    digest: str = DEFAULT_DIGEST,
+    edge_size: int = DEFAULT_EDGE_SIZE,
+) -> tuple[str, Path] | None:
+    """Calculate a digest over the first and last ``edge_size`` bytes of a file.
+
+    Files no larger than ``2 * edge_size`` are read completely, so for them
+    the result equals the full digest.
+
+    Args:
+        file_path: Path to the file to hash
+        digest: Name of the hash algorithm to use
+        edge_size: Number of bytes read from each end of the file
+
+    Returns:
+        Tuple of (hash_value, file_path) if successful, None on error
+    """
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            hasher = SUPPORTED_DIGESTS[digest]()
+            size = os.fstat(f.fileno()).st_size
+            if size <= 2 * edge_size:
+                _update_hashers(f, [hasher], edge_size)
+            else:
+                _update_hashers(f, [hasher], edge_size, edge_size)
+                f.seek(-edge_size, os.SEEK_END)
+                _update_hashers(f, [hasher], edge_size, edge_size)
+        return (hasher.hexdigest(), file_path)
     except Exception as err:
-        logger.error("Error during processing: %s", err)
+        logger.error("Error processing %s: %s", file_path, err)
+        return None
+
+
+def find_duplicates(
+    directory: Path,
+    digest: str = DEFAULT_DIGEST,
+    respect_gitignore: bool = False,
+    workers: int | None = None,
+    engine: str = DEFAULT_ENGINE,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    edge_size: int = DEFAULT_EDGE_SIZE,
+) -> list[dict]:
+    """Find groups of files with identical content.
+
+    Candidates are narrowed down in three stages so that only files that
+    still collide are read completely: group by size, then by a digest of
+    the first and last ``edge_size`` bytes, then by the full digest.
+    Empty files and symlinks are ignored, and hard links to the same inode
+    are reported once, by the first path found, so that no group lists two
+    names of a single copy.
+
+    Args:
+        directory: Path to the directory to search
+        digest: Hash algorithm to use
+        respect_gitignore: Whether to respect .gitignore files
+        workers: Number of parallel workers
+        engine: Hashing engine, "processes" or "threads"
+        block_size: Read block size in bytes
+        edge_size: Number of bytes hashed from each end of a file in the
+            partial-hash stage
+
+    Returns:
+        Duplicate groups as dicts with "size", "digest" and sorted relative
+        "files", largest files first
+    """
+    by_size: dict[int, list[Path]] = defaultdict(list)
+    inodes: set[tuple[int, int]] = set()
+    total_files = total_bytes = links = 0
+    for file_path, st in itertools.chain.from_iterable(
+        scandir_walk(directory, respect_gitignore)
+    ):
+        if file_path.is_symlink():
+            continue
+        if (st.st_dev, st.st_ino) in inodes:
+            links += 1
+            continue
+        inodes.add((st.st_dev, st.st_ino))
+        total_files += 1
+        total_bytes += st.st_size
+        if st.st_size > 0:
+            by_size[st.st_size].append(file_path)
+
+    candidates = [
+        (size, path)
+        for size, paths in by_size.items()
+        if len(paths) > 1
+        for path in paths
+    ]
+    logger.info(
+        "%d of %d files share their size with another file, %d hard links skipped",
+        len(candidates),
+        total_files,
+        links,
+    )
+
+    bytes_read = 0
+    groups: dict[tuple[int, str], list[Path]] = defaultdict(list)
+    with make_executor(engine, workers) as executor:
+        by_edge: dict[tuple[int, str], list[Path]] = defaultdict(list)
+        results = executor.map(
+            partial(edge_digest, digest=digest, edge_size=edge_size),
+            [path for _, path in candidates],
+            chunksize=TASK_BATCH_SIZE,
+        )
+        for (size, _), result in zip(candidates, results):
+            if result is not None:
+                by_edge[(size, result[0])].append(result[1])
+                bytes_read += min(size, 2 * edge_size)
+
+        full_candidates = []
+        for (size, edge_hash), paths in by_edge.items():
+            if len(paths) < 2:
+                continue
+            if size <= 2 * edge_size:
+                # The whole file was hashed already
+                groups[(size, edge_hash)] = paths
+            else:
+                full_candidates.extend((size, path) for path in paths)
+
+        logger.info("%d files need a full hash", len(full_candidates))
+        results = executor.map(
+            partial(file_digest, digests=(digest,), block_size=block_size),
+            [path for _, path in full_candidates],
+            chunksize=TASK_BATCH_SIZE,
+        )
+        for (size, _), result in zip(full_candidates, results):
+            if result is not None:
+                groups[(size, result[0][0])].append(result[1])
+                bytes_read += size
+
+    logger.info(
+        "Read %d of %d bytes (%.1f%%)",
+        bytes_read,
+        total_bytes,
+        100 * bytes_read / total_bytes if total_bytes else 0,
+    )
+    duplicates = [
+        {
+            "size": size,
+            "digest": hash_value,
+            "files": sorted(str(path.relative_to(directory)) for path in paths),
+        }
+        for (size, hash_value), paths in groups.items()
+        if len(paths) > 1
+    ]
+    duplicates.sort(key=lambda group: (-group["size"], group["files"]))
+    return duplicates
+
+
+def print_duplicates(duplicates: list[dict], as_json: bool = False) -> None:
+    """Print duplicate groups to stdout.
+
+    The text format prints each group as ``<hash>  <relpath>`` lines under a
+    comment header, with groups separated by blank lines.
+
+    Args:
+        duplicates: Groups returned by :func:`find_duplicates`
+        as_json: Print the groups as a JSON array instead
+    """
+    if as_json:
+        print(json.dumps(duplicates, indent=2, ensure_ascii=False))
+        return
+
+    for i, group in enumerate(duplicates):
+        if i:
+            print()
+        print(f"# {len(group['files'])} files, {group['size']} bytes each")
+        for relpath in group["files"]:
+            print(f"{group['digest']}  {relpath}")
 
 
 def parse_args() -> argparse.Namespace:
@@ -112,15 +1733,19 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "directory",
         nargs="?",
-        default=os.getcwd(),
-        help="Directory to process (default: current directory)",
+        default=None,
+        help="Directory to process (default: current directory, or the "
+        "directory next to MANIFEST with --check); a .merkle manifest is "
+        "accepted as well with --compare",
     )
     parser.add_argument(
         "-d",
         "--digest",
+        action="append",
         choices=SUPPORTED_DIGESTS.keys(),
-        default=DEFAULT_DIGEST,
-        help=f"Hash algorithm to use (default: {DEFAULT_DIGEST})",
+        default=None,
+        help="Hash algorithm to use, repeat to compute several digests in one "
+        f"read pass, one manifest per algorithm (default: {DEFAULT_DIGEST})",
     )
     parser.add_argument(
         "-g",
@@ -135,6 +1760,122 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Number of parallel workers (default: number of CPU cores)",
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ENGINES,
+        default=DEFAULT_ENGINE,
+        help="Hashing engine, threads avoid per-file IPC on trees of small "
+        f"files (default: {DEFAULT_ENGINE})",
+    )
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        type=parse_size,
+        default=DEFAULT_BLOCK_SIZE,
+        help="Read block size, reused per worker (default: 1M)",
+    )
+    parser.add_argument(
+        "--mmap-threshold",
+        type=parse_size,
+        default=None,
+        help="Memory-map files of at least this size instead of reading them "
+        "(default: disabled)",
+    )
+    parser.add_argument(
+        "-T",
+        "--tree-threshold",
+        type=parse_size,
+        default=None,
+        help="Hash files larger than this size (e.g. 1G) in tree mode, segments "
+        "in parallel; such entries are marked 'tree-<segment_size>:' in the "
+        "manifest (default: disabled)",
+    )
+    parser.add_argument(
+        "--segment-size",
+        type=parse_size,
+        default=DEFAULT_SEGMENT_SIZE,
+        help="Segment size for tree mode (default: 64M)",
+    )
+    parser.add_argument(
+        "-D",
+        "--find-duplicates",
+        action="store_true",
+        help="Print groups of duplicate files instead of writing a manifest, "
+        "prefiltering by size and a hash of the first and last --edge-size bytes",
+    )
+    parser.add_argument(
+        "--edge-size",
+        type=parse_size,
+        default=DEFAULT_EDGE_SIZE,
+        help="Bytes hashed from each end of a file by --find-duplicates (default: 64K)",
+    )
+    parser.add_argument(
+        "-j",
+        "--json",
+        action="store_true",
+        help="Print --find-duplicates groups as JSON",
+    )
+    parser.add_argument(
+        "-m",
+        "--merkle",
+        action="store_true",
+        help="Also write per-directory aggregate hashes to <dir>.<digest>.merkle",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="OTHER",
+        default=None,
+        help="Compare DIRECTORY against OTHER top-down, descending only into "
+        "differing subtrees; each side is a .merkle manifest or a directory, "
+        "which is hashed into a temporary Merkle manifest first (its hash "
+        "cache is still used and updated, see --no-cache), exit non-zero on "
+        "differences",
+    )
+    parser.add_argument(
+        "-p",
+        "--progress",
+        metavar="SECONDS",
+        type=float,
+        nargs="?",
+        const=5.0,
+        default=None,
+        help="Print files and bytes done, throughput, worker utilisation and "
+        "ETA to stderr every SECONDS (default when given: 5)",
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="FILE",
+        default=None,
+        help="Write final per-phase timings, worker utilisation and the "
+        "slowest files to FILE as JSON",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Manifest entries kept in memory before a sorted run is spilled "
+        f"to disk, bounding memory on huge trees (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "-c",
+        "--check",
+        metavar="MANIFEST",
+        default=None,
+        help="Verify files against an existing manifest instead of writing one, "
+        "exit non-zero on mismatch",
+    )
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the hash cache, rehash every file",
+    )
+    cache_group.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Discard the hash cache and rehash every file",
+    )
     argcomplete.autocomplete(parser)
 
     return parser.parse_args()  # type: ignore[return-value]
@@ -143,26 +1884,96 @@ def parse_args() -> argparse.Namespace:
 def main() -> None:
     """Main function to process directory and generate hash file."""
     args = parse_args()
+    # Deduplicate while keeping the command line order
+    digests = list(dict.fromkeys(args.digest or [DEFAULT_DIGEST]))
 
     try:
-        directory = Path(args.directory).resolve()
+        if args.check:
+            manifest = Path(args.check).resolve()
+            digest = manifest.suffix.removeprefix(".")
+            if digest not in SUPPORTED_DIGESTS:
+                digest = digests[0]
+            directory = Path(args.directory or manifest.with_suffix("")).resolve()
+            if not directory.is_dir():
+                raise ValueError("Not a directory: %s" % directory)
+
+            ok = check_manifest(
+                manifest,
+                directory,
+                digest,
+                args.respect_gitignore,
+                args.workers,
+                engine=args.engine,
+                block_size=args.block_size,
+                mmap_threshold=args.mmap_threshold,
+            )
+            sys.exit(0 if ok else 1)
+
+        directory = Path(args.directory or os.getcwd()).resolve()
+        if args.compare:
+            differences = compare_trees(
+                directory,
+                Path(args.compare).resolve(),
+                digests[0],
+                args.respect_gitignore,
+                args.workers,
+                use_cache=not args.no_cache,
+                rebuild_cache=args.rebuild_cache,
+                tree_threshold=args.tree_threshold,
+                segment_size=args.segment_size,
+                engine=args.engine,
+                block_size=args.block_size,
+                mmap_threshold=args.mmap_threshold,
+                batch_size=args.batch_size,
+            )
+            logger.info("%d differences", differences)
+            sys.exit(1 if differences else 0)
+
         if not directory.is_dir():
             raise ValueError("Not a directory: %s" % directory)
 
+        if args.find_duplicates:
+            duplicates = find_duplicates(
+                directory,
+                digests[0],
+                args.respect_gitignore,
+                args.workers,
+                engine=args.engine,
+                block_size=args.block_size,
+                edge_size=args.edge_size,
+            )
+            logger.info("Found %d groups of duplicate files", len(duplicates))
+            print_duplicates(duplicates, args.json)
+            return
+
         logger.debug("Processing directory: %s", directory)
-        logger.debug("Using hash algorithm: %s", args.digest)
-        logger.debug("Using %s workers", args.workers or "auto")
+        logger.debug("Using hash algorithms: %s", ", ".join(digests))
+        logger.debug("Using %s %s workers", args.workers or "auto", args.engine)
         logger.debug("Respect .gitignore: %s", args.respect_gitignore)
+        logger.debug("Use hash cache: %s", not args.no_cache)
+        logger.debug("Tree mode threshold: %s", args.tree_threshold)
 
         process_directory(
             directory,
-            args.digest,
+            digests,
             args.respect_gitignore,
             args.workers,
+            use_cache=not args.no_cache,
+            rebuild_cache=args.rebuild_cache,
+            tree_threshold=args.tree_threshold,
+            segment_size=args.segment_size,
+            engine=args.engine,
+            block_size=args.block_size,
+            mmap_threshold=args.mmap_threshold,
+            batch_size=args.batch_size,
+            merkle=args.merkle,
+            progress_interval=args.progress,
+            stats_json=Path(args.stats_json) if args.stats_json else None,
         )
 
     except Exception as err:
         logger.error(err)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,22 @@
 """Tests for ipmerge utility functions."""
 
+import random
+from pathlib import Path
+
+import numpy as np
 import pytest
 from netaddr import IPNetwork
 
 from chaos_box.cmd.ipmerge import (
     digit_str_zfill,
     digit_to_binary,
+    interval_cidrs,
     ip_network_to_binary,
     ip_network_zfill,
+    merge_intervals,
+    merge_ip_ranges,
+    merge_ip_ranges_numpy,
+    parse_ip_range,
 )
 
 # ---------------------------------------------------------------------------
@@ -125,3 +134,74 @@ def test_ip_network_to_binary_ipv6_compressed_passthrough() -> None:
 )
 def test_ip_network_zfill_ipv4(cidr: str, expected: str) -> None:
     assert ip_network_zfill(IPNetwork(cidr)) == expected
+
+
+# ---------------------------------------------------------------------------
+# numpy engine
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "ip_range, expected",
+    [
+        ("10.0.0.0/8", (4, 0x0A000000, 8)),
+        ("10.1.2.3", (4, 0x0A010203, 32)),
+        ("2001:db8::1/32", (6, 0x20010DB8 << 96 | 1, 32)),
+        ("::ffff:1.2.3.4", (6, 0xFFFF01020304, 128)),
+        # Netmask notation goes through netaddr
+        ("192.168.0.0/255.255.0.0", (4, 0xC0A80000, 16)),
+    ],
+)
+def test_parse_ip_range(ip_range: str, expected: tuple[int, int, int]) -> None:
+    assert parse_ip_range(ip_range) == expected
+
+
+def test_merge_intervals() -> None:
+    starts = np.array([20, 0, 5, 11, 30], dtype=np.uint64)
+    ends = np.array([25, 10, 6, 12, 30], dtype=np.uint64)
+    merged_starts, merged_ends = merge_intervals(starts, ends)
+    # [0, 10] swallows [5, 6] and is adjacent to [11, 12]
+    assert merged_starts.tolist() == [0, 20, 30]
+    assert merged_ends.tolist() == [12, 25, 30]
+
+
+def test_interval_cidrs() -> None:
+    starts = np.array([1, 2**32 - 2], dtype=np.uint64)
+    ends = np.array([6, 2**32 - 1], dtype=np.uint64)
+    addresses, prefixes = interval_cidrs(starts, ends, 32)
+    assert list(zip(addresses.tolist(), prefixes.tolist())) == [
+        (1, 32),
+        (2, 31),
+        (4, 31),
+        (6, 32),
+        (2**32 - 2, 31),
+    ]
+
+    starts = np.array([0], dtype=object)
+    ends = np.array([2**128 - 1], dtype=object)
+    addresses, prefixes = interval_cidrs(starts, ends, 128)
+    assert (addresses.tolist(), prefixes.tolist()) == ([0], [0])
+
+
+def test_merge_ip_ranges_numpy(tmp_path: Path) -> None:
+    rng = random.Random(0)
+    lines = ["", "0.0.0.0/1", "255.255.255.255", "10.0.0.0/255.255.0.0"]
+    for _ in range(500):
+        address = IPNetwork((rng.getrandbits(16) << 16, 32), version=4)
+        lines.append(f"{address.ip}/{rng.choice([16, 20, 24, 30, 32])}")
+        address = IPNetwork((rng.getrandbits(16), 128), version=6)
+        lines.append(f"{address.ip}/{rng.choice([124, 127, 128])}")
+    path = tmp_path / "ranges.txt"
+    path.write_text("\n".join(lines) + "\n")
+
+    ipv4_set, ipv6_set = merge_ip_ranges([str(path)])
+    ipv4_cidrs, ipv6_cidrs = merge_ip_ranges_numpy([str(path)])
+    assert ipv4_cidrs == list(ipv4_set.iter_cidrs())
+    assert ipv6_cidrs == list(ipv6_set.iter_cidrs())
+    assert len(ipv6_cidrs) > 1
+
+
+def test_merge_ip_ranges_numpy_empty(tmp_path: Path) -> None:
+    path = tmp_path / "ranges.txt"
+    path.write_text("\n")
+    assert merge_ip_ranges_numpy([str(path)]) == ([], [])
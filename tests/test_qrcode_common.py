@@ -0,0 +1,100 @@
+"""Tests for the QR code frame format shared by qrcode-split and qrcode-merge."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from chaos_box.cmd.qrcode_common import (
+    Frame,
+    cauchy_matrix,
+    decode_payload,
+    encode_payload,
+    gf_invert,
+    gf_matmul,
+    load_manifest,
+    pack_frame,
+    unpack_frame,
+    write_manifest,
+)
+
+# ---------------------------------------------------------------------------
+# payload encoding
+# ---------------------------------------------------------------------------
+
+
+def test_payload_round_trip_base64() -> None:
+    chunk = b"\x00\xffhello"
+    data = encode_payload(chunk, "base64")
+    assert isinstance(data, str)
+    assert decode_payload(data.encode("ascii")) == chunk
+
+
+def test_payload_round_trip_binary() -> None:
+    chunk = "caf\u00e9".encode() + bytes(range(256))
+    data = encode_payload(chunk, "binary")
+    assert decode_payload(data) == chunk
+    # Decoders that guess the charset return byte mode data as UTF-8 text
+    assert decode_payload(data.decode("latin-1").encode("utf-8")) == chunk
+
+
+def test_decode_payload_invalid() -> None:
+    with pytest.raises(ValueError):
+        decode_payload(b"not base64!")
+
+
+# ---------------------------------------------------------------------------
+# frames
+# ---------------------------------------------------------------------------
+
+
+def test_frame_round_trip() -> None:
+    frame = Frame(b"data", "lzma", 0xDEADBEEF, 3, 9)
+    assert unpack_frame(pack_frame(frame)) == frame
+
+
+def test_unpack_frame_legacy_payload() -> None:
+    assert unpack_frame(b"plain chunk") == Frame(b"plain chunk")
+
+
+def test_unpack_frame_unknown_version() -> None:
+    raw = bytearray(pack_frame(Frame(b"data", "none", 1, 1, 1)))
+    raw[2] = 99
+    assert unpack_frame(bytes(raw)) == Frame(bytes(raw))
+
+
+@pytest.mark.parametrize("offset", [8, -1])
+def test_unpack_frame_crc_mismatch(offset: int) -> None:
+    """A frame whose header or data is corrupted is not trusted."""
+    raw = bytearray(pack_frame(Frame(b"data", "none", 1, 1, 1)))
+    raw[offset] ^= 0x01
+    assert unpack_frame(bytes(raw)).index is None
+
+
+def test_unpack_frame_legacy_payload_with_magic() -> None:
+    """Legacy file data may start with the frame magic by chance."""
+    raw = b"QF" + bytes(range(40))
+    assert unpack_frame(raw) == Frame(raw)
+
+
+# ---------------------------------------------------------------------------
+# manifest
+# ---------------------------------------------------------------------------
+
+
+def test_manifest_round_trip(tmp_path: Path) -> None:
+    assert load_manifest(tmp_path) is None
+    manifest = {"name": "file.bin", "total": 2, "crc32": ["e8b7be43", "71beeff9"]}
+    write_manifest(tmp_path, manifest)
+    assert load_manifest(tmp_path) == manifest
+
+
+# ---------------------------------------------------------------------------
+# GF(256) arithmetic
+# ---------------------------------------------------------------------------
+
+
+def test_gf_invert() -> None:
+    matrix = cauchy_matrix(5, 5)
+    identity = gf_matmul(gf_invert(matrix), matrix)
+    assert (identity == np.eye(5, dtype=np.uint8)).all()
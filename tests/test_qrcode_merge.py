@@ -0,0 +1,529 @@
+"""Tests for qrcode_merge decoding."""
+
+import base64
+import hashlib
+import random
+import zlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+import qrcode
+from PIL import Image
+
+from chaos_box.cmd import qrcode_merge
+from chaos_box.cmd.qrcode_common import CODECS, Frame, write_manifest
+from chaos_box.cmd.qrcode_merge import (
+    ChunkWriter,
+    binarise,
+    crop_regions,
+    decode_image,
+    decode_qr_code,
+    downscale,
+    iter_decompressed,
+    iter_video_frames,
+    load_state,
+    merge_chunks,
+    recover_frames,
+    rescan_images,
+    save_state,
+)
+from chaos_box.cmd.qrcode_split import (
+    GifWriter,
+    VideoWriter,
+    compress_file,
+    draw_qr_code,
+    generate_qr_code,
+    init_worker,
+    iter_file_into_chunks,
+    iter_frame_chunks,
+    write_parity,
+)
+
+# ---------------------------------------------------------------------------
+# preprocessing
+# ---------------------------------------------------------------------------
+
+
+def test_downscale() -> None:
+    img = np.zeros((3000, 4000), dtype=np.uint8)
+    assert downscale(img, 2000).shape == (1500, 2000)
+    assert downscale(img, 5000) is img
+
+
+def test_binarise() -> None:
+    img = np.array([[40, 60, 180, 200]], dtype=np.uint8)
+    assert binarise(img).tolist() == [[0, 0, 255, 255]]
+
+
+def make_photo(tmp_path: Path) -> Path:
+    """Paste a low contrast QR code on a large, noisy gradient."""
+    init_worker(version=5, box_size=4)
+    generate_qr_code(b"photo", 1, 1, tmp_path, "code", file_id=42)
+    code = cv2.imread(str(tmp_path / "code_1.png"), cv2.IMREAD_GRAYSCALE)
+    code = cv2.resize(code, None, fx=4, fy=4, interpolation=cv2.INTER_NEAREST)
+
+    photo = np.tile(np.linspace(60, 200, 3000, dtype=np.float32), (2400, 1))
+    height, width = code.shape
+    photo[600 : 600 + height, 900 : 900 + width] = code * 0.6 + 40
+    photo += np.random.default_rng(0).normal(0, 10, photo.shape)
+    path = tmp_path / "photo_1.png"
+    cv2.imwrite(str(path), np.clip(photo, 0, 255).astype(np.uint8))
+    return path
+
+
+def test_crop_regions(tmp_path: Path) -> None:
+    img = cv2.imread(str(make_photo(tmp_path)), cv2.IMREAD_GRAYSCALE)
+    crops = list(crop_regions(img))
+    assert len(crops) == 1
+    # The crop keeps the code and its quiet zone but little of the photo
+    assert 600 < crops[0].shape[0] < 1000
+
+
+# ---------------------------------------------------------------------------
+# decode_qr_code
+# ---------------------------------------------------------------------------
+
+
+def test_decode_qr_code(tmp_path: Path) -> None:
+    init_worker(version=5, box_size=4)
+    generate_qr_code(b"chunk", 2, 3, tmp_path, "f", payload="binary", file_id=42)
+    results, stats = decode_qr_code(tmp_path / "f_2.png")
+    assert [(index, frame.data) for index, frame in results] == [(2, b"chunk")]
+    assert stats[0].stage == "load"
+    assert stats[-1].codes == 1
+
+
+def test_decode_qr_code_photo(tmp_path: Path) -> None:
+    results, stats = decode_qr_code(make_photo(tmp_path))
+    assert [(index, frame.data) for index, frame in results] == [(1, b"photo")]
+    # Found on the crop, unless zbar is installed and finds it first
+    assert [s.stage for s in stats if s.codes] in (["zbar"], ["roi"])
+
+
+def test_main_reads_jpeg_photos(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    path = make_photo(tmp_path)
+    img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    cv2.imwrite(str(photos / "IMG_1.jpg"), img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    (photos / "IMG_1.jpg").rename(photos / "IMG_1.JPG")
+
+    output = tmp_path / "photo.bin"
+    monkeypatch.setattr(
+        "sys.argv", ["qrcode-merge", str(photos), "-o", str(output), "-w", "1"]
+    )
+    qrcode_merge.main()
+    assert output.read_bytes() == b"photo"
+
+
+def test_decode_qr_code_unreadable(tmp_path: Path) -> None:
+    path = tmp_path / "f_1.png"
+    path.write_bytes(b"\x89PNG")
+    assert decode_qr_code(path) == ([], [])
+
+    cv2.imwrite(str(path), np.full((100, 100), 255, dtype=np.uint8))
+    results, stats = decode_qr_code(path)
+    assert results == []
+    assert all(s.codes == 0 for s in stats)
+
+
+def test_merge_legacy_chunk_with_magic(tmp_path: Path) -> None:
+    """Merge images of the original format, one chunk starting with b"QF"."""
+    chunks = [b"first chunk " * 4, b"QF" + bytes(range(30))]
+    for index, chunk in enumerate(chunks, start=1):
+        qr = qrcode.QRCode(box_size=4)
+        qr.add_data(base64.b64encode(chunk).decode("utf-8"))
+        qr.make_image().save(tmp_path / f"legacy_{index}.png")
+
+    with ChunkWriter(tmp_path / "legacy.bin.part") as writer:
+        for index in (1, 2):
+            [(found, frame)], _ = decode_qr_code(tmp_path / f"legacy_{index}.png")
+            assert frame.index is None
+            writer.add(found, frame)
+        report = merge_chunks(writer, tmp_path / "legacy.bin", None)
+    assert report["complete"]
+    assert (tmp_path / "legacy.bin").read_bytes() == b"".join(chunks)
+
+
+# ---------------------------------------------------------------------------
+# video input
+# ---------------------------------------------------------------------------
+
+
+def test_iter_video_frames(tmp_path: Path) -> None:
+    init_worker(version=5, box_size=4)
+    codes = [draw_qr_code(b"chunk", i, 3) for i in range(1, 4)]
+    path = tmp_path / "recording.mp4"
+    # Each code shown for three frames, and the whole animation twice; the
+    # codes only differ in their headers and error correction
+    with VideoWriter(path, 10) as video:
+        for _ in range(2):
+            for img in codes:
+                for _ in range(3):
+                    video.write(img)
+
+    frames = list(iter_video_frames(path))
+    assert 3 <= len(frames) <= 18
+    decoded = {i: f.data for frame in frames for i, f in decode_image(frame)[0]}
+    assert decoded == {i: b"chunk" for i in range(1, 4)}
+
+
+def test_iter_video_frames_blended(tmp_path: Path) -> None:
+    """A transition frame looking like the next code does not hide it."""
+    init_worker(version=5, box_size=2)
+    frames = []
+    for i in range(1, 3):
+        # Small codes in a large frame are hard to tell apart when scaled down
+        frame = Image.new("L", (640, 640), 255)
+        frame.paste(draw_qr_code(b"chunk", i, 2).convert("L"), (40, 40))
+        frames.append(frame)
+    blended = Image.blend(frames[0], frames[1], 0.8)
+    path = tmp_path / "slides.gif"
+    with GifWriter(path, 5) as animation:
+        for img in (frames[0], frames[0], blended, frames[1], frames[1]):
+            animation.write(img)
+
+    distinct = list(iter_video_frames(path))
+    assert len(distinct) == 3
+    decoded = {i for frame in distinct for i, _ in decode_image(frame)[0]}
+    assert decoded == {1, 2}
+
+
+# ---------------------------------------------------------------------------
+# integrity checks and report
+# ---------------------------------------------------------------------------
+
+
+def make_manifest(data: bytes, chunk_size: int, **extra: object) -> dict:
+    chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+    return {
+        "name": "file.bin",
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "file_id": "0000002a",
+        "codec": "none",
+        "image_format": "png",
+        "sheet": None,
+        "chunk_size": chunk_size,
+        "total": len(chunks),
+        "crc32": [f"{zlib.crc32(chunk):08x}" for chunk in chunks],
+        **extra,
+    }
+
+
+def test_rescan_images() -> None:
+    manifest = make_manifest(bytes(100), 4)
+    assert rescan_images(manifest, [2, 13]) == ["file_02.png", "file_13.png"]
+    manifest["sheet"] = {"paper": "a4", "dpi": 300, "grid": [2, 3]}
+    assert rescan_images(manifest, [2, 5, 13]) == [
+        "file_sheet_1.png",
+        "file_sheet_3.png",
+    ]
+
+
+def merge_frames(
+    tmp_path: Path, data: bytes, indices: list[int], sparse: bool = False
+) -> dict:
+    manifest = make_manifest(data, 4)
+    output = tmp_path / "file.bin"
+    with ChunkWriter(tmp_path / "file.bin.part", manifest) as writer:
+        for index in indices:
+            chunk = data[(index - 1) * 4 : index * 4]
+            writer.add(index, Frame(chunk, "none", 42, index, manifest["total"]))
+        return merge_chunks(writer, output, manifest, sparse)
+
+
+def test_merge_chunks(tmp_path: Path) -> None:
+    report = merge_frames(tmp_path, b"abcdefghij", [3, 1, 2, 2])
+    assert report["complete"]
+    assert report["duplicates"] == {2: 1}
+    assert report["sha256"]["actual"] == report["sha256"]["expected"]
+    assert (tmp_path / "file.bin").read_bytes() == b"abcdefghij"
+    assert not (tmp_path / "file.bin.part").exists()
+
+
+def test_merge_chunks_missing(tmp_path: Path) -> None:
+    report = merge_frames(tmp_path, b"abcdefghij", [1, 3])
+    assert not report["complete"]
+    assert report["output"] is None
+    assert report["missing"] == [2]
+    assert report["holes"] == [(4, 4)]
+    assert report["rescan"] == ["file_2.png"]
+    assert not (tmp_path / "file.bin").exists()
+    assert (tmp_path / "file.bin.part").exists()
+
+
+def test_merge_chunks_sparse(tmp_path: Path) -> None:
+    report = merge_frames(tmp_path, b"abcdefghij", [1], sparse=True)
+    assert report["missing"] == [2, 3]
+    assert report["holes"] == [(4, 6)]
+    assert report["output"] == str(tmp_path / "file.bin")
+    assert (tmp_path / "file.bin").read_bytes() == b"abcd" + bytes(6)
+
+
+@pytest.mark.parametrize(
+    ("missing", "sha256", "status"),
+    [(False, None, None), (True, None, 1), (False, "0" * 64, 1)],
+)
+def test_main_exit_status(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    missing: bool,
+    sha256: str | None,
+    status: int | None,
+) -> None:
+    data = b"abcdefghij"
+    manifest = make_manifest(data, 4)
+    if sha256:
+        manifest["sha256"] = sha256
+    images = tmp_path / "images"
+    images.mkdir()
+    write_manifest(images, manifest)
+    init_worker(version=5, box_size=4)
+    for index in range(1, manifest["total"] + 1):
+        chunk = data[(index - 1) * 4 : index * 4]
+        generate_qr_code(chunk, index, manifest["total"], images, "file", file_id=42)
+    if missing:
+        (images / "file_2.png").unlink()
+
+    output = tmp_path / "file.bin"
+    monkeypatch.setattr(
+        "sys.argv",
+        ["qrcode-merge", str(images), "-o", str(output), "-w", "1", "--no-state"],
+    )
+    if status is None:
+        qrcode_merge.main()
+        assert output.read_bytes() == data
+    else:
+        with pytest.raises(SystemExit) as excinfo:
+            qrcode_merge.main()
+        assert excinfo.value.code == status
+
+
+def test_main_exit_status_no_images(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(
+        "sys.argv", ["qrcode-merge", str(tmp_path), "-o", str(tmp_path / "out")]
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        qrcode_merge.main()
+    assert excinfo.value.code == 1
+
+
+# ---------------------------------------------------------------------------
+# compression
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("codec", CODECS[1:])
+def test_compress_round_trip(tmp_path: Path, codec: str) -> None:
+    src = tmp_path / "input.json"
+    src.write_bytes(b'{"key": "value"}\n' * 1000)
+    dst = tmp_path / "input.json.z"
+    compress_file(src, dst, codec)
+    assert dst.stat().st_size < src.stat().st_size
+
+    chunks = [chunk for chunk, _ in iter_file_into_chunks(dst, 7)]
+    assert b"".join(iter_decompressed(chunks, codec)) == src.read_bytes()
+
+    with pytest.raises(ValueError, match="Truncated"):
+        b"".join(iter_decompressed(chunks[:-1], codec))
+
+
+# ---------------------------------------------------------------------------
+# ChunkWriter
+# ---------------------------------------------------------------------------
+
+
+def test_chunk_writer_out_of_order(tmp_path: Path) -> None:
+    manifest = make_manifest(b"abcdefghij", 4)
+    path = tmp_path / "out.part"
+    with ChunkWriter(path, manifest) as writer:
+        assert writer.add(3, Frame(b"ij", "none", 42, 3, 3))
+        assert writer.add(1, Frame(b"abcd", "none", 42, 1, 3))
+        assert not writer.add(1, Frame(b"abcd", "none", 42, 1, 3))
+        assert not writer.add(2, Frame(b"xxxx", "none", 42, 2, 3))
+        assert writer.duplicates == {1: 1}
+        assert writer.rejected == [2]
+        assert writer.finish() == [2]
+        assert writer.holes([2]) == [(4, 4)]
+        assert not writer.complete
+        assert writer.add(2, Frame(b"efgh", "none", 42, 2, 3))
+        assert writer.complete
+        assert writer.finish() == []
+        assert b"".join(writer.iter_chunks()) == b"abcdefghij"
+    assert path.read_bytes() == b"abcdefghij"
+
+
+def test_chunk_writer_holes(tmp_path: Path) -> None:
+    manifest = make_manifest(b"abcdefghijklmn", 4)
+    path = tmp_path / "out.part"
+    with ChunkWriter(path, manifest) as writer:
+        writer.add(1, Frame(b"abcd", "none", 42, 1, 4))
+        missing = writer.finish()
+        assert missing == [2, 3, 4]
+        # Adjacent chunks form one hole, the last chunk is short
+        assert writer.holes(missing) == [(4, 10)]
+        writer.pad()
+    assert path.read_bytes() == b"abcd" + bytes(10)
+
+
+def test_chunk_writer_restore(tmp_path: Path) -> None:
+    data = random.Random(4).randbytes(20 * 8 + 3)
+    frames = split_frames(tmp_path, data, 8, 10)
+    part, parity = tmp_path / "out.part", tmp_path / "out.parity"
+    with ChunkWriter(part, parity_path=parity) as writer:
+        for index in (1, 2, 3, 22, 23):
+            writer.add(index, frames[index])
+        snapshot = writer.snapshot()
+    # Damage chunk 2 on disk
+    with open(part, "r+b") as f:
+        f.seek(8)
+        f.write(b"X")
+
+    with ChunkWriter(part, parity_path=parity, resume=True) as writer:
+        assert writer.restore(snapshot) == [2]
+        assert writer.written == {1, 3}
+        assert sorted(writer.parity) == [22, 23]
+        for index in range(4, 22):
+            writer.add(index, frames[index])
+        # Chunk 2 is rebuilt from the restored parity records
+        assert writer.finish() == []
+        assert b"".join(writer.iter_chunks()) == data
+
+
+def test_chunk_writer_copy_sparse(tmp_path: Path) -> None:
+    manifest = make_manifest(b"abcdefghij", 4)
+    with ChunkWriter(tmp_path / "out.part", manifest) as writer:
+        writer.add(2, Frame(b"efgh", "none", 42, 2, 3))
+        writer.copy_sparse(tmp_path / "out")
+    assert (tmp_path / "out").read_bytes() == bytes(4) + b"efgh" + bytes(2)
+
+
+def test_chunk_writer_without_manifest(tmp_path: Path) -> None:
+    with ChunkWriter(tmp_path / "out.part") as writer:
+        # The chunk size is unknown until a chunk other than the last
+        assert writer.add(3, Frame(b"ij", "none", 42, 3, 3))
+        assert writer.pending
+        assert not writer.add(2, Frame(b"efgh", "none", 7, 2, 3))
+        assert writer.add(2, Frame(b"efgh", "none", 42, 2, 3))
+        assert not writer.pending
+        assert writer.finish() == [1]
+
+    with ChunkWriter(tmp_path / "out.part") as writer:
+        writer.add(2, Frame(b"cd"))
+        writer.add(1, Frame(b"ab"))
+        assert writer.finish() == []
+        assert b"".join(writer.iter_chunks()) == b"abcd"
+
+
+def test_chunk_writer_streams_legacy_frames(tmp_path: Path) -> None:
+    path = tmp_path / "out.part"
+    with ChunkWriter(path) as writer:
+        # The last chunk alone does not tell the chunk size
+        writer.add(3, Frame(b"ij"))
+        assert writer.pending
+        # A chunk before another one is full, both go to disk at once
+        writer.add(2, Frame(b"efgh"))
+        assert not writer.pending
+        writer.add(1, Frame(b"abcd"))
+        assert not writer.pending
+        writer.fp.flush()
+        assert path.read_bytes() == b"abcdefghij"
+        assert writer.finish() == []
+
+
+def test_chunk_writer_recovers_from_parity(tmp_path: Path) -> None:
+    data = random.Random(3).randbytes(100 * 64 + 10)
+    frames = split_frames(tmp_path, data, 64, 10)
+    with ChunkWriter(tmp_path / "out.part") as writer:
+        for index in reversed(frames):
+            if not 40 <= index <= 49:
+                writer.add(index, frames[index])
+        assert writer.finish() == []
+        assert b"".join(writer.iter_chunks()) == data
+
+
+# ---------------------------------------------------------------------------
+# parity recovery
+# ---------------------------------------------------------------------------
+
+
+def split_frames(
+    tmp_path: Path, data: bytes, chunk_size: int, percent: int
+) -> dict[int, Frame]:
+    source = tmp_path / "input.bin"
+    source.write_bytes(data)
+    parity_path = tmp_path / "input.parity"
+    write_parity(source, parity_path, chunk_size, percent)
+    total = len(range(0, len(data), chunk_size))
+    return {
+        index: Frame(chunk, "none", 1, index, total)
+        for chunk, index in iter_frame_chunks(source, chunk_size, parity_path)
+    }
+
+
+def test_recover_frames(tmp_path: Path) -> None:
+    rng = random.Random(0)
+    data = rng.randbytes(100 * 64 + 10)
+    frames = split_frames(tmp_path, data, 64, 10)
+    assert len(frames) == 101 + 11
+
+    # Lose a run of consecutive chunks, including the short last one
+    lost = list(range(92, 102))
+    for index in lost:
+        del frames[index]
+    assert recover_frames(frames, lost) == []
+    assert b"".join(frames[i].data for i in range(1, 102)) == data
+
+
+def test_recover_frames_interleaved_groups(tmp_path: Path) -> None:
+    data = random.Random(1).randbytes(600 * 16)
+    frames = split_frames(tmp_path, data, 16, 5)
+    # Three groups of 200 chunks with 10 parity chunks each; chunks 1-30
+    # spread over all three groups
+    lost = list(range(1, 31))
+    for index in lost:
+        del frames[index]
+    assert recover_frames(frames, lost) == []
+    assert b"".join(frames[i].data for i in range(1, 601)) == data
+
+
+def test_recover_frames_too_many_lost(tmp_path: Path) -> None:
+    data = random.Random(2).randbytes(20 * 8)
+    frames = split_frames(tmp_path, data, 8, 10)
+    # One group of 20 chunks with 2 parity chunks
+    for index in (3, 4, 5):
+        del frames[index]
+    assert recover_frames(frames, [3, 4, 5]) == [3, 4, 5]
+
+
+# ---------------------------------------------------------------------------
+# merge state
+# ---------------------------------------------------------------------------
+
+
+def test_state_round_trip(tmp_path: Path) -> None:
+    manifest = make_manifest(b"abcdefghij", 4)
+    state_path = tmp_path / "file.bin.state"
+    assert load_state(state_path, manifest) is None
+
+    images = {"/scans/file_1.png": {"size": 1, "mtime_ns": 2, "frames": [[1, "d"]]}}
+    with ChunkWriter(tmp_path / "file.bin.part", manifest) as writer:
+        writer.add(1, Frame(b"abcd", "none", 42, 1, 3))
+        save_state(state_path, writer, images)
+    state = load_state(state_path, manifest)
+    assert state is not None
+    assert state["images"] == images
+    assert state["writer"]["data"] == {"1": writer.digests[1]}
+
+    assert (
+        load_state(state_path, make_manifest(b"other", 4, file_id="00000007")) is None
+    )
+    state_path.write_text("{")
+    assert load_state(state_path, manifest) is None
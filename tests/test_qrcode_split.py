@@ -0,0 +1,343 @@
+"""Tests for qrcode_split chunking and image generation."""
+
+import argparse
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import pytest
+from PIL import Image
+
+from chaos_box.cmd import qrcode_split
+from chaos_box.cmd.qrcode_common import (
+    Frame,
+    decode_payload,
+    read_qr_code,
+    read_qr_codes,
+    unpack_frame,
+)
+from chaos_box.cmd.qrcode_split import (
+    GifWriter,
+    VideoWriter,
+    chunk_crcs,
+    draw_qr_code,
+    generate_qr_code,
+    generate_sheet,
+    get_existing_indices,
+    init_worker,
+    iter_file_into_chunks,
+    parity_layout,
+    parse_grid,
+    payload_capacity,
+    sheet_layout,
+    verify_existing,
+    verify_qr_code,
+    write_pdf,
+)
+
+# ---------------------------------------------------------------------------
+# iter_file_into_chunks
+# ---------------------------------------------------------------------------
+
+
+def test_iter_file_into_chunks(tmp_path: Path) -> None:
+    f = tmp_path / "input.bin"
+    f.write_bytes(b"abcdefghij")
+    assert list(iter_file_into_chunks(f, 4)) == [
+        (b"abcd", 1),
+        (b"efgh", 2),
+        (b"ij", 3),
+    ]
+
+
+def test_iter_file_into_chunks_empty(tmp_path: Path) -> None:
+    f = tmp_path / "empty.bin"
+    f.touch()
+    assert list(iter_file_into_chunks(f, 4)) == []
+
+
+# ---------------------------------------------------------------------------
+# get_existing_indices
+# ---------------------------------------------------------------------------
+
+
+def test_get_existing_indices(tmp_path: Path) -> None:
+    for name in ["input_03.png", "input_01.png", "input_xx.png", "other_02.png"]:
+        (tmp_path / name).touch()
+    assert get_existing_indices(tmp_path, "input") == [1, 3]
+
+
+# ---------------------------------------------------------------------------
+# generate_qr_code
+# ---------------------------------------------------------------------------
+
+
+def test_generate_qr_code_without_initializer(tmp_path: Path) -> None:
+    """Calling outside a pool initializes the worker state lazily."""
+    qrcode_split._worker_state.clear()
+    generate_qr_code(b"hello", 7, 12, tmp_path, "input")
+    assert qrcode_split._worker_state
+    with Image.open(tmp_path / "input_07.png") as img:
+        assert img.size[0] == img.size[1]
+
+
+def test_generate_qr_code_reuses_encoder(tmp_path: Path) -> None:
+    init_worker()
+    qr = qrcode_split._worker_state["qr"]
+    generate_qr_code(b"first", 1, 2, tmp_path, "a")
+    generate_qr_code(b"second", 2, 2, tmp_path, "a")
+    assert qrcode_split._worker_state["qr"] is qr
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a_1.png", "a_2.png"]
+
+
+@pytest.mark.parametrize("image_format", ["png", "pbm"])
+def test_generate_qr_code_1bit(tmp_path: Path, image_format: str) -> None:
+    init_worker(image_format=image_format, compress_level=9, optimize=True)
+    generate_qr_code(b"hello", 1, 1, tmp_path, "f", file_id=42)
+    img_path = tmp_path / f"f_1.{image_format}"
+    with Image.open(img_path) as img:
+        assert img.mode == "1"
+    assert verify_qr_code(img_path, 42, [1])
+    assert get_existing_indices(tmp_path, "f", image_format) == [1]
+
+
+def test_generate_qr_code_binary_round_trip(tmp_path: Path) -> None:
+    chunk = bytes(range(256)) * 4
+    init_worker(version=40, error_correction="L")
+    generate_qr_code(chunk, 1, 1, tmp_path, "bin", payload="binary", file_id=42)
+    img = cv2.imread(str(tmp_path / "bin_1.png"))
+    decoded, _, _ = cv2.QRCodeDetector().detectAndDecodeBytes(img)
+    assert unpack_frame(decode_payload(decoded)) == Frame(chunk, "none", 42, 1, 1)
+
+
+# ---------------------------------------------------------------------------
+# payload encoding
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    ("version", "level", "payload", "expected"),
+    [
+        (40, "L", "binary", 2932),
+        (40, "H", "binary", 1252),
+        (3, "M", "binary", 21),
+        (40, "L", "base64", 2194),
+    ],
+)
+def test_payload_capacity(
+    version: int, level: str, payload: str, expected: int
+) -> None:
+    assert payload_capacity(version, level, payload) == expected
+
+
+# ---------------------------------------------------------------------------
+# manifest and resume
+# ---------------------------------------------------------------------------
+
+
+def make_manifest(chunks: list[bytes], file_id: str = "0000002a") -> dict:
+    return {
+        "file_id": file_id,
+        "sha256": "",
+        "codec": "none",
+        "size": sum(map(len, chunks)),
+        "sheet": None,
+        "image_format": "png",
+        "total": len(chunks),
+        "crc32": [f"{zlib.crc32(chunk):08x}" for chunk in chunks],
+    }
+
+
+def test_chunk_crcs(tmp_path: Path) -> None:
+    f = tmp_path / "input.bin"
+    f.write_bytes(b"abcdefghij")
+    assert chunk_crcs(f, 4) == [
+        f"{zlib.crc32(chunk):08x}" for chunk in (b"abcd", b"efgh", b"ij")
+    ]
+
+
+def test_verify_existing(tmp_path: Path) -> None:
+    chunks = [b"one", b"two", b"three"]
+    manifest = make_manifest(chunks)
+    init_worker()
+    for index, chunk in enumerate(chunks, 1):
+        generate_qr_code(chunk, index, 3, tmp_path, "f", file_id=42)
+    # Truncated image, and an intact image of another file
+    (tmp_path / "f_2.png").write_bytes(b"\x89PNG")
+    generate_qr_code(b"three", 3, 3, tmp_path, "f", file_id=7)
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        assert verify_existing(executor, tmp_path, "f", manifest) == {1}
+
+
+# ---------------------------------------------------------------------------
+# parity frames
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    ("total", "percent", "groups"),
+    [(0, 10, 0), (10, 0, 0), (10, 10, 1), (1000, 10, 5), (300, 100, 3)],
+)
+def test_parity_layout(total: int, percent: int, groups: int) -> None:
+    n_groups, counts = parity_layout(total, percent)
+    assert n_groups == groups
+    assert len(counts) == groups
+    for group, count in enumerate(counts):
+        size = len(range(group, total, groups))
+        assert count >= size * percent / 100
+        assert size + count <= 255
+
+
+# ---------------------------------------------------------------------------
+# sheets
+# ---------------------------------------------------------------------------
+
+
+def test_parse_grid() -> None:
+    assert parse_grid("3x4") == (3, 4)
+    for value in ("3", "0x4", "axb"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_grid(value)
+
+
+def test_sheet_layout() -> None:
+    # Version 40 at 4px per module is 740px, A4 at 300 dpi is 2480x3508px
+    layout = sheet_layout("a4", 300, 4, 40, 30)
+    assert (layout.cols, layout.rows) == (3, 4)
+    assert layout.page_size == (2480, 3508)
+    right = layout.origin[0] + 2 * layout.pitch[0] + layout.code_size
+    bottom = layout.origin[1] + 3 * layout.pitch[1] + layout.code_size + 60
+    assert right <= 2480 - layout.margin
+    assert bottom <= 3508 - layout.margin - 60
+
+    assert sheet_layout("a4", 300, 4, 40, 30, (2, 2)).per_sheet == 4
+    with pytest.raises(ValueError, match="do not fit"):
+        sheet_layout("letter", 300, 4, 40, 30, (4, 4))
+
+
+def test_generate_sheet(tmp_path: Path) -> None:
+    layout = sheet_layout("a4", 100, 3, 5, 10, (3, 2))
+    chunks = [(f"chunk {i}".encode(), i) for i in range(7, 12)]
+    init_worker(version=5, box_size=3, font_size=10)
+    generate_sheet(chunks, 2, 2, layout, 100, tmp_path, "f", 11, 11, file_id=42)
+
+    sheet = tmp_path / "f_sheet_2.png"
+    frames = sorted(
+        (unpack_frame(decode_payload(data)) for data in read_qr_codes(sheet)),
+        key=lambda frame: frame.index,
+    )
+    assert [(f.index, f.data) for f in frames] == [(i, chunk) for chunk, i in chunks]
+
+    manifest = make_manifest([b""] * 11)
+    manifest["sheet"] = {"paper": "a4", "dpi": 100, "grid": [3, 2]}
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        assert verify_existing(executor, tmp_path, "f", manifest) == {2}
+
+    write_pdf([sheet], tmp_path / "f.pdf", 100)
+    assert (tmp_path / "f.pdf").read_bytes().startswith(b"%PDF")
+
+
+# ---------------------------------------------------------------------------
+# animations
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    ("writer", "suffix"), [(GifWriter, "gif"), (VideoWriter, "mp4")]
+)
+def test_animation_round_trip(tmp_path: Path, writer: type, suffix: str) -> None:
+    init_worker(version=5, box_size=4)
+    chunks = [f"chunk {i}".encode() for i in range(1, 4)]
+    path = tmp_path / f"f.{suffix}"
+    with writer(path, 5) as animation:
+        for i, chunk in enumerate(chunks, start=1):
+            img = draw_qr_code(chunk, i, 3, file_id=42)
+            assert img.mode == "1"
+            animation.write(img)
+    assert animation.frames == 3
+
+    capture = cv2.VideoCapture(str(path))
+    decoded = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        image = tmp_path / "frame.png"
+        cv2.imwrite(str(image), frame)
+        decoded.append(unpack_frame(decode_payload(read_qr_code(image))))
+    capture.release()
+    assert [(f.index, f.data) for f in decoded] == list(enumerate(chunks, start=1))
+
+
+# ---------------------------------------------------------------------------
+# split_file
+# ---------------------------------------------------------------------------
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Thread pool that records the most futures in flight at once."""
+
+    lock = threading.Lock()
+    in_flight = max_in_flight = 0
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:  # type: ignore[override]
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        future = super().submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self._finished())
+        return future
+
+    def _finished(self) -> None:
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight -= 1
+
+
+def run_split(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, generate: Callable
+) -> None:
+    source = tmp_path / "f.bin"
+    source.write_bytes(bytes(range(200)))
+    monkeypatch.setattr(qrcode_split, "ProcessPoolExecutor", CountingExecutor)
+    monkeypatch.setattr(CountingExecutor, "max_in_flight", 0)
+    monkeypatch.setattr(qrcode_split, "generate_qr_code", generate)
+    monkeypatch.setattr(
+        "sys.argv",
+        ["qrcode-split", str(source), "-O", str(tmp_path), "-c", "10", "-w", "1"],
+    )
+    qrcode_split.main()
+
+
+def test_split_file_bounds_pending(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    indices = []
+
+    def generate(chunk: bytes, index: int, *args: object) -> None:
+        time.sleep(0.005)
+        indices.append(index)
+
+    run_split(tmp_path, monkeypatch, generate)
+    assert sorted(indices) == list(range(1, 21))
+    # One worker gives a window of 4 futures, far fewer than the 20 chunks
+    assert 1 < CountingExecutor.max_in_flight <= 4
+
+
+def test_split_file_reports_failures(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    def generate(chunk: bytes, index: int, *args: object) -> None:
+        if index == 3:
+            raise OSError("disk full")
+
+    with pytest.raises(SystemExit) as excinfo:
+        run_split(tmp_path, monkeypatch, generate)
+    assert excinfo.value.code == 1
+    assert "QR code generation failed: disk full" in caplog.text
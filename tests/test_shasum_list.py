@@ -0,0 +1,692 @@
+"""Tests for shasum_list hashing and manifest helpers."""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+from chaos_utils.gitignore import iter_files_with_respect_gitignore
+
+from chaos_box.cmd import shasum_list
+from chaos_box.cmd.shasum_list import (
+    HashCache,
+    MerkleBuilder,
+    ProgressMonitor,
+    cache_path_for,
+    check_manifest,
+    compare_merkle,
+    compare_trees,
+    edge_digest,
+    file_digest,
+    find_duplicates,
+    iter_walk_threaded,
+    make_executor,
+    merkle_path_for,
+    parse_manifest,
+    parse_size,
+    process_directory,
+    scandir_walk,
+)
+
+OLD_MTIME = 1_600_000_000
+
+
+def _make_file(path: Path, content: bytes) -> Path:
+    """Write ``content`` to ``path`` and give it an old mtime so it is cacheable."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    os.utime(path, (OLD_MTIME, OLD_MTIME))
+    return path
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# make_executor
+# ---------------------------------------------------------------------------
+
+
+def test_make_executor_does_not_fork(tmp_path: Path) -> None:
+    f = _make_file(tmp_path / "a.bin", b"abc")
+    with make_executor("processes", 1) as executor:
+        # Workers start on the first submit, after the walker thread started
+        assert executor._mp_context.get_start_method() != "fork"
+        assert executor.submit(file_digest, f, ["sha256"]).result()[0] == (
+            _sha256(b"abc"),
+        )
+
+
+# ---------------------------------------------------------------------------
+# file_digest
+# ---------------------------------------------------------------------------
+
+
+def test_file_digest_matches_hashlib(tmp_path: Path) -> None:
+    f = _make_file(tmp_path / "a.bin", b"hello world" * 1000)
+    assert file_digest(f, ["sha256"]) == ((_sha256(b"hello world" * 1000),), f)
+
+
+def test_file_digest_single_name(tmp_path: Path) -> None:
+    f = _make_file(tmp_path / "a.bin", b"hello")
+    assert file_digest(f, "sha256") == ((_sha256(b"hello"),), f)
+
+
+def test_file_digest_several_digests_in_one_pass(tmp_path: Path) -> None:
+    content = b"0123456789" * 5000
+    f = _make_file(tmp_path / "a.bin", content)
+    assert file_digest(f, ["sha1", "sha256"]) == (
+        (hashlib.sha1(content).hexdigest(), _sha256(content)),
+        f,
+    )
+
+
+@pytest.mark.parametrize(
+    "block_size, mmap_threshold",
+    [(1, None), (7, None), (4096, None), (7, 1), (4096, 1)],
+)
+def test_file_digest_block_size_and_mmap(
+    tmp_path: Path, block_size: int, mmap_threshold: int | None
+) -> None:
+    content = bytes(range(256)) * 40
+    f = _make_file(tmp_path / "a.bin", content)
+    assert file_digest(f, ["sha256"], block_size, mmap_threshold) == (
+        (_sha256(content),),
+        f,
+    )
+
+
+def test_file_digest_mmap_empty_file(tmp_path: Path) -> None:
+    f = _make_file(tmp_path / "empty", b"")
+    assert file_digest(f, ["sha256"], mmap_threshold=0) == ((_sha256(b""),), f)
+
+
+def test_file_digest_missing_file_returns_none(tmp_path: Path) -> None:
+    assert file_digest(tmp_path / "missing", ["sha256"]) is None
+
+
+# ---------------------------------------------------------------------------
+# HashCache
+# ---------------------------------------------------------------------------
+
+
+def test_hash_cache_roundtrip(tmp_path: Path) -> None:
+    f = _make_file(tmp_path / "a.txt", b"a")
+    st = f.stat()
+
+    cache = HashCache(tmp_path / "cache")
+    assert cache.get(st, "sha256") is None
+    cache.put(st, "sha256", "deadbeef")
+    cache.close()
+
+    cache = HashCache(tmp_path / "cache")
+    assert cache.get(st, "sha256") == "deadbeef"
+    assert cache.get(st, "sha1") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_hash_cache_invalidated_by_mtime_and_size(tmp_path: Path) -> None:
+    f = _make_file(tmp_path / "a.txt", b"a")
+    cache = HashCache(tmp_path / "cache")
+    cache.put(f.stat(), "sha256", "deadbeef")
+
+    os.utime(f, (OLD_MTIME + 1, OLD_MTIME + 1))
+    assert cache.get(f.stat(), "sha256") is None
+
+    _make_file(f, b"ab")
+    assert cache.get(f.stat(), "sha256") is None
+    cache.close()
+
+
+def test_hash_cache_skips_racy_entries(tmp_path: Path) -> None:
+    """Files modified right before the run must not be cached."""
+    f = tmp_path / "fresh.txt"
+    f.write_bytes(b"fresh")
+    cache = HashCache(tmp_path / "cache")
+    cache.put(f.stat(), "sha256", "deadbeef")
+    assert cache.get(f.stat(), "sha256") is None
+    cache.close()
+
+
+def test_hash_cache_prune_and_rebuild(tmp_path: Path) -> None:
+    a = _make_file(tmp_path / "a.txt", b"a")
+    b = _make_file(tmp_path / "b.txt", b"b")
+    cache = HashCache(tmp_path / "cache")
+    cache.put(a.stat(), "sha256", "aa")
+    cache.put(b.stat(), "sha256", "bb")
+    cache.close()
+
+    cache = HashCache(tmp_path / "cache")
+    assert cache.get(a.stat(), "sha256") == "aa"
+    assert cache.prune("sha256") == 1
+    cache.close()
+
+    cache = HashCache(tmp_path / "cache", rebuild=True)
+    assert cache.get(a.stat(), "sha256") is None
+    cache.close()
+
+
+# ---------------------------------------------------------------------------
+# process_directory
+# ---------------------------------------------------------------------------
+
+
+def test_process_directory_writes_sorted_manifest(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    _make_file(root / "b.txt", b"b")
+    _make_file(root / "sub" / "a.txt", b"a")
+    _make_file(root / "a.txt", b"a")
+
+    process_directory(root, ["sha256"], workers=2)
+
+    manifest = (tmp_path / "data.sha256").read_text(encoding="utf-8")
+    assert manifest.splitlines() == [
+        f"{_sha256(b'a')}  a.txt",
+        f"{_sha256(b'b')}  b.txt",
+        f"{_sha256(b'a')}  sub/a.txt",
+    ]
+    assert cache_path_for(root).exists()
+
+
+def test_process_directory_thread_engine(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    for i in range(20):
+        _make_file(root / f"{i:02d}.txt", str(i).encode() * 1000)
+    _make_file(root / "big.img", b"z" * 5000)
+
+    process_directory(root, ["sha256"], workers=4, use_cache=False)
+    expected = (tmp_path / "data.sha256").read_text()
+
+    process_directory(
+        root,
+        ["sha256"],
+        workers=4,
+        use_cache=False,
+        engine="threads",
+        block_size=512,
+        mmap_threshold=4096,
+    )
+    assert (tmp_path / "data.sha256").read_text() == expected
+    assert check_manifest(
+        tmp_path / "data.sha256", root, "sha256", workers=4, engine="threads"
+    )
+
+
+def test_process_directory_single_digest(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    _make_file(root / "a.txt", b"a")
+    process_directory(root, "sha1", workers=1, use_cache=False)
+    process_directory(root, digest="sha512", workers=1, use_cache=False)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "data",
+        "data.sha1",
+        "data.sha512",
+    ]
+    assert (
+        (tmp_path / "data.sha512")
+        .read_text()
+        .startswith(hashlib.sha512(b"a").hexdigest())
+    )
+
+
+def test_process_directory_external_merge_sort(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Spilled runs, including cascaded merges, must yield the same manifest."""
+    root = tmp_path / "data"
+    for i in range(53):
+        _make_file(root / f"d{i % 5}" / f"{i:03d}.txt", str(i).encode())
+
+    process_directory(root, ["sha1", "sha256"], workers=2, use_cache=False)
+    expected = [(tmp_path / f"data.{d}").read_text() for d in ("sha1", "sha256")]
+
+    monkeypatch.setattr(shasum_list, "MAX_MERGE_RUNS", 3)
+    process_directory(
+        root, ["sha1", "sha256"], workers=2, use_cache=False, batch_size=4
+    )
+    assert [
+        (tmp_path / f"data.{d}").read_text() for d in ("sha1", "sha256")
+    ] == expected
+    assert len(expected[1].splitlines()) == 53
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "data",
+        "data.sha1",
+        "data.sha256",
+    ]
+
+
+def test_process_directory_empty_writes_nothing(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    root.mkdir()
+    process_directory(root, ["sha256"], workers=1, use_cache=False)
+    assert not (tmp_path / "data.sha256").exists()
+
+
+def test_process_directory_one_manifest_per_digest(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    _make_file(root / "a.txt", b"a")
+
+    process_directory(root, ["sha1", "sha256"], workers=1)
+
+    assert (tmp_path / "data.sha1").read_text() == (
+        f"{hashlib.sha1(b'a').hexdigest()}  a.txt\n"
+    )
+    assert (tmp_path / "data.sha256").read_text() == f"{_sha256(b'a')}  a.txt\n"
+
+
+def test_process_directory_serves_unchanged_files_from_cache(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    _make_file(root / "a.txt", b"a")
+    process_directory(root, ["sha256"], workers=1)
+
+    # Poison the cached value to prove the second run does not rehash.
+    cache = HashCache(cache_path_for(root))
+    cache.put((root / "a.txt").stat(), "sha256", "cached")
+    cache.close()
+
+    process_directory(root, ["sha256"], workers=1)
+    assert (tmp_path / "data.sha256").read_text() == "cached  a.txt\n"
+
+    process_directory(root, ["sha256"], workers=1, rebuild_cache=True)
+    assert (tmp_path / "data.sha256").read_text() == f"{_sha256(b'a')}  a.txt\n"
+
+
+# ---------------------------------------------------------------------------
+# parse_manifest / check_manifest
+# ---------------------------------------------------------------------------
+
+
+def test_parse_manifest_formats(tmp_path: Path) -> None:
+    manifest = tmp_path / "data.sha256"
+    manifest.write_text("AB  a.txt\ncd *b b.txt\n\ngarbage\n", encoding="utf-8")
+    assert list(parse_manifest(manifest)) == [("ab", "a.txt"), ("cd", "b b.txt")]
+
+
+def test_check_manifest_reports_status(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    root = tmp_path / "data"
+    _make_file(root / "ok.txt", b"ok")
+    _make_file(root / "bad.txt", b"bad")
+    _make_file(root / "new.txt", b"new")
+    manifest = tmp_path / "data.sha256"
+    manifest.write_text(
+        f"{_sha256(b'ok')}  ok.txt\n"
+        f"{_sha256(b'good')}  bad.txt\n"
+        f"{_sha256(b'gone')}  gone.txt\n",
+        encoding="utf-8",
+    )
+
+    assert check_manifest(manifest, root, "sha256", workers=1) is False
+    assert capsys.readouterr().out.splitlines() == [
+        "ok.txt: OK",
+        "bad.txt: FAILED",
+        "gone.txt: MISSING",
+        "new.txt: NOT IN MANIFEST",
+    ]
+
+
+def test_check_manifest_malformed_tree_entry(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    root = tmp_path / "data"
+    _make_file(root / "ok.txt", b"ok")
+    _make_file(root / "tree.bin", b"tree")
+    manifest = tmp_path / "data.sha256"
+    manifest.write_text(
+        f"tree-abc:{_sha256(b'tree')}  tree.bin\n{_sha256(b'ok')}  ok.txt\n",
+        encoding="utf-8",
+    )
+
+    assert check_manifest(manifest, root, "sha256", workers=1) is False
+    assert capsys.readouterr().out.splitlines() == [
+        "ok.txt: OK",
+        "tree.bin: FAILED",
+    ]
+
+
+def test_check_manifest_roundtrip(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    _make_file(root / "a.txt", b"a")
+    _make_file(root / "sub" / "b.txt", b"b")
+    process_directory(root, ["sha256"], workers=1, use_cache=False)
+
+    assert check_manifest(tmp_path / "data.sha256", root, "sha256", workers=1)
+
+
+# ---------------------------------------------------------------------------
+# parse_size / tree mode
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("512", 512),
+        ("4K", 4096),
+        ("64M", 64 * 1024 * 1024),
+        ("1.5k", 1536),
+        ("2GiB", 2 * 1024**3),
+    ],
+)
+def test_parse_size(text: str, expected: int) -> None:
+    assert parse_size(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "abc", "0", "-1M"])
+def test_parse_size_invalid(text: str) -> None:
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_size(text)
+
+
+def test_process_directory_tree_mode(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    big = b"x" * 2500 + b"y" * 100
+    _make_file(root / "big.img", big)
+    _make_file(root / "small.txt", b"small")
+
+    process_directory(
+        root, ["sha256"], workers=2, tree_threshold=1000, segment_size=1024
+    )
+
+    leaves = b"".join(
+        hashlib.sha256(big[i : i + 1024]).digest() for i in range(0, len(big), 1024)
+    )
+    assert (tmp_path / "data.sha256").read_text().splitlines() == [
+        f"tree-1024:{_sha256(leaves)}  big.img",
+        f"{_sha256(b'small')}  small.txt",
+    ]
+    assert check_manifest(tmp_path / "data.sha256", root, "sha256", workers=2)
+
+    _make_file(root / "big.img", big[:-1] + b"z")
+    assert not check_manifest(tmp_path / "data.sha256", root, "sha256", workers=2)
+
+
+# ---------------------------------------------------------------------------
+# edge_digest / find_duplicates
+# ---------------------------------------------------------------------------
+
+
+def test_edge_digest(tmp_path: Path) -> None:
+    small = _make_file(tmp_path / "small", b"abcdef")
+    assert edge_digest(small, "sha256", edge_size=3) == (_sha256(b"abcdef"), small)
+
+    big = _make_file(tmp_path / "big", b"abc" + b"-" * 100 + b"xyz")
+    assert edge_digest(big, "sha256", edge_size=3) == (_sha256(b"abcxyz"), big)
+
+
+def test_find_duplicates(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    same_edges_a = b"head" + b"A" * 100 + b"tail"
+    same_edges_b = b"head" + b"B" * 100 + b"tail"
+    _make_file(root / "a1.bin", same_edges_a)
+    _make_file(root / "sub" / "a2.bin", same_edges_a)
+    _make_file(root / "b.bin", same_edges_b)
+    _make_file(root / "s1.txt", b"short")
+    _make_file(root / "s2.txt", b"short")
+    _make_file(root / "other.txt", b"other")
+    _make_file(root / "empty1", b"")
+    _make_file(root / "empty2", b"")
+
+    duplicates = find_duplicates(root, "sha256", workers=2, edge_size=4)
+
+    assert duplicates == [
+        {
+            "size": len(same_edges_a),
+            "digest": _sha256(same_edges_a),
+            "files": ["a1.bin", "sub/a2.bin"],
+        },
+        {"size": 5, "digest": _sha256(b"short"), "files": ["s1.txt", "s2.txt"]},
+    ]
+
+
+def test_find_duplicates_skips_links(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    only = _make_file(root / "only.bin", b"single copy")
+    (root / "symlink.bin").symlink_to(only)
+    os.link(only, root / "hardlink.bin")
+    assert find_duplicates(root, "sha256", workers=1, edge_size=4) == []
+
+    _make_file(root / "copy.bin", b"single copy")
+    [group] = find_duplicates(root, "sha256", workers=1, edge_size=4)
+    assert len(group["files"]) == 2
+    assert "copy.bin" in group["files"]
+    assert "symlink.bin" not in group["files"]
+
+
+# ---------------------------------------------------------------------------
+# MerkleBuilder / compare_merkle
+# ---------------------------------------------------------------------------
+
+
+def test_merkle_builder_directory_hashes() -> None:
+    output = io.StringIO()
+    builder = MerkleBuilder("sha256", output)
+    for relpath in ["a/b.txt", "a/b/c.txt", "a/b/d/e.txt", "a/f.txt", "g.txt"]:
+        builder.add(relpath, relpath.upper())
+    root = builder.finish()
+
+    d = _sha256(b"A/B/D/E.TXT  e.txt\n")
+    b = _sha256(f"A/B/C.TXT  c.txt\n{d}  d/\n".encode())
+    a = _sha256(f"A/B.TXT  b.txt\n{b}  b/\nA/F.TXT  f.txt\n".encode())
+    assert root == _sha256(f"{a}  a/\nG.TXT  g.txt\n".encode())
+    assert output.getvalue().splitlines() == [
+        "A/B.TXT  a/b.txt",
+        "A/B/C.TXT  a/b/c.txt",
+        "A/B/D/E.TXT  a/b/d/e.txt",
+        f"{d}  a/b/d/",
+        f"{b}  a/b/",
+        "A/F.TXT  a/f.txt",
+        f"{a}  a/",
+        "G.TXT  g.txt",
+        f"{root}  ./",
+    ]
+
+
+def test_compare_merkle_live_trees(tmp_path: Path) -> None:
+    for side in ("left", "right"):
+        root = tmp_path / side / "data"
+        _make_file(root / "same" / "x.txt", b"x")
+        _make_file(root / "deep" / "sub" / "y.txt", b"y")
+        _make_file(root / "top.txt", b"top")
+    right = tmp_path / "right" / "data"
+    _make_file(right / "deep" / "sub" / "y.txt", b"changed")
+    _make_file(right / "new" / "z.txt", b"z")
+    (right / "top.txt").unlink()
+
+    merkle_files = []
+    for side in ("left", "right"):
+        root = tmp_path / side / "data"
+        process_directory(root, ["sha256"], workers=1, merkle=True)
+        merkle_files.append(merkle_path_for(root, "sha256"))
+
+    assert sorted(compare_merkle(*merkle_files)) == [
+        ("deep/sub/y.txt", "CHANGED"),
+        ("new/", "ADDED"),
+        ("top.txt", "REMOVED"),
+    ]
+    assert list(compare_merkle(merkle_files[0], merkle_files[0])) == []
+
+
+def test_process_directory_empty_merkle(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    root.mkdir()
+    assert process_directory(root, ["sha256"], workers=1, merkle=True) == 0
+    assert not (tmp_path / "data.sha256").exists()
+    empty = hashlib.sha256().hexdigest()
+    assert merkle_path_for(root, "sha256").read_text() == f"{empty}  ./\n"
+
+
+def test_compare_trees_ignores_stale_merkle(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    left, right = tmp_path / "a", tmp_path / "b"
+    _make_file(left / "f", b"f")
+    _make_file(right / "f", b"f")
+    # A Merkle manifest from an earlier run would claim both trees are equal
+    for side in (left, right):
+        process_directory(side, ["sha256"], workers=1, merkle=True)
+    stale = {path: path.read_text() for path in tmp_path.glob("*.merkle")}
+    (left / "f").unlink()
+
+    assert compare_trees(left, right, workers=1, use_cache=False) == 1
+    assert capsys.readouterr().out == "f: ADDED\n"
+    # Sidecar manifests next to the trees are left untouched
+    assert {path: path.read_text() for path in tmp_path.glob("*.merkle")} == stale
+
+    with pytest.raises(ValueError):
+        compare_trees(left, tmp_path / "missing", workers=1, use_cache=False)
+
+
+def test_compare_trees_writes_nothing_next_to_the_trees(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Read-only or foreign mounts can be compared, even with spilled runs."""
+    left, right = tmp_path / "a", tmp_path / "b"
+    for i in range(5):
+        _make_file(left / f"{i}", b"l")
+        _make_file(right / f"{i}", b"r")
+    parents = []
+    temporary_directory = tempfile.TemporaryDirectory
+
+    def recording(*args, **kwargs):
+        parents.append(Path(kwargs.get("dir") or tempfile.gettempdir()))
+        return temporary_directory(*args, **kwargs)
+
+    monkeypatch.setattr(shasum_list.tempfile, "TemporaryDirectory", recording)
+    compare_trees(left, right, workers=1, use_cache=False, batch_size=2)
+    assert len(parents) == 3
+    assert tmp_path not in parents
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a", "b"]
+
+
+# ---------------------------------------------------------------------------
+# ProgressMonitor / --stats-json
+# ---------------------------------------------------------------------------
+
+
+def test_progress_monitor_counters(tmp_path: Path) -> None:
+    monitor = ProgressMonitor(slowest=2)
+    files = [
+        (tmp_path / str(i), os.stat_result((0,) * 6 + (i,) + (0,) * 3))
+        for i in range(1, 4)
+    ]
+    walked = list(monitor.iter_walk(files))
+    assert walked == files
+    assert (monitor.files_seen, monitor.bytes_seen, monitor.walk_finished) == (
+        3,
+        6,
+        True,
+    )
+
+    monitor.record(tmp_path / "1", 1, 0.5, "w1")
+    monitor.record(tmp_path / "2", 2, 0.1, "w1")
+    monitor.record(tmp_path / "4", 4, 0.9, "w2")
+    monitor.record_cached(3)
+
+    stats = monitor.stats()
+    assert (stats["files"], stats["files_cached"]) == (4, 1)
+    assert (stats["bytes"], stats["bytes_hashed"]) == (10, 7)
+    assert [f["seconds"] for f in stats["slowest_files"]] == [0.9, 0.5]
+    assert set(stats["workers"]) == {"w1", "w2"}
+    assert monitor.status_line().startswith("4/3 files, ")
+
+
+def test_process_directory_stats_json(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    _make_file(root / "a.txt", b"a")
+    _make_file(root / "b.txt", b"bb")
+    stats_file = tmp_path / "stats.json"
+
+    process_directory(root, ["sha256"], workers=1, stats_json=stats_file)
+    stats = json.loads(stats_file.read_text())
+    assert (stats["files"], stats["bytes"]) == (2, 3)
+    assert {"walk", "hash", "sort", "write"} <= set(stats["phases"])
+    assert len(stats["slowest_files"]) == 2
+    assert stats["cache"] == {"hits": 0, "misses": 2}
+
+
+def test_process_directory_progress_with_processes(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    root = tmp_path / "data"
+    for i in range(8):
+        _make_file(root / f"{i}.txt", bytes(i))
+    start_methods = []
+    executor_class = shasum_list.ProcessPoolExecutor
+
+    def executor(*args, **kwargs):
+        start_methods.append(kwargs["mp_context"].get_start_method())
+        return executor_class(*args, **kwargs)
+
+    monkeypatch.setattr(shasum_list, "ProcessPoolExecutor", executor)
+    process_directory(
+        root, ["sha256"], workers=2, use_cache=False, progress_interval=0.01
+    )
+    # The status thread is already running when the workers start
+    assert start_methods and "fork" not in start_methods
+    assert "8/8 files" in capsys.readouterr().err
+    assert len((tmp_path / "data.sha256").read_text().splitlines()) == 8
+
+
+# ---------------------------------------------------------------------------
+# scandir_walk / iter_walk_threaded
+# ---------------------------------------------------------------------------
+
+
+def _make_walk_tree(root: Path) -> None:
+    _make_file(root / "keep.txt", b"keep")
+    _make_file(root / "debug.log", b"log")
+    _make_file(root / "build" / "out.bin", b"out")
+    _make_file(root / "src" / "main.py", b"main")
+    _make_file(root / "src" / "cache.tmp", b"tmp")
+    _make_file(root / "src" / "deep" / "x.tmp", b"tmp")
+    _make_file(root / ".git" / "HEAD", b"ref")
+    _make_file(root / ".gitignore", b"*.log\nbuild/\n")
+    _make_file(root / "src" / ".gitignore", b"*.tmp\n")
+    (root / "link.txt").symlink_to(root / "keep.txt")
+    (root / "linkdir").symlink_to(root / "src")
+
+
+@pytest.mark.parametrize("respect_gitignore", [False, True])
+def test_scandir_walk_matches_gitignore_walker(
+    tmp_path: Path, respect_gitignore: bool
+) -> None:
+    root = tmp_path / "data"
+    _make_walk_tree(root)
+
+    walked = [
+        (path, st.st_size)
+        for batch in scandir_walk(root, respect_gitignore)
+        for path, st in batch
+    ]
+    expected = iter_files_with_respect_gitignore(root, respect_gitignore)
+    assert sorted(walked) == sorted((path, path.stat().st_size) for path in expected)
+
+
+def test_iter_walk_threaded_yields_all_files(tmp_path: Path) -> None:
+    root = tmp_path / "data"
+    for i in range(30):
+        _make_file(root / f"d{i % 7}" / f"{i}.txt", b"x")
+
+    walked = sorted(path for path, _ in iter_walk_threaded(root, max_batches=1))
+    assert walked == sorted(root.rglob("*.txt"))
+
+
+def test_iter_walk_threaded_early_close(tmp_path: Path) -> None:
+    """Abandoning the generator must stop the walker thread."""
+    root = tmp_path / "data"
+    for i in range(10):
+        _make_file(root / f"d{i}" / "f.txt", b"x")
+
+    walk = iter_walk_threaded(root, max_batches=1)
+    next(walk)
+    walk.close()